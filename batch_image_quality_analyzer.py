@@ -8,15 +8,74 @@ import os
 import asyncio
 import aiohttp
 import traceback
-import base64
-import io
+from typing import Dict, List, Tuple
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
 
 # 导入共享工具模块
 from vlm_common import (
-    image_to_base64, get_image_type, extract_xml_result, 
+    get_image_type, extract_xml_result, extract_xml_results,
+    build_base64_body, build_multi_base64_body, build_multi_image_prompt,
+    dumps_json, loads_json,
     USER_PROMPT, Fore, Style, resize_image_if_needed
 )
 
+# 请求体模板中图片数据的占位符，序列化后替换为实际Base64内容
+BASE64_PLACEHOLDER = "__BASE64_IMAGE__"
+# 请求体模板中图片类型的占位符
+IMAGE_TYPE_PLACEHOLDER = "__IMAGE_TYPE__"
+
+# 两种HTTP客户端的超时/连接异常统一处理（httpx的超时异常是HTTPError子类，需先捕获）
+if HTTPX_AVAILABLE:
+    TIMEOUT_ERRORS = (asyncio.TimeoutError, httpx.TimeoutException)
+    CONNECTION_ERRORS = (aiohttp.ClientError, httpx.HTTPError)
+else:
+    TIMEOUT_ERRORS = (asyncio.TimeoutError,)
+    CONNECTION_ERRORS = (aiohttp.ClientError,)
+
+
+def split_api_usage(usage: Dict, count: int) -> List[Dict]:
+    """
+    将一次多图请求的token用量均摊到每张图片，整除余数计入第一张
+    
+    Args:
+        usage: API返回的usage字典
+        count: 图片数量
+        
+    Returns:
+        List[Dict]: 每张图片的usage字典，各项之和等于原始用量
+    """
+    shares = [{} for _ in range(count)]
+    for key, value in usage.items():
+        if isinstance(value, dict):
+            for share, part in zip(shares, split_api_usage(value, count)):
+                share[key] = part
+        elif isinstance(value, int) and not isinstance(value, bool):
+            base, remainder = divmod(value, count)
+            for index, share in enumerate(shares):
+                share[key] = base + (remainder if index == 0 else 0)
+        else:
+            for share in shares:
+                share[key] = value
+    return shares
+
+
+async def _iter_body(body):
+    """
+    以单个内存视图的形式产出请求体，供httpx零复制发送
+    
+    Args:
+        body: bytes或bytearray请求体
+        
+    Yields:
+        memoryview: 请求体视图
+    """
+    yield memoryview(body)
+
 
 class BatchImageQualityAnalyzer:
     """
@@ -29,13 +88,14 @@ class BatchImageQualityAnalyzer:
     - 支持图片压缩重试机制
     """
     
-    def __init__(self, model_name=None, concurrent_limit=50000):
+    def __init__(self, model_name=None, concurrent_limit=50000, executor=None):
         """
         初始化批量推理API客户端
         
         Args:
             model_name: 模型名称，默认从环境变量获取
             concurrent_limit: 并发限制（仅用于兼容性，实际不使用）
+            executor: 执行图片压缩等CPU密集型工作的进程池，None时使用线程
         """
         self.api_endpoint = os.getenv('VLM_BATCH_API_ENDPOINT')
         self.api_token = os.getenv('VLM_API_TOKEN')
@@ -49,12 +109,20 @@ class BatchImageQualityAnalyzer:
         # 移除semaphore限制，改用任务池管理
         self.semaphore = None
         self.concurrent_limit = concurrent_limit  # 仅用于记录
+        self.executor = executor
         
         # 构建请求头，包含认证信息
         self.headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_token}"
         }
+        
+        # 请求结构固定，启动时序列化一次模板，每个请求只需拼接图片类型和Base64数据
+        template = dumps_json(self._build_payload(BASE64_PLACEHOLDER, IMAGE_TYPE_PLACEHOLDER))
+        head, rest = template.split(IMAGE_TYPE_PLACEHOLDER.encode('ascii'), 1)
+        middle, suffix = rest.split(BASE64_PLACEHOLDER.encode('ascii'), 1)
+        self._request_template_parts = (head, middle, suffix)
+        self._batch_templates = {}
     
     def _build_payload(self, base64_image, img_type):
         """
@@ -91,77 +159,199 @@ class BatchImageQualityAnalyzer:
             "temperature": self.temperature
         }
     
-    async def _send_request(self, session, payload):
+    def _build_batch_payload(self, base64_images, img_types):
+        """
+        构建一次请求评估多张图片的API请求负载，多张图片共享同一提示词
+        
+        Args:
+            base64_images: Base64编码的图片数据列表
+            img_types: 对应的图片类型列表
+            
+        Returns:
+            Dict: API请求负载
+        """
+        content = [{
+            "type": "text",
+            "text": build_multi_image_prompt(len(base64_images))
+        }]
+        for base64_image, img_type in zip(base64_images, img_types):
+            content.append({
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:image/{img_type};base64,{base64_image}",
+                    "detail": "low"
+                }
+            })
+        
+        return {
+            "model": self.model_name,
+            "messages": [{"role": "user", "content": content}],
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature
+        }
+    
+    def _batch_request_segments(self, img_types) -> List[bytes]:
         """
-        发送API请求并返回响应
+        用占位符序列化多图请求模板，返回各图片Base64数据之间的字节片段
         
         Args:
-            session: aiohttp会话对象
-            payload: 请求负载
+            img_types: 各图片的类型列表
             
         Returns:
-            aiohttp.ClientResponse: HTTP响应对象
+            List[bytes]: 比图片数量多一个的字节片段
         """
-        return await session.post(
+        key = tuple(img_types)
+        segments = self._batch_templates.get(key)
+        if segments is not None:
+            return segments
+        
+        placeholders = [f"{BASE64_PLACEHOLDER}{index}__" for index in range(len(img_types))]
+        payload = self._build_batch_payload(placeholders, img_types)
+        template = dumps_json(payload)
+        
+        segments = []
+        for placeholder in placeholders:
+            head, template = template.split(placeholder.encode('ascii'), 1)
+            segments.append(head)
+        segments.append(template)
+        # 图片类型组合有限，按组合缓存模板
+        self._batch_templates[key] = segments
+        return segments
+    
+    def _build_batch_request_body(self, image_paths, img_types) -> bytearray:
+        """
+        构建多图请求体，各图片Base64数据依次流式写入各自的占位符位置
+        
+        Args:
+            image_paths: 图片文件路径列表
+            img_types: 对应的图片类型列表
+            
+        Returns:
+            bytearray: JSON请求体
+        """
+        return build_multi_base64_body(self._batch_request_segments(img_types), image_paths)
+    
+    def _request_template(self, img_type) -> Tuple[bytes, bytes]:
+        """
+        由启动时预序列化的模板拼出单图请求体的固定部分
+        
+        Args:
+            img_type: 图片类型
+            
+        Returns:
+            Tuple[bytes, bytes]: 图片Base64数据前、后的字节片段
+        """
+        head, middle, suffix = self._request_template_parts
+        return head + img_type.encode('ascii') + middle, suffix
+    
+    def _build_request_body(self, image_source, img_type) -> bytearray:
+        """
+        构建已序列化的API请求体，图片Base64数据直接流式写入
+        
+        先用占位符序列化 _build_payload 的结构，再把图片编码写入占位符位置，
+        避免Base64字符串和JSON序列化各产生一份完整拷贝。
+        
+        Args:
+            image_source: 图片文件路径，或图片二进制数据
+            img_type: 图片类型
+            
+        Returns:
+            bytearray: JSON请求体
+        """
+        prefix, suffix = self._request_template(img_type)
+        return build_base64_body(prefix, image_source, suffix)
+    
+    async def _run_blocking(self, func, *args):
+        """
+        在进程池（未配置时为线程）中执行CPU密集型函数，避免阻塞事件循环
+        
+        Args:
+            func: 模块级可序列化函数
+            *args: 函数参数
+            
+        Returns:
+            函数返回值
+        """
+        if self.executor is None:
+            return await asyncio.to_thread(func, *args)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+    
+    async def _send_request(self, session, body) -> Tuple[int, bytes]:
+        """
+        发送API请求并读取完整响应
+        
+        同时支持 httpx.AsyncClient（HTTP/2多路复用）和 aiohttp.ClientSession，
+        读取完响应体后立即释放连接。
+        
+        Args:
+            session: httpx.AsyncClient 或 aiohttp.ClientSession
+            body: 已序列化的JSON请求体
+            
+        Returns:
+            Tuple[int, bytes]: (HTTP状态码, 响应体)
+        """
+        if HTTPX_AVAILABLE and isinstance(session, httpx.AsyncClient):
+            # httpx的定长content只接受bytes，直接以内存视图流式发送避免整体复制，
+            # 显式给出Content-Length以免退化为分块传输
+            headers = dict(self.headers)
+            headers['Content-Length'] = str(len(body))
+            response = await session.post(
+                self.api_endpoint,
+                headers=headers,
+                content=_iter_body(body)
+            )
+            return response.status_code, response.content
+
+        async with session.post(
             self.api_endpoint,
             headers=self.headers,
-            json=payload,
+            data=body,
             timeout=aiohttp.ClientTimeout(total=self.timeout)
-        )
+        ) as response:
+            return response.status, await response.read()
     
-    async def analyze_image(self, session, image_path):
+    async def analyze_image(self, session, image_path, upload_path=None):
         """
         通过VLM API异步分析单张图片
         移除semaphore控制，直接执行分析
         
         Args:
-            session: aiohttp会话对象
+            session: httpx.AsyncClient 或 aiohttp.ClientSession
             image_path: 图片文件路径
+            upload_path: 实际上传的图片文件（如预压缩的缓存文件），默认为image_path
             
         Returns:
             Dict: 分析结果，格式与在线推理保持一致
         """
         # 移除 async with self.semaphore 包装，直接执行
         try:
-            # 异步读取和编码图片
-            base64_image = await image_to_base64(image_path)
-            img_type = get_image_type(image_path)
-            payload = self._build_payload(base64_image, img_type)
+            # 在线程中读取图片并流式编码为请求体：Base64编码是内存带宽型操作，
+            # 放到进程池反而要把数MB的请求体序列化回主进程
+            upload_path = upload_path or image_path
+            img_type = get_image_type(upload_path)
+            prefix, suffix = self._request_template(img_type)
+            request_body = await asyncio.to_thread(build_base64_body, prefix, upload_path, suffix)
             
             # 首次发送异步请求
-            response = await self._send_request(session, payload)
-            
-            # 如果遇到400错误，尝试压缩图片后重试
-            if response.status == 400:
-                compressed_data = resize_image_if_needed(image_path)
-                if compressed_data:
-                    base64_image = base64.b64encode(compressed_data).decode('utf-8')
-                    # 图片类型可能因压缩而改变，这里简单处理
-                    img_type = get_image_type(io.BytesIO(compressed_data))
-                    payload = self._build_payload(base64_image, img_type)
+            status, body = await self._send_request(session, request_body)
+            
+            # 如果遇到400错误，尝试压缩图片后重试（已预压缩的图片不会再次压缩）
+            if status == 400:
+                compressed = await self._run_blocking(resize_image_if_needed, upload_path)
+                if compressed:
+                    # 压缩后的图片类型由压缩函数直接给出，无需再次解析
+                    compressed_data, img_type = compressed
+                    request_body = await asyncio.to_thread(self._build_request_body, compressed_data, img_type)
                     
                     print(f"{Fore.CYAN}正在使用压缩后的图片重试...{Style.RESET_ALL}")
-                    response = await self._send_request(session, payload)  # 重试
+                    status, body = await self._send_request(session, request_body)  # 重试
             
             # 处理非200响应
-            if response.status != 200:
-                error_text = await response.text()
-                error_msg = f"API错误 ({response.status})"
-                
-                try:
-                    error_data = await response.json()
-                    error_msg += f": {error_data.get('message', '未知错误')}"
-                except:
-                    error_msg += f": {error_text[:200]}"
-                
-                return {
-                    "error": "API_ERROR",
-                    "message": error_msg,
-                    "status_code": response.status
-                }
+            if status != 200:
+                return self._build_api_error(status, body)
             
             # 解析响应
-            response_data = await response.json()
+            response_data = loads_json(body)
             
             if "choices" not in response_data or len(response_data["choices"]) == 0:
                 return {
@@ -181,12 +371,12 @@ class BatchImageQualityAnalyzer:
             
             return result
                 
-        except asyncio.TimeoutError:
+        except TIMEOUT_ERRORS:
             return {
                 "error": "TIMEOUT_ERROR",
                 "message": f"请求超时 (超过 {self.timeout} 秒)"
             }
-        except aiohttp.ClientError as e:
+        except CONNECTION_ERRORS as e:
             return {
                 "error": "CONNECTION_ERROR",
                 "message": f"网络连接失败: {str(e)}"
@@ -198,6 +388,107 @@ class BatchImageQualityAnalyzer:
                 "traceback": traceback.format_exc()
             }
     
+    async def analyze_image_batch(self, session, image_paths, upload_paths=None):
+        """
+        一次API请求分析多张图片，减少请求次数和TLS/HTTP开销
+        
+        单张图片时等同于 analyze_image；多图请求返回400时逐张重新分析，
+        以使用单图的压缩重试逻辑。
+        
+        Args:
+            session: httpx.AsyncClient 或 aiohttp.ClientSession
+            image_paths: 图片文件路径列表
+            upload_paths: 与image_paths对应的实际上传文件列表，默认为image_paths
+            
+        Returns:
+            List[Dict]: 与image_paths顺序一致的分析结果
+        """
+        upload_paths = upload_paths or image_paths
+        if len(image_paths) == 1:
+            return [await self.analyze_image(session, image_paths[0], upload_paths[0])]
+        
+        try:
+            img_types = [get_image_type(path) for path in upload_paths]
+            segments = self._batch_request_segments(img_types)
+            request_body = await asyncio.to_thread(build_multi_base64_body, segments, upload_paths)
+            status, body = await self._send_request(session, request_body)
+            
+            if status == 400:
+                return list(await asyncio.gather(
+                    *(self.analyze_image(session, path, upload_path)
+                      for path, upload_path in zip(image_paths, upload_paths))
+                ))
+            
+            if status != 200:
+                error = self._build_api_error(status, body)
+                return [dict(error) for _ in image_paths]
+            
+            response_data = loads_json(body)
+            
+            if "choices" not in response_data or len(response_data["choices"]) == 0:
+                return [{"error": "NO_RESPONSE", "message": "API返回了空响应"} for _ in image_paths]
+            
+            content = response_data["choices"][0]["message"]["content"]
+            results = extract_xml_results(content, len(image_paths))
+            
+            # 添加元数据，token用量按图片均摊；
+            # 整个请求只由第一张成功的图片计为一次请求，其余图片标记为共享请求
+            usages = split_api_usage(response_data.get("usage", {}), len(image_paths))
+            request_counted = False
+            for result, usage in zip(results, usages):
+                if "error" not in result:
+                    if request_counted:
+                        usage["shared_request"] = True
+                    request_counted = True
+                    result["api_usage"] = usage
+                    result["api_provider"] = "volces"
+            
+            return results
+        
+        except TIMEOUT_ERRORS:
+            error = {
+                "error": "TIMEOUT_ERROR",
+                "message": f"请求超时 (超过 {self.timeout} 秒)"
+            }
+        except CONNECTION_ERRORS as e:
+            error = {
+                "error": "CONNECTION_ERROR",
+                "message": f"网络连接失败: {str(e)}"
+            }
+        except Exception as e:
+            error = {
+                "error": "EXCEPTION",
+                "message": str(e),
+                "traceback": traceback.format_exc()
+            }
+        return [dict(error) for _ in image_paths]
+    
+    def _build_api_error(self, status, body):
+        """
+        根据非200响应构建错误结果
+        
+        Args:
+            status: HTTP状态码
+            body: 响应体
+            
+        Returns:
+            Dict: API_ERROR错误字典
+        """
+        error_text = body.decode('utf-8', errors='replace')
+        error_msg = f"API错误 ({status})"
+        
+        try:
+            error_data = loads_json(body)
+            error_msg += f": {error_data.get('message', '未知错误')}"
+        except:
+            error_msg += f": {error_text[:200]}"
+        
+        return {
+            "error": "API_ERROR",
+            "message": error_msg,
+            "status_code": status
+        }
+    
     def get_config_info(self):
         """
         获取配置信息
@@ -8,56 +8,103 @@ import os
 import json
 import asyncio
 import aiohttp
-import aiofiles
 import time
 import traceback
-from typing import List, Dict, Any
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import repeat
+from typing import List, Dict, Any, Callable, Awaitable
 from tqdm.asyncio import tqdm
 
 # 导入自定义模块
-from batch_task_pool import BatchTaskPool
-from batch_image_quality_analyzer import BatchImageQualityAnalyzer
+from batch_image_quality_analyzer import BatchImageQualityAnalyzer, HTTPX_AVAILABLE
+from batch_task_pool import AdaptiveLimiter
 from vlm_common import (
     validate_batch_config, find_images, CostCalculator,
-    quick_validate_image, Fore, Style
+    find_existing_files, quick_validate_image, group_duplicate_images, compute_image_digests,
+    cache_resized_image, RESIZE_CACHE_DIR,
+    dumps_json, loads_json, Fore, Style
 )
 
 
-async def process_single_image(analyzer, session, img_path, force_rerun, debug_mode, cost_calculator):
+async def process_image_group(analyzer, session, img_paths, force_rerun, debug_mode, cost_calculator, duplicate_groups=None,
+                              results_writer=None, upload_paths=None, defer_usage=False):
     """
-    处理单个图片的异步函数
-    保持与在线推理相同的处理逻辑
+    处理一组图片：组内所有图片合并为一次API请求
     
     Args:
         analyzer: BatchImageQualityAnalyzer实例
-        session: aiohttp会话对象
-        img_path: 图片文件路径
+        session: HTTP客户端（httpx.AsyncClient 或 aiohttp.ClientSession）
+        img_paths: 图片文件路径列表
         force_rerun: 是否强制重新处理
         debug_mode: 是否启用调试模式
         cost_calculator: 成本计算器实例
+        duplicate_groups: 代表图片到其内容相同副本列表的映射
+        results_writer: 后台结果写入器，None时直接写入同名JSON文件
+        upload_paths: 图片路径到预压缩缓存文件的映射，未包含的图片直接上传原图
+        defer_usage: 为True时不在此统计成功请求的token用量，由调用方汇总后批量累加
         
     Returns:
-        Dict: 处理结果
+        List[Dict]: 每张图片的处理结果
     """
-    json_path = os.path.splitext(img_path)[0] + '.json'
+    duplicate_groups = duplicate_groups or {}
+    results = []
+    pending_paths = []
     
     # 检查是否需要重新处理
-    if os.path.exists(json_path) and not force_rerun:
-        return {"status": "skipped", "path": img_path}
+    for img_path in img_paths:
+        if result_saved(img_path, results_writer) and not force_rerun:
+            results.append({"status": "skipped", "path": img_path})
+        else:
+            pending_paths.append(img_path)
+    
+    if not pending_paths:
+        return results
     
     # 分析图片
-    result = await analyzer.analyze_image(session, img_path)
+    upload_paths = upload_paths or {}
+    analysis_results = await analyzer.analyze_image_batch(
+        session, pending_paths, [upload_paths.get(path, path) for path in pending_paths]
+    )
+    handled = await asyncio.gather(*(
+        handle_analysis_result(img_path, result, cost_calculator, duplicate_groups.get(img_path), results_writer,
+                               defer_usage=defer_usage)
+        for img_path, result in zip(pending_paths, analysis_results)
+    ))
+    results.extend(handled)
+    return results
+
+
+async def handle_analysis_result(img_path, result, cost_calculator, duplicate_paths=None, results_writer=None,
+                                 defer_usage=False):
+    """
+    统计成本并保存单张图片的分析结果
     
+    Args:
+        img_path: 图片文件路径
+        result: 分析结果字典
+        cost_calculator: 成本计算器实例
+        duplicate_paths: 与img_path内容相同的其他图片，复用同一分析结果
+        results_writer: 后台结果写入器，None时直接写入同名JSON文件
+        defer_usage: 为True时不在此统计token用量，由调用方从结果中汇总后批量累加
+        
+    Returns:
+        Dict: 处理结果
+    """
     if result and "error" not in result:
         try:
             # 统计API使用成本
-            if "api_usage" in result:
+            if "api_usage" in result and not defer_usage:
                 cost_calculator.add_usage(result["api_usage"])
             
-            # 异步保存结果
-            os.makedirs(os.path.dirname(json_path), exist_ok=True)
-            async with aiofiles.open(json_path, 'w', encoding='utf-8') as f:
-                await f.write(json.dumps(result, ensure_ascii=False, indent=2))
+            # 保存结果，内容相同的图片直接复用同一结果
+            target_paths = [img_path] + list(duplicate_paths or [])
+            if results_writer is not None:
+                await results_writer.write(target_paths, result)
+            else:
+                json_paths = [os.path.splitext(path)[0] + '.json' for path in target_paths]
+                await asyncio.to_thread(write_result_files, json_paths, dumps_json(result, indent=True))
             return {"status": "success", "path": img_path, "result": result}
         except Exception as e:
             return {
@@ -76,60 +123,414 @@ async def process_single_image(analyzer, session, img_path, force_rerun, debug_m
         }
 
 
-async def collect_completed_tasks(pending_tasks: Dict[str, Dict], results: List[Dict]):
+def create_http_session(concurrent_limit: int):
     """
-    收集已完成的任务
+    创建批量推理使用的HTTP客户端
+    
+    优先使用 httpx.AsyncClient 开启HTTP/2，大量并发请求在少数TLS连接上多路复用；
+    httpx/h2 不可用或设置 VLM_HTTP2=false 时回退到 aiohttp.ClientSession。
     
     Args:
-        pending_tasks: 待处理任务字典
-        results: 结果列表
+        concurrent_limit: 并发限制数量，未设置 VLM_TCP_LIMIT 时最大连接数取其与2048的较小值
+        
+    Returns:
+        httpx.AsyncClient 或 aiohttp.ClientSession
     """
-    completed_task_ids = []
-    for task_id, task_info in pending_tasks.items():
-        if task_info["task"].done():
-            try:
-                result = await task_info["task"]
-                results.append(result)
-            except Exception as e:
-                results.append({
-                    "status": "collection_error",
-                    "path": task_info["data"]["path"],
-                    "error": str(e)
-                })
-            completed_task_ids.append(task_id)
+    # 无限制的连接池在大量并发时会耗尽套接字，按服务端承载能力设置上限
+    tcp_limit = int(os.getenv('VLM_TCP_LIMIT', str(min(concurrent_limit, 2048))))
     
-    # 移除已完成的任务
-    for task_id in completed_task_ids:
-        pending_tasks.pop(task_id)
+    if HTTPX_AVAILABLE and os.getenv('VLM_HTTP2', 'true').lower() == 'true':
+        import httpx
+        try:
+            return httpx.AsyncClient(
+                http2=True,
+                timeout=httpx.Timeout(72*3600, connect=30),
+                limits=httpx.Limits(max_connections=tcp_limit, max_keepalive_connections=min(tcp_limit, 1024))
+            )
+        except ImportError:
+            # 未安装h2时httpx无法启用HTTP/2
+            print(f"{Fore.YELLOW}HTTP/2 unavailable (missing h2 package), falling back to aiohttp{Style.RESET_ALL}")
+
+    # 配置连接池
+    connector = aiohttp.TCPConnector(
+        limit=tcp_limit,
+        limit_per_host=tcp_limit,
+        use_dns_cache=True,
+        ttl_dns_cache=3600,  # DNS结果缓存1小时
+        keepalive_timeout=3600,  # 1小时保活
+        enable_cleanup_closed=True
+    )
+    # 连接池有上限后等待空闲连接不应计入超时，只限制建立连接本身的耗时
+    timeout = aiohttp.ClientTimeout(total=72*3600, sock_connect=30, sock_read=3600)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
 
+# 进程内共享的HTTP客户端及其所属事件循环
+_http_session = None
+_http_session_loop = None
 
-async def wait_all_tasks(pending_tasks: Dict[str, Dict], results: List[Dict]):
+
+async def get_http_session(concurrent_limit: int):
     """
-    等待所有剩余任务完成
+    获取进程内共享的HTTP客户端，首次调用时创建
+    
+    同一事件循环内多次调用 process_images_batch 复用同一连接池，避免重复DNS解析和TLS握手。
+    客户端绑定创建它的事件循环，事件循环变化或客户端已关闭时重新创建。
     
     Args:
-        pending_tasks: 待处理任务字典
-        results: 结果列表
+        concurrent_limit: 并发限制数量，仅在创建客户端时使用
+        
+    Returns:
+        httpx.AsyncClient 或 aiohttp.ClientSession
     """
-    if not pending_tasks:
+    global _http_session, _http_session_loop
+    loop = asyncio.get_running_loop()
+    if _http_session is None or _http_session_loop is not loop or _session_closed(_http_session):
+        _http_session = create_http_session(concurrent_limit)
+        _http_session_loop = loop
+    return _http_session
+
+
+async def close_http_session():
+    """关闭共享的HTTP客户端，应在事件循环退出前调用"""
+    global _http_session, _http_session_loop
+    session, _http_session, _http_session_loop = _http_session, None, None
+    if session is None or _session_closed(session):
         return
+    if isinstance(session, aiohttp.ClientSession):
+        await session.close()
+    else:
+        await session.aclose()
+
+
+def _session_closed(session) -> bool:
+    """判断 httpx.AsyncClient 或 aiohttp.ClientSession 是否已关闭"""
+    if isinstance(session, aiohttp.ClientSession):
+        return session.closed
+    return session.is_closed
+
+
+def write_result_files(json_paths: List[str], content: bytes):
+    """
+    同步写入一组内容相同的结果JSON文件
     
-    remaining_tasks = [task_info["task"] for task_info in pending_tasks.values()]
-    completed_results = await asyncio.gather(*remaining_tasks, return_exceptions=True)
+    Args:
+        json_paths: 结果文件路径列表（与图片位于同一目录，目录必然存在）
+        content: 已序列化的UTF-8 JSON字节
+    """
+    for json_path in json_paths:
+        with open(json_path, 'wb') as f:
+            f.write(content)
+
+
+class ResultWriter:
+    """
+    后台结果写入器：分析结果放入队列，由单个写入任务批量落盘
     
-    for i, result in enumerate(completed_results):
-        if isinstance(result, Exception):
-            task_data = list(pending_tasks.values())[i]["data"]
-            results.append({
-                "status": "gather_error",
-                "path": task_data["path"],
-                "error": str(result)
-            })
+    每批结果只占用一次线程池调用，避免大量并发任务各自通过aiofiles争抢默认线程池。
+    配置results_file时所有结果追加写入该JSONL文件，每行格式为
+    {"path": 图片绝对路径, "result": 分析结果}，同一图片出现多次时以最后一行为准；
+    否则每张图片保存一个同名JSON文件。
+    """
+    
+    def __init__(self, results_file: str = None, root_dir: str = None):
+        """
+        初始化结果写入器
+        
+        Args:
+            results_file: JSONL结果文件路径，None时每张图片保存一个JSON文件
+            root_dir: 图片根目录，保存JSON文件时在此目录下一次性收集已有的JSON文件
+        """
+        self.results_file = results_file
+        # 启动时扫描一次JSONL文件或目录建立已处理集合，跳过检查不再逐个stat结果文件
+        self.processed_paths = load_processed_paths(results_file) if results_file else None
+        self.existing_json_paths = None
+        if not results_file and root_dir:
+            self.existing_json_paths = find_existing_files(root_dir, '.json')
+        self._file = None
+        self._queue = None
+        self._task = None
+    
+    async def start(self):
+        """打开结果文件并启动写入任务"""
+        if self.results_file:
+            self._file = open(self.results_file, 'ab', buffering=1 << 20)
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+    
+    async def write(self, img_paths: List[str], result: Dict[str, Any]):
+        """
+        保存一组图片共享的分析结果，写入完成后返回
+        
+        Args:
+            img_paths: 图片文件路径列表
+            result: 分析结果字典
+            
+        Raises:
+            OSError: 写入失败时抛出
+        """
+        if self._file is not None:
+            abs_paths = [os.path.abspath(path) for path in img_paths]
+            item = b''.join(dumps_json({"path": path, "result": result}) + b'\n' for path in abs_paths)
         else:
-            results.append(result)
+            json_paths = [os.path.splitext(path)[0] + '.json' for path in img_paths]
+            item = (json_paths, dumps_json(result, indent=True))
+        
+        done = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, done))
+        await done
+        
+        if self._file is not None:
+            self.processed_paths.update(abs_paths)
+        elif self.existing_json_paths is not None:
+            self.existing_json_paths.update(json_paths)
+    
+    def _write_batch(self, items: list):
+        """
+        在线程中同步写入一批结果
+        
+        JSONL结果每批刷新一次到操作系统：调用方的写入在刷新后才算完成，
+        崩溃不会丢失已报告保存的结果，磁盘写满等错误也能交给本批的调用方
+        """
+        if self._file is not None:
+            self._file.write(b''.join(items))
+            self._file.flush()
+        else:
+            for json_paths, content in items:
+                write_result_files(json_paths, content)
+    
+    async def _run(self):
+        """写入任务：取出队列中当前积压的全部结果一次写入，收到None时退出"""
+        while True:
+            batch = [await self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            
+            stop = None in batch
+            batch = [entry for entry in batch if entry is not None]
+            if batch:
+                try:
+                    await asyncio.to_thread(self._write_batch, [item for item, _ in batch])
+                except Exception as e:
+                    for _, done in batch:
+                        if not done.done():
+                            done.set_exception(e)
+                else:
+                    for _, done in batch:
+                        if not done.done():
+                            done.set_result(None)
+            if stop:
+                return
+    
+    async def close(self):
+        """等待队列中的结果写完并关闭结果文件"""
+        if self._task is not None:
+            await self._queue.put(None)
+            await self._task
+            self._task = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def load_processed_paths(results_file: str) -> set:
+    """
+    读取JSONL结果文件中已有结果的图片路径
+    
+    Args:
+        results_file: JSONL结果文件路径
+        
+    Returns:
+        set: 图片绝对路径集合；文件不存在时为空集合
+    """
+    processed_paths = set()
+    if not os.path.exists(results_file):
+        return processed_paths
+    
+    with open(results_file, 'rb') as f:
+        for line in f:
+            try:
+                processed_paths.add(loads_json(line)["path"])
+            except (ValueError, KeyError, TypeError):
+                # 中断时可能留下不完整的最后一行
+                continue
+    return processed_paths
+
+
+def result_saved(img_path: str, results_writer=None) -> bool:
+    """
+    检查图片是否已有保存的分析结果
+    
+    Args:
+        img_path: 图片文件路径
+        results_writer: 结果写入器，None时检查同名JSON文件是否存在
+        
+    Returns:
+        bool: 是否已有结果
+    """
+    json_path = os.path.splitext(img_path)[0] + '.json'
+    if results_writer is not None:
+        if results_writer.processed_paths is not None:
+            return os.path.abspath(img_path) in results_writer.processed_paths
+        if results_writer.existing_json_paths is not None:
+            return json_path in results_writer.existing_json_paths
+    return os.path.exists(json_path)
+
 
+# 批量处理结果状态码
+STATUS_CODES = {"success": 0, "skipped": 1, "analysis_error": 2, "save_error": 3, "task_error": 4}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+_STATUS_PENDING = 255
 
-async def process_images_batch(root_dir: str, force_rerun: bool = False, debug: bool = False, concurrent_limit: int = None) -> int:
+
+class BatchResults:
+    """
+    列式存储批量处理结果，替代每张图片保留一个结果字典的列表
+    
+    状态码存入按完成顺序排列的uint8数组，路径复用任务列表中的字符串，
+    只有失败任务保留错误信息；分析结果写盘后即可释放，不随结果列表常驻内存。
+    """
+    
+    def __init__(self, size: int):
+        """
+        预分配结果存储
+        
+        Args:
+            size: 任务总数
+        """
+        self.statuses = array('B', [_STATUS_PENDING]) * size
+        self.paths = [None] * size
+        self.errors = {}
+        self._count = 0
+    
+    def __len__(self):
+        return self._count
+    
+    def add(self, result: Dict[str, Any]):
+        """
+        记录一张图片的处理结果
+        
+        Args:
+            result: 工作协程返回的处理结果字典
+        """
+        index = self._count
+        code = STATUS_CODES.get(result["status"], STATUS_CODES["task_error"])
+        self.statuses[index] = code
+        self.paths[index] = result["path"]
+        if code not in (STATUS_CODES["success"], STATUS_CODES["skipped"]):
+            self.errors[index] = result.get("error", "未知错误")
+        self._count += 1
+    
+    def count(self, status: str) -> int:
+        """
+        统计指定状态的结果数量
+        
+        Args:
+            status: 状态名称，如 "success"
+            
+        Returns:
+            int: 结果数量
+        """
+        return self.statuses.count(STATUS_CODES[status])
+    
+    def iter_errors(self):
+        """
+        按完成顺序遍历失败的任务
+        
+        Yields:
+            Tuple[str, str, Any]: (图片路径, 状态名称, 错误信息)
+        """
+        for index in sorted(self.errors):
+            yield self.paths[index], STATUS_NAMES[self.statuses[index]], self.errors[index]
+
+
+def is_throttled_result(result: Dict[str, Any]) -> bool:
+    """
+    判断处理结果是否为限流（429）或服务端错误（5xx）
+    
+    Args:
+        result: 工作协程返回的处理结果字典
+        
+    Returns:
+        bool: 是否应视为拥塞信号
+    """
+    error = result.get("error")
+    if result.get("status") != "analysis_error" or not isinstance(error, dict):
+        return False
+    status_code = error.get("status_code")
+    return status_code is not None and (status_code == 429 or status_code >= 500)
+
+
+async def image_worker(
+    paths_queue: asyncio.Queue,
+    results_queue: asyncio.Queue,
+    process_group: Callable[[List[str]], Awaitable[List[Dict[str, Any]]]],
+    limiter: AdaptiveLimiter = None
+):
+    """
+    长期运行的工作协程：从路径队列取一组图片处理，每张图片的结果放入结果队列
+    
+    工作协程数量是并发上限；配置自适应限制器时，实际并发由限制器按错误率动态调整。
+    取到None时退出。
+    
+    Args:
+        paths_queue: 待处理图片路径分组队列（有界，提供背压）
+        results_queue: 处理结果队列
+        process_group: 处理一组图片的协程函数
+        limiter: 自适应并发限制器，None时不额外限制
+    """
+    while True:
+        if limiter is not None:
+            await limiter.acquire()
+        img_paths = await paths_queue.get()
+        throttled = False
+        try:
+            if img_paths is None:
+                return
+            
+            try:
+                results = await process_group(img_paths)
+            except Exception as e:
+                results = [{
+                    "status": "task_error",
+                    "path": img_path,
+                    "error": str(e),
+                    "traceback": traceback.format_exc()
+                } for img_path in img_paths]
+            throttled = any(is_throttled_result(result) for result in results)
+            for result in results:
+                await results_queue.put(result)
+        finally:
+            paths_queue.task_done()
+            if limiter is not None:
+                await limiter.release(throttled, record=img_paths is not None)
+
+
+# 每个摘要任务包含的图片数，分摊进程间通信开销
+DIGEST_CHUNK_SIZE = 64
+
+
+async def compute_digests(image_paths: List[str], executor=None) -> List[str]:
+    """
+    分块并行计算图片内容摘要，文件读取与哈希都在执行器中进行，不阻塞事件循环
+    
+    Args:
+        image_paths: 图片文件路径列表
+        executor: 进程池；为None时使用事件循环的默认线程池
+        
+    Returns:
+        List[str]: 与image_paths一一对应的摘要（读取失败为None）
+    """
+    loop = asyncio.get_running_loop()
+    chunks = [image_paths[i:i + DIGEST_CHUNK_SIZE] for i in range(0, len(image_paths), DIGEST_CHUNK_SIZE)]
+    parts = await asyncio.gather(*(
+        loop.run_in_executor(executor, compute_image_digests, chunk) for chunk in chunks
+    ))
+    return [digest for part in parts for digest in part]
+
+
+async def process_images_batch(root_dir: str, force_rerun: bool = False, debug: bool = False, concurrent_limit: int = None,
+                               images_per_request: int = None, results_file: str = None) -> int:
     """
     批量处理图片的主函数
     
@@ -138,10 +539,14 @@ async def process_images_batch(root_dir: str, force_rerun: bool = False, debug:
         force_rerun: 是否强制重新处理
         debug: 是否启用调试模式
         concurrent_limit: 并发限制数量
+        images_per_request: 每次API请求包含的图片数量
+        results_file: 追加写入所有结果的JSONL文件，None时每张图片保存一个JSON文件
         
     Returns:
         int: 退出代码，0表示成功
     """
+    executor = None
+    results_writer = None
     try:
         start_time = time.time()
         
@@ -150,10 +555,17 @@ async def process_images_batch(root_dir: str, force_rerun: bool = False, debug:
         
         # 获取并发限制
         concurrent_limit = concurrent_limit or int(os.getenv('VLM_BATCH_CONCURRENT_LIMIT', '50000'))
+        images_per_request = max(1, images_per_request or int(os.getenv('VLM_IMAGES_PER_REQUEST', '1')))
+        results_file = results_file or os.getenv('VLM_RESULTS_FILE')
+        results_writer = ResultWriter(results_file, root_dir)
+        
+        # CPU密集型工作（图片校验、压缩）使用进程池，VLM_CPU_WORKERS=0时回退到线程
+        cpu_workers = int(os.getenv('VLM_CPU_WORKERS', str(os.cpu_count() or 1)))
+        if cpu_workers > 0:
+            executor = ProcessPoolExecutor(max_workers=cpu_workers)
         
         # 初始化组件
-        task_pool = BatchTaskPool(max_concurrent=concurrent_limit)
-        analyzer = BatchImageQualityAnalyzer()
+        analyzer = BatchImageQualityAnalyzer(executor=executor)
         cost_calculator = CostCalculator()
         
         # 查找待处理图片
@@ -162,14 +574,22 @@ async def process_images_batch(root_dir: str, force_rerun: bool = False, debug:
         # 预过滤：快速验证图片有效性，避免处理无效图片
         print(f"Found {len(all_images)} images, validating...")
         valid_images = []
+        oversized_images = set()
         invalid_count = 0
         validation_stats = {"too_small": 0, "invalid_dimensions": 0, "error": 0, "valid": 0}
 
-        for img_path in all_images:
-            validation = quick_validate_image(img_path, max_size=2000, min_size=100)
+        validate = partial(quick_validate_image, max_size=2000, min_size=100)
+        if executor is not None:
+            validations = executor.map(validate, all_images, chunksize=64)
+        else:
+            validations = map(validate, all_images)
+
+        for img_path, validation in zip(all_images, validations):
             if validation["valid"]:
                 valid_images.append(img_path)
                 validation_stats["valid"] += 1
+                if validation["needs_resize"]:
+                    oversized_images.add(img_path)
             else:
                 invalid_count += 1
                 reason = validation["reason"].split(":")[0]  # 提取主要原因
@@ -186,99 +606,143 @@ async def process_images_batch(root_dir: str, force_rerun: bool = False, debug:
         # 过滤已处理的图片
         tasks_to_process = [
             img_path for img_path in valid_images
-            if not os.path.exists(os.path.splitext(img_path)[0] + '.json') or force_rerun
+            if not result_saved(img_path, results_writer) or force_rerun
         ]
 
         if not tasks_to_process:
             print("All valid images already processed.")
             return 0
 
+        # 按内容去重：相同图片只请求一次API，结果复用到所有副本
+        digests = await compute_digests(tasks_to_process, executor)
+        digest_by_path = dict(zip(tasks_to_process, digests))
+        duplicate_groups = group_duplicate_images(tasks_to_process, digests)
+        duplicate_count = len(tasks_to_process) - len(duplicate_groups)
+        tasks_to_process = list(duplicate_groups)
+
+        # 超出尺寸限制的图片预先压缩并按内容缓存，避免先上传原图再收到400重试；
+        # 缓存键直接使用去重时算好的摘要，不再重复读取这些最大的文件
+        oversized = [img_path for img_path in tasks_to_process if img_path in oversized_images]
+        prepare_args = (
+            oversized,
+            repeat(os.getenv('VLM_RESIZE_CACHE_DIR', RESIZE_CACHE_DIR)),
+            repeat(2000),
+            [digest_by_path[img_path] for img_path in oversized],
+        )
+        if executor is not None:
+            cached_paths = executor.map(cache_resized_image, *prepare_args)
+        else:
+            cached_paths = map(cache_resized_image, *prepare_args)
+        upload_paths = {
+            img_path: cached_path
+            for img_path, cached_path in zip(oversized, cached_paths) if cached_path
+        }
+
         # 显示处理统计
         print("Processing Statistics:")
         print(f"  Directory: {root_dir}")
         print(f"  Images found: {len(all_images)}")
         print(f"  Valid images: {len(valid_images)}")
         print(f"  Invalid images: {invalid_count}")
+        print(f"  Duplicates: {duplicate_count} (reusing results)")
+        print(f"  Pre-resized: {len(upload_paths)}")
         print(f"  To process: {len(tasks_to_process)}")
         print(f"  Concurrent limit: {concurrent_limit}")
+        print(f"  Images per request: {images_per_request}")
+        print(f"  Results file: {results_file or 'per-image JSON'}")
         
-        # 配置连接池
-        connector = aiohttp.TCPConnector(
-            limit=0,  # 无限制
-            limit_per_host=0,  # 无限制
-            keepalive_timeout=3600,  # 1小时保活
-            enable_cleanup_closed=True
-        )
-        timeout = aiohttp.ClientTimeout(total=72*3600, connect=30, sock_read=3600)
+        # 按每次请求的图片数量分组
+        path_groups = [
+            tasks_to_process[i:i + images_per_request]
+            for i in range(0, len(tasks_to_process), images_per_request)
+        ]
         
-        results = []
-        processed_count = 0
+        results = BatchResults(len(tasks_to_process))
+        worker_count = min(concurrent_limit, len(path_groups))
+        
+        # 自适应并发：从较小并发起步，按429/5xx错误率逐步扩大或减半
+        limiter = None
+        if os.getenv('VLM_ADAPTIVE_CONCURRENCY', 'true').lower() == 'true':
+            initial_limit = int(os.getenv('VLM_ADAPTIVE_INITIAL_LIMIT', '32'))
+            limiter = AdaptiveLimiter(initial=initial_limit, maximum=worker_count)
+            print(f"  Adaptive concurrency: start {limiter.limit}, max {worker_count}")
         
         print("\nStarting batch processing...")
 
-        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-            # 动态提交任务到池中
-            pending_tasks = {}
+        await results_writer.start()
+
+        # 复用进程内共享的HTTP客户端，多次调用时无需重新建立DNS/TLS连接
+        session = await get_http_session(concurrent_limit)
+
+        async def process_group(img_paths):
+            return await process_image_group(
+                analyzer, session, img_paths, force_rerun, debug, cost_calculator,
+                duplicate_groups=duplicate_groups, results_writer=results_writer,
+                upload_paths=upload_paths, defer_usage=True
+            )
+
+        # 有界路径队列 + 固定数量工作协程：队列满时生产者等待，内存占用有上限
+        paths_queue = asyncio.Queue(maxsize=concurrent_limit * 2)
+        results_queue = asyncio.Queue()
+        workers = [
+            asyncio.create_task(image_worker(paths_queue, results_queue, process_group, limiter))
+            for _ in range(worker_count)
+        ]
+
+        async def feed_paths():
+            for img_paths in path_groups:
+                await paths_queue.put(img_paths)
+            # 每个工作协程一个结束标记
+            for _ in range(worker_count):
+                await paths_queue.put(None)
+
+        producer = asyncio.create_task(feed_paths())
 
+        try:
             # 使用tqdm进度条显示完成进度
-            with tqdm(total=len(tasks_to_process), desc="Processing") as pbar:
-
-                # 提交所有任务
-                for img_path in tasks_to_process:
-                    # 创建处理协程
-                    coro = process_single_image(analyzer, session, img_path, force_rerun, debug, cost_calculator)
-                    task_data = {"path": img_path, "index": processed_count}
-
-                    # 提交到任务池（如果池满会等待）
-                    task_id, task = await task_pool.submit_task(coro, task_data)
-                    pending_tasks[task_id] = {"task": task, "data": task_data}
-
-                    processed_count += 1
-
-                # 收集完成的任务并更新进度条
-                while pending_tasks:
-                    completed_task_ids = []
-                    for task_id, task_info in pending_tasks.items():
-                        if task_info["task"].done():
-                            try:
-                                result = await task_info["task"]
-                                results.append(result)
-
-                                # 更新进度条
-                                pbar.update(1)
-
-                                # 显示当前处理的文件名和状态
-                                filename = os.path.basename(result.get("path", "unknown"))
-                                if result.get("status") == "success":
-                                    pbar.set_postfix_str(f"✓ {filename}")
-                                else:
-                                    pbar.set_postfix_str(f"✗ {filename}")
-
-                            except Exception as e:
-                                results.append({
-                                    "status": "collection_error",
-                                    "path": task_info["data"]["path"],
-                                    "error": str(e)
-                                })
-                                pbar.update(1)
-                                filename = os.path.basename(task_info["data"]["path"])
-                                pbar.set_postfix_str(f"✗ {filename}")
-
-                            completed_task_ids.append(task_id)
-
-                    # 移除已完成的任务
-                    for task_id in completed_task_ids:
-                        pending_tasks.pop(task_id)
-
-                    # 如果还有未完成的任务，短暂等待
-                    if pending_tasks:
-                        await asyncio.sleep(0.1)
+            with tqdm(total=len(tasks_to_process), desc="Processing", mininterval=0.5) as pbar:
+                pending_updates = 0
+                last_postfix_time = 0.0
+                # 成功请求的token用量攒够一批再汇总累加
+                pending_usages = []
+                for _ in range(len(tasks_to_process)):
+                    result = await results_queue.get()
+                    if result["status"] == "success" and "api_usage" in result["result"]:
+                        pending_usages.append(result["result"]["api_usage"])
+                        if len(pending_usages) >= 128:
+                            cost_calculator.add_usage_bulk(pending_usages)
+                            pending_usages = []
+                    results.add(result)
+                    pending_updates += 1
+
+                    # 积压的结果取完或累计64个时才批量更新进度条，避免每个结果都同步写终端
+                    if pending_updates < 64 and not results_queue.empty():
+                        continue
+                    pbar.update(pending_updates)
+                    pending_updates = 0
+
+                    # 当前处理的文件名和状态最多每0.5秒显示一次
+                    now = time.monotonic()
+                    if now - last_postfix_time >= 0.5:
+                        last_postfix_time = now
+                        filename = os.path.basename(result.get("path", "unknown"))
+                        mark = "✓" if result.get("status") == "success" else "✗"
+                        pbar.set_postfix_str(f"{mark} {filename}", refresh=False)
+
+                cost_calculator.add_usage_bulk(pending_usages)
+
+            await producer
+            await asyncio.gather(*workers)
+        finally:
+            producer.cancel()
+            for worker in workers:
+                worker.cancel()
         
         # 统计和报告结果
         end_time = time.time()
         processing_time = end_time - start_time
         
-        success_count = sum(1 for r in results if r["status"] == "success")
+        success_count = results.count("success")
         error_count = len(results) - success_count
         
         print("\nBatch processing completed.")
@@ -289,10 +753,11 @@ async def process_images_batch(root_dir: str, force_rerun: bool = False, debug:
         if processing_time > 0:
             print(f"Speed: {len(tasks_to_process)/processing_time:.1f} images/sec")
 
-        # 显示任务池统计
-        pool_stats = task_pool.get_stats()
-        print(f"Tasks submitted: {pool_stats['total_submitted']}")
-        print(f"Success rate: {pool_stats['success_rate']:.1f}%")
+        # 显示工作协程统计
+        print(f"Workers: {worker_count}")
+        if limiter is not None:
+            print(f"Final adaptive concurrency: {limiter.limit}")
+        print(f"Success rate: {success_count / max(len(results), 1) * 100:.1f}%")
         
         # 显示成本报告
         cost_report, cost_data = cost_calculator.format_cost_report(processing_time, success_count)
@@ -300,20 +765,19 @@ async def process_images_batch(root_dir: str, force_rerun: bool = False, debug:
         
         # 保存错误日志
         error_log = []
-        for result in results:
-            if result["status"] in ["analysis_error", "save_error", "collection_error", "gather_error"]:
-                error_log.append({
-                    "file": result["path"],
-                    "error_type": result["status"],
-                    "message": result.get("error", "未知错误"),
-                    "timestamp": time.time()
-                })
+        for img_path, status, error in results.iter_errors():
+            error_log.append({
+                "file": img_path,
+                "error_type": status,
+                "message": error,
+                "timestamp": time.time()
+            })
         
         if error_log:
             log_file = 'processing_errors_batch.jsonl'
-            async with aiofiles.open(log_file, 'w', encoding='utf-8') as f:
+            with open(log_file, 'w', encoding='utf-8') as f:
                 for entry in error_log:
-                    await f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
             print(f"Error log: {log_file}")
         
         return 0
@@ -327,3 +791,8 @@ async def process_images_batch(root_dir: str, force_rerun: bool = False, debug:
         if debug:
             print(traceback.format_exc())
         return 1
+    finally:
+        if results_writer is not None:
+            await results_writer.close()
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
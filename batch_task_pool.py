@@ -7,7 +7,7 @@ BatchTaskPool - 高性能任务池管理器
 import asyncio
 import traceback
 import time
-from typing import Dict, Any, Tuple, Optional
+from typing import Dict, Any, Tuple, Optional, AsyncIterator
 
 
 class BatchTaskPool:
@@ -18,7 +18,10 @@ class BatchTaskPool:
     - 支持最大50,000并发任务
     - 72小时任务超时
     - 自动故障恢复和槽位释放
-    - 线程安全的任务管理
+    - 无锁任务管理：所有操作都在同一事件循环中执行，字典操作之间没有await，
+      天然互斥；任务池绑定创建它的事件循环，不是线程安全的
+    - 基于完成回调的结果通道，无需轮询任务状态
+    - 并发槽位由显式计数器 + asyncio.Condition管理，可用set_limit在运行时安全调整上限
     """
     
     def __init__(self, max_concurrent: int = 50000):
@@ -28,15 +31,22 @@ class BatchTaskPool:
         Args:
             max_concurrent: 最大并发任务数，默认50,000
         """
-        self.max_concurrent = max_concurrent
+        self.max_concurrent = max(1, max_concurrent)
         self.task_timeout = 72 * 3600  # 72小时超时
         self.active_tasks: Dict[str, asyncio.Task] = {}
-        self.task_semaphore = asyncio.Semaphore(max_concurrent)
+        
+        # 并发槽位：占用数与上限都是普通属性，由条件变量唤醒等待者，
+        # 调整上限无需改动信号量内部状态
+        self._slots_in_use = 0
+        self._slot_condition = asyncio.Condition()
         self.task_counter = 0
         self.completed_count = 0
         self.failed_count = 0
         self.timeout_count = 0
-        self.lock = asyncio.Lock()
+        
+        # 完成通道：任务结束时由回调推入 (task_data, task)
+        self._done_queue: asyncio.Queue = asyncio.Queue()
+        self._unreported_count = 0
         
     async def submit_task(self, coro, task_data: Dict[str, Any]) -> Tuple[str, asyncio.Task]:
         """
@@ -50,7 +60,9 @@ class BatchTaskPool:
             Tuple[task_id, asyncio.Task]: 任务ID和Task对象
         """
         # 等待空闲槽位
-        await self.task_semaphore.acquire()
+        async with self._slot_condition:
+            await self._slot_condition.wait_for(lambda: self._slots_in_use < self.max_concurrent)
+            self._slots_in_use += 1
         
         # 生成唯一任务ID
         task_id = f"task_{self.task_counter}"
@@ -61,12 +73,45 @@ class BatchTaskPool:
             self._execute_with_timeout(coro, task_id, task_data)
         )
         
-        # 线程安全地添加到活跃任务列表
-        async with self.lock:
-            self.active_tasks[task_id] = wrapped_task
+        # 添加到活跃任务列表
+        self.active_tasks[task_id] = wrapped_task
+        
+        # 任务结束时推入完成通道
+        self._unreported_count += 1
+        wrapped_task.add_done_callback(
+            lambda task: self._done_queue.put_nowait((task_data, task))
+        )
             
         return task_id, wrapped_task
     
+    async def set_limit(self, max_concurrent: int):
+        """
+        运行时调整最大并发任务数
+        
+        调小上限时已在运行的任务不受影响，占用数降到新上限以下后才放行新任务；
+        调大上限时立即唤醒所有等待槽位的提交者。
+        
+        Args:
+            max_concurrent: 新的最大并发任务数（至少为1）
+        """
+        async with self._slot_condition:
+            self.max_concurrent = max(1, max_concurrent)
+            self._slot_condition.notify_all()
+    
+    async def iter_completed(self) -> AsyncIterator[Tuple[Dict[str, Any], asyncio.Task]]:
+        """
+        按完成顺序逐个产出已提交的任务，直到所有已提交任务都已产出
+        
+        应在提交完所有任务后调用；迭代期间继续提交的任务同样会被产出。
+        
+        Yields:
+            Tuple[Dict, asyncio.Task]: (提交时的task_data, 已完成的Task对象)
+        """
+        while self._unreported_count > 0:
+            task_data, task = await self._done_queue.get()
+            self._unreported_count -= 1
+            yield task_data, task
+    
     async def _execute_with_timeout(self, coro, task_id: str, task_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         执行任务并处理超时和异常，确保槽位释放
@@ -116,12 +161,13 @@ class BatchTaskPool:
         Args:
             task_id: 要清理的任务ID
         """
-        # 线程安全地从活跃任务中移除
-        async with self.lock:
-            self.active_tasks.pop(task_id, None)
+        # 从活跃任务中移除
+        self.active_tasks.pop(task_id, None)
         
-        # 释放信号量槽位
-        self.task_semaphore.release()
+        # 先同步归还槽位，即使随后的唤醒被取消也不会泄漏槽位
+        self._slots_in_use -= 1
+        async with self._slot_condition:
+            self._slot_condition.notify(1)
     
     def get_stats(self) -> Dict[str, Any]:
         """
@@ -133,7 +179,7 @@ class BatchTaskPool:
         return {
             "max_concurrent": self.max_concurrent,
             "active_tasks": len(self.active_tasks),
-            "available_slots": self.task_semaphore._value,
+            "available_slots": max(0, self.max_concurrent - self._slots_in_use),
             "total_submitted": self.task_counter,
             "completed": self.completed_count,
             "failed": self.failed_count,
@@ -145,25 +191,21 @@ class BatchTaskPool:
         """
         等待所有活跃任务完成
         
+        任务全部结束时立即返回；仍有任务未完成时每隔check_interval秒打印一次剩余数量
+        
         Args:
-            check_interval: 检查间隔（秒）
+            check_interval: 打印剩余任务数的间隔（秒）
         """
-        while True:
-            async with self.lock:
-                active_count = len(self.active_tasks)
-            
-            if active_count == 0:
-                break
-                
-            print(f"等待 {active_count} 个任务完成...")
-            await asyncio.sleep(check_interval)
+        while self.active_tasks:
+            print(f"等待 {len(self.active_tasks)} 个任务完成...")
+            await asyncio.wait(list(self.active_tasks.values()), timeout=check_interval)
     
     async def shutdown(self):
         """
         优雅关闭任务池，取消所有活跃任务
         """
-        async with self.lock:
-            tasks_to_cancel = list(self.active_tasks.values())
+        # 快照活跃任务，取消过程中字典会被清理回调修改
+        tasks_to_cancel = list(self.active_tasks.values())
         
         if tasks_to_cancel:
             print(f"正在取消 {len(tasks_to_cancel)} 个活跃任务...")
@@ -174,3 +216,87 @@ class BatchTaskPool:
             await asyncio.gather(*tasks_to_cancel, return_exceptions=True)
             
         print("任务池已关闭")
+
+
+class AdaptiveLimiter:
+    """
+    自适应并发限制器
+    
+    按固定时间窗口统计请求错误率（429限流和5xx），类似TCP拥塞控制动态调整并发上限：
+    - 错误率低于增长阈值且有请求在等待时，并发上限乘以增长系数
+    - 错误率高于收缩阈值时，并发上限减半
+    与任务池一样绑定创建它的事件循环，不是线程安全的。
+    """
+    
+    def __init__(self, initial: int = 32, maximum: int = 50000, minimum: int = 1,
+                 interval: float = 10.0, grow_below: float = 0.01, shrink_above: float = 0.05,
+                 growth: float = 1.5):
+        """
+        初始化限制器
+        
+        Args:
+            initial: 初始并发上限
+            maximum: 并发上限的最大值
+            minimum: 并发上限的最小值
+            interval: 统计窗口长度（秒）
+            grow_below: 错误率低于该值时扩大并发
+            shrink_above: 错误率高于该值时减半并发
+            growth: 扩大并发的倍数
+        """
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.limit = max(self.minimum, min(initial, self.maximum))
+        self.interval = interval
+        self.grow_below = grow_below
+        self.shrink_above = shrink_above
+        self.growth = growth
+        
+        self.active = 0
+        self.waiting = 0
+        self._condition = asyncio.Condition()
+        self._window_start = time.monotonic()
+        self._window_requests = 0
+        self._window_errors = 0
+    
+    async def acquire(self):
+        """等待并占用一个并发槽位"""
+        async with self._condition:
+            self.waiting += 1
+            try:
+                await self._condition.wait_for(lambda: self.active < self.limit)
+            finally:
+                self.waiting -= 1
+            self.active += 1
+    
+    async def release(self, throttled: bool = False, record: bool = True):
+        """
+        释放并发槽位并记录请求结果
+        
+        Args:
+            throttled: 请求是否因限流或服务端错误失败
+            record: 是否计入错误率统计（未发出请求时为False）
+        """
+        async with self._condition:
+            self.active -= 1
+            if record:
+                self._window_requests += 1
+                if throttled:
+                    self._window_errors += 1
+                self._adjust()
+            self._condition.notify_all()
+    
+    def _adjust(self):
+        """统计窗口结束时根据错误率调整并发上限"""
+        now = time.monotonic()
+        if now - self._window_start < self.interval or self._window_requests == 0:
+            return
+        
+        error_rate = self._window_errors / self._window_requests
+        if error_rate > self.shrink_above:
+            self.limit = max(self.minimum, self.limit // 2)
+        elif error_rate < self.grow_below and self.waiting > 0:
+            self.limit = min(self.maximum, max(self.limit + 1, int(self.limit * self.growth)))
+        
+        self._window_start = now
+        self._window_requests = 0
+        self._window_errors = 0
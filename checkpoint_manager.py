@@ -2,15 +2,283 @@
 """
 CheckpointManager - 进度跟踪和恢复功能管理器
 支持原子文件操作，防止检查点损坏
+采用"基础快照 + 增量日志"格式，自动保存只追加状态变化
+
+快照格式(version 3)：首行为JSON头部，其后每行一条记录，
+"c\t<路径>" 表示已完成，"f\t<路径>" 表示失败，
+路径中的反斜杠和换行符分别转义为 "\\\\" 和 "\\n"（version 2 不转义，仍可读取）；
+安装 zstandard 时快照以 b"CPZ1" 开头并整体zstd压缩
 """
 
 import os
-import json
+import re
+import sys
 import time
 import asyncio
-import aiofiles
-from typing import Set, Tuple, Dict, Any, Optional
-from colorama import Fore, Style
+from concurrent.futures import ThreadPoolExecutor
+from collections.abc import MutableSet
+from typing import Set, Tuple, Dict, Any, Optional, Iterable, List
+from json_codec import dumps_json, loads_json
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# 输出重定向到文件（或pythonw等环境下stdout为None）时不需要颜色码
+if sys.stdout is not None and sys.stdout.isatty():
+    from colorama import Fore, Style
+else:
+    class _NoColor:
+        """颜色占位：任意属性都返回空字符串"""
+        
+        def __getattr__(self, name: str) -> str:
+            return ''
+    
+    Fore = Style = _NoColor()
+
+
+# 状态表中的取值
+STATUS_COMPLETED = 1
+STATUS_FAILED = 2
+
+# 快照记录行前缀
+_RECORD_PREFIX = {STATUS_COMPLETED: 'c\t', STATUS_FAILED: 'f\t'}
+_RECORD_PREFIX_BYTES = {STATUS_COMPLETED: b'c\t', STATUS_FAILED: b'f\t'}
+
+# 当前快照格式版本
+SNAPSHOT_VERSION = 3
+_ESCAPE_PATTERN = re.compile(r'\\(.)', re.DOTALL)
+
+# zstd压缩快照的文件头魔数
+COMPRESSED_MAGIC = b'CPZ1'
+ZSTD_LEVEL = 3
+
+
+def _compress_snapshot(*chunks: bytes) -> bytes:
+    """
+    将快照内容压缩为带魔数的zstd流
+    
+    Args:
+        chunks: 依次写入的快照内容片段
+        
+    Returns:
+        bytes: COMPRESSED_MAGIC + zstd压缩数据
+    """
+    compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    parts = [COMPRESSED_MAGIC]
+    parts.extend(compressor.compress(chunk) for chunk in chunks)
+    parts.append(compressor.flush())
+    return b''.join(parts)
+
+
+def _decompress_snapshot(data: bytes) -> bytes:
+    """
+    解压带魔数的zstd快照
+    
+    Args:
+        data: 以 COMPRESSED_MAGIC 开头的文件内容
+        
+    Returns:
+        bytes: 解压后的快照内容
+    """
+    return zstandard.ZstdDecompressor().decompressobj().decompress(data[len(COMPRESSED_MAGIC):])
+
+
+def _escape_path(path: str) -> str:
+    """
+    转义路径中的反斜杠和换行符，保证一条记录恰好占一行
+    
+    Args:
+        path: 文件路径
+        
+    Returns:
+        str: 转义后的路径（无需转义时原样返回）
+    """
+    if '\\' in path or '\n' in path:
+        return path.replace('\\', '\\\\').replace('\n', '\\n')
+    return path
+
+
+def _unescape_path(text: str) -> str:
+    """
+    还原 _escape_path 转义的路径
+    
+    Args:
+        text: 记录行中的路径部分
+        
+    Returns:
+        str: 原始路径
+    """
+    if '\\' not in text:
+        return text
+    return _ESCAPE_PATTERN.sub(lambda m: '\n' if m.group(1) == 'n' else m.group(1), text)
+
+
+def _encode_record(path: str, code: int) -> bytes:
+    """
+    编码单条快照记录
+    
+    Args:
+        path: 文件路径
+        code: STATUS_COMPLETED 或 STATUS_FAILED
+        
+    Returns:
+        bytes: 以换行结尾的记录行
+    """
+    return _RECORD_PREFIX_BYTES[code] + _escape_path(path).encode('utf-8') + b'\n'
+
+
+def _read_file(path: str) -> bytes:
+    """
+    读取整个文件，zstd压缩快照会被解压
+    
+    Args:
+        path: 文件路径
+        
+    Returns:
+        bytes: 文件内容（解压后）
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+    if content.startswith(COMPRESSED_MAGIC):
+        content = _decompress_snapshot(content)
+    return content
+
+
+def _write_atomic(path: str, header_line: bytes, records: bytes, compress: bool) -> None:
+    """
+    原子写入快照：先写临时文件，再替换目标文件
+    
+    Args:
+        path: 检查点文件路径
+        header_line: 头部行
+        records: 记录行
+        compress: 是否zstd压缩
+    """
+    temp_file = f"{path}.tmp"
+    try:
+        with open(temp_file, 'wb') as f:
+            if compress:
+                f.write(_compress_snapshot(header_line, records))
+            else:
+                f.write(header_line)
+                f.write(records)
+        
+        # 原子替换（POSIX和Windows均可覆盖已有文件）
+        os.replace(temp_file, path)
+        
+    except Exception:
+        # 清理临时文件
+        if os.path.exists(temp_file):
+            try:
+                os.remove(temp_file)
+            except OSError:
+                pass
+        raise
+
+
+def _remove_if_exists(path: str) -> None:
+    """删除文件，文件不存在时忽略"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _append_file(handle, data: bytes) -> None:
+    """追加写入并刷新到操作系统"""
+    handle.write(data)
+    handle.flush()
+
+
+class _StatusView(MutableSet):
+    """
+    状态表中某一状态的集合视图
+    
+    保持与原来 set 属性一致的接口（in/len/迭代/add/discard/clear），
+    读写都直接作用于检查点管理器的状态表
+    """
+    
+    __slots__ = ('_manager', '_code')
+    
+    def __init__(self, manager: 'CheckpointManager', code: int):
+        self._manager = manager
+        self._code = code
+    
+    def __contains__(self, file_path) -> bool:
+        return self._manager._status.get(file_path) == self._code
+    
+    def __iter__(self):
+        code = self._code
+        return (path for path, value in self._manager._status.items() if value == code)
+    
+    def __len__(self) -> int:
+        return self._manager._status_count(self._code)
+    
+    def add(self, file_path: str) -> None:
+        self._manager._set_status(file_path, self._code)
+    
+    def discard(self, file_path: str) -> None:
+        if file_path in self:
+            self._manager._set_status(file_path, 0)
+    
+    def clear(self) -> None:
+        self._manager._replace_status(self._code, ())
+    
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({set(self)!r})"
+
+
+class ProgressStats:
+    """
+    进度统计信息
+    
+    检查点管理器复用同一个实例，每次查询只刷新计数字段，
+    派生指标按需计算；支持 stats['字段名'] 形式的字典式访问
+    """
+    
+    __slots__ = ('completed_count', 'failed_count', 'total_files', 'elapsed_time')
+    
+    def __init__(self):
+        self.completed_count = 0
+        self.failed_count = 0
+        self.total_files = 0
+        self.elapsed_time = 0.0
+    
+    @property
+    def processed_count(self) -> int:
+        return self.completed_count + self.failed_count
+    
+    @property
+    def remaining_count(self) -> int:
+        return max(0, self.total_files - self.processed_count)
+    
+    @property
+    def success_rate(self) -> float:
+        processed_count = self.processed_count
+        return (self.completed_count / processed_count * 100) if processed_count > 0 else 0
+    
+    @property
+    def progress_percentage(self) -> float:
+        return (self.processed_count / self.total_files * 100) if self.total_files > 0 else 0
+    
+    @property
+    def estimated_remaining_time(self) -> float:
+        processed_count = self.processed_count
+        remaining_count = self.remaining_count
+        if processed_count > 0 and remaining_count > 0:
+            return self.elapsed_time / processed_count * remaining_count
+        return 0
+    
+    def __getitem__(self, key: str):
+        return getattr(self, key)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为普通字典"""
+        keys = ('completed_count', 'failed_count', 'processed_count', 'total_files', 'remaining_count',
+                'success_rate', 'progress_percentage', 'elapsed_time', 'estimated_remaining_time')
+        return {key: getattr(self, key) for key in keys}
 
 
 class CheckpointManager:
@@ -22,48 +290,201 @@ class CheckpointManager:
     - 跟踪已完成和失败的文件
     - 支持进度百分比计算
     - 定期自动保存机制
+    - 增量日志(.delta)只记录状态变化，超过快照一半大小时压缩为新快照
+    - 可选后台刷写任务，update_progress只入队不等待磁盘写入
     """
     
-    def __init__(self, checkpoint_file: str, auto_save_interval: int = 100):
+    def __init__(self, checkpoint_file: str, auto_save_interval: int = 100, flush_interval: float = 5.0,
+                 compress: bool = True):
         """
         初始化检查点管理器
         
         Args:
             checkpoint_file: 检查点文件路径
             auto_save_interval: 自动保存间隔（处理文件数）
+            flush_interval: 后台刷写任务的最长刷写间隔（秒）
+            compress: 是否zstd压缩快照（未安装zstandard时忽略）
         """
         self.checkpoint_file = checkpoint_file
         self.auto_save_interval = auto_save_interval
-        self.completed_files: Set[str] = set()
-        self.failed_files: Set[str] = set()
+        self.flush_interval = flush_interval
+        self.compress = compress and ZSTD_AVAILABLE
+        # 确保目录存在
+        os.makedirs(os.path.dirname(checkpoint_file) or '.', exist_ok=True)
+        # 单一状态表：路径 -> STATUS_COMPLETED / STATUS_FAILED，计数器随更新维护
+        self._status: Dict[str, int] = {}
+        self._completed_count = 0
+        self._failed_count = 0
+        # 已编码的快照记录，随状态变化追加；同一路径的后出现记录覆盖先出现的，
+        # _stale_records 统计被覆盖的旧记录数，为None表示需要在快照时重建
+        self._encoded: Optional[bytearray] = bytearray()
+        self._stale_records = 0
+        self._completed_view = _StatusView(self, STATUS_COMPLETED)
+        self._failed_view = _StatusView(self, STATUS_FAILED)
         self.total_files = 0
         self.last_save_count = 0
         self.start_time = time.time()
+        # 耗时用单调时钟计算，不受系统时间调整影响
+        self._start_monotonic = time.monotonic()
+        self._stats = ProgressStats()
+        # 上次打印摘要时的 (完成数, 失败数, 总数)，未变化时跳过重复打印
+        self._last_report: Optional[Tuple[int, int, int]] = None
+        # 只用于串行化快照和增量日志的磁盘写入，状态更新本身不加锁
         self.lock = asyncio.Lock()
+        self.delta_file = f"{checkpoint_file}.delta"
+        self._delta_handle = None
+        self._pending_delta = []
+        # 追加写入失败后文件末尾可能留下半行，下次写入前先补一个换行
+        self._delta_torn = False
+        # 检查点文件I/O在专用单线程中执行，每次保存只切换一次线程
+        self._io_exec: Optional[ThreadPoolExecutor] = None
+        self._delta_size = 0
+        self._base_size = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._flusher_task: Optional[asyncio.Task] = None
+        # 组提交：越过保存阈值后等待一个短窗口，窗口内的更新合并为一次写入
+        self.commit_window = 0.05
+        self._pending_save: Optional[asyncio.Task] = None
+        # 后台保存失败时记录的异常，由下一次update_progress/flush/close抛给调用方
+        self._save_error: Optional[BaseException] = None
+    
+    @property
+    def completed_files(self) -> _StatusView:
+        """已完成文件集合（状态表视图）"""
+        return self._completed_view
+    
+    @completed_files.setter
+    def completed_files(self, paths: Iterable[str]) -> None:
+        self._replace_status(STATUS_COMPLETED, paths)
+    
+    @property
+    def failed_files(self) -> _StatusView:
+        """失败文件集合（状态表视图）"""
+        return self._failed_view
+    
+    @failed_files.setter
+    def failed_files(self, paths: Iterable[str]) -> None:
+        self._replace_status(STATUS_FAILED, paths)
+    
+    def _status_count(self, code: int) -> int:
+        """返回某一状态的文件数（O(1)）"""
+        if code == STATUS_COMPLETED:
+            return self._completed_count
+        return self._failed_count
+    
+    def _set_status(self, file_path: str, code: int) -> None:
+        """
+        设置单个文件的状态，一次哈希查找并同步更新计数器和已编码记录
+        
+        Args:
+            file_path: 文件路径
+            code: STATUS_COMPLETED、STATUS_FAILED，或0表示移除
+        """
+        if code:
+            prev = self._status.get(file_path, 0)
+            if prev == code:
+                return
+            self._status[file_path] = code
+            if self._encoded is not None:
+                self._encoded += _encode_record(file_path, code)
+                if prev:
+                    self._stale_records += 1
+        else:
+            prev = self._status.pop(file_path, 0)
+            if prev:
+                # 移除无法用追加记录表达，下次快照时重建
+                self._encoded = None
+        self._completed_count += (code == STATUS_COMPLETED) - (prev == STATUS_COMPLETED)
+        self._failed_count += (code == STATUS_FAILED) - (prev == STATUS_FAILED)
+    
+    def _replace_status(self, code: int, paths: Iterable[str]) -> None:
+        """
+        用给定路径整体替换某一状态的全部文件
+        
+        Args:
+            code: 要替换的状态
+            paths: 新的路径集合
+        """
+        if paths is self._completed_view or paths is self._failed_view:
+            paths = list(paths)
+        for path in [p for p, value in self._status.items() if value == code]:
+            self._set_status(path, 0)
+        for path in paths:
+            self._set_status(path, code)
         
     async def load_checkpoint(self) -> Tuple[Set[str], Set[str]]:
         """
         从检查点文件加载进度状态
         
         Returns:
-            Tuple[Set[str], Set[str]]: (已完成文件集合, 失败文件集合)
+            Tuple[Set[str], Set[str]]: (已完成文件集合, 失败文件集合)，
+                即管理器内部的集合本身（不做拷贝），调用方与管理器共享同一份状态
         """
+        # 残留的临时文件不可信：替换要么已完成，要么没有发生
+        _remove_if_exists(f"{self.checkpoint_file}.tmp")
+        
         if not os.path.exists(self.checkpoint_file):
+            # 没有快照时残留的增量日志属于已清除的旧任务，不能回放
+            _remove_if_exists(self.delta_file)
             print(f"{Fore.YELLOW}📋 未找到检查点文件，从头开始处理{Style.RESET_ALL}")
-            return set(), set()
+            return self.completed_files, self.failed_files
+        
+        # 压缩快照缺少解压库时直接报错，避免当作损坏文件从头开始并覆盖进度
+        if not ZSTD_AVAILABLE:
+            with open(self.checkpoint_file, 'rb') as f:
+                if f.read(len(COMPRESSED_MAGIC)) == COMPRESSED_MAGIC:
+                    raise RuntimeError("检查点文件为zstd压缩格式，请先安装 zstandard")
             
         try:
-            async with aiofiles.open(self.checkpoint_file, 'r', encoding='utf-8') as f:
-                content = await f.read()
-                state = json.loads(content)
+            content = await self._run_io(_read_file, self.checkpoint_file)
+            
+            header_line, _, body = content.partition(b'\n')
+            try:
+                state = loads_json(header_line)
+            except ValueError:
+                state = None
+            
+            version = state.get('version') if isinstance(state, dict) else None
+            if version in (2, SNAPSHOT_VERSION):
+                # 按顺序回放记录，同一路径以最后一条为准；version 2 的路径未转义
+                status = {}
+                intern = sys.intern
+                unescape = _unescape_path if version == SNAPSHOT_VERSION else str
+                for line in body.decode('utf-8').split('\n'):
+                    if line.startswith('c\t'):
+                        status[intern(unescape(line[2:]))] = STATUS_COMPLETED
+                    elif line.startswith('f\t'):
+                        status[intern(unescape(line[2:]))] = STATUS_FAILED
+                if version == SNAPSHOT_VERSION:
+                    # 文件中的记录即为已编码记录，后续变化直接追加
+                    encoded = bytearray(body)
+                    stale_records = body.count(b'\n') - len(status)
+                else:
+                    # 旧版记录格式不同，下次快照时按新格式重建
+                    encoded = None
+                    stale_records = 0
+            else:
+                # 兼容旧版整体JSON格式
+                state = loads_json(content)
+                status = dict.fromkeys(map(sys.intern, state.get('completed', [])), STATUS_COMPLETED)
+                status.update(dict.fromkeys(map(sys.intern, state.get('failed', [])), STATUS_FAILED))
+                encoded = None
+                stale_records = 0
                 
-            self.completed_files = set(state.get('completed', []))
-            self.failed_files = set(state.get('failed', []))
+            self._status = status
+            self._encoded = encoded
+            self._stale_records = stale_records
+            self._failed_count = list(self._status.values()).count(STATUS_FAILED)
+            self._completed_count = len(self._status) - self._failed_count
             self.total_files = state.get('total_files', 0)
             self.start_time = state.get('start_time', time.time())
+            self._start_monotonic = time.monotonic() - max(0.0, time.time() - self.start_time)
+            # 以未压缩大小衡量，与增量日志大小可比
+            self._base_size = len(content)
+            await self._replay_delta()
             
-            completed_count = len(self.completed_files)
-            failed_count = len(self.failed_files)
+            completed_count = self._completed_count
+            failed_count = self._failed_count
             
             print(f"{Fore.GREEN}📋 检查点加载成功{Style.RESET_ALL}")
             print(f"  已完成: {completed_count:,} 个文件")
@@ -72,58 +493,65 @@ class CheckpointManager:
                 progress = (completed_count + failed_count) / self.total_files * 100
                 print(f"  进度: {progress:.1f}%")
                 
-            return self.completed_files.copy(), self.failed_files.copy()
+            return self.completed_files, self.failed_files
             
         except Exception as e:
             print(f"{Fore.RED}❌ 检查点文件损坏，从头开始: {e}{Style.RESET_ALL}")
-            return set(), set()
+            self._status.clear()
+            self._completed_count = 0
+            self._failed_count = 0
+            self._encoded = bytearray()
+            self._stale_records = 0
+            return self.completed_files, self.failed_files
     
     async def save_checkpoint(self, completed: Set[str], failed: Set[str], total_files: int = None) -> None:
         """
         保存当前进度到检查点文件（原子操作）
         
         Args:
-            completed: 已完成文件集合
+            completed: 已完成文件集合（与内部集合为同一对象时不做拷贝）
             failed: 失败文件集合
             total_files: 总文件数（可选）
         """
         async with self.lock:
-            self.completed_files = completed.copy()
-            self.failed_files = failed.copy()
+            if completed is not self.completed_files:
+                self.completed_files = completed
+            if failed is not self.failed_files:
+                self.failed_files = failed
             if total_files is not None:
                 self.total_files = total_files
-                
-            state = {
-                'completed': list(self.completed_files),
-                'failed': list(self.failed_files),
-                'total_files': self.total_files,
-                'start_time': self.start_time,
-                'last_update': time.time(),
-                'version': '1.0'
-            }
-            
-            # 原子写入：先写临时文件，再重命名
-            temp_file = f"{self.checkpoint_file}.tmp"
-            try:
-                # 确保目录存在
-                os.makedirs(os.path.dirname(self.checkpoint_file), exist_ok=True)
-                
-                async with aiofiles.open(temp_file, 'w', encoding='utf-8') as f:
-                    await f.write(json.dumps(state, ensure_ascii=False, indent=2))
-                
-                # 原子重命名（Windows兼容性处理）
-                if os.path.exists(self.checkpoint_file):
-                    os.remove(self.checkpoint_file)
-                os.rename(temp_file, self.checkpoint_file)
-                
-            except Exception as e:
-                # 清理临时文件
-                if os.path.exists(temp_file):
-                    try:
-                        os.remove(temp_file)
-                    except:
-                        pass
-                raise e
+            await self._write_snapshot()
+    
+    async def _write_snapshot(self) -> None:
+        """
+        写入完整快照并清空增量日志（调用方需持有锁）
+        
+        状态更新不加锁，写入期间到达的更新不在快照内：
+        只丢弃快照开始前已缓冲的增量记录，之后到达的记录留给下一次刷写；
+        增量日志文件只在持锁时写入，快照期间不会有新记录落盘，可以整体删除
+        """
+        header = {
+            'total_files': self.total_files,
+            'start_time': self.start_time,
+            'last_update': time.time(),
+            'version': SNAPSHOT_VERSION
+        }
+        # 已编码记录缺失或旧记录过多时，单次遍历状态表重建
+        if self._encoded is None or self._stale_records > len(self._status):
+            records = ''.join(f"{_RECORD_PREFIX[value]}{_escape_path(path)}\n" for path, value in self._status.items())
+            self._encoded = bytearray(records.encode('utf-8'))
+            self._stale_records = 0
+        # 写入在线程中进行，拷贝一份以免事件循环同时追加记录
+        records = bytes(self._encoded)
+        header_line = dumps_json(header) + b'\n'
+        covered_delta = len(self._pending_delta)
+        
+        await self._run_io(_write_atomic, self.checkpoint_file, header_line, records, self.compress)
+        self._base_size = len(header_line) + len(records)
+        
+        # 快照已包含拷贝时的全部状态，对应的增量记录可以丢弃
+        del self._pending_delta[:covered_delta]
+        await self._truncate_delta()
     
     async def update_progress(self, file_path: str, status: str, auto_save: bool = True) -> None:
         """
@@ -133,51 +561,278 @@ class CheckpointManager:
             file_path: 文件路径
             status: 状态 ('completed' 或 'failed')
             auto_save: 是否触发自动保存检查
-        """
-        async with self.lock:
-            if status == 'completed':
-                self.completed_files.add(file_path)
-                self.failed_files.discard(file_path)  # 从失败列表中移除（如果存在）
-            elif status == 'failed':
-                self.failed_files.add(file_path)
-                self.completed_files.discard(file_path)  # 从完成列表中移除（如果存在）
             
-            # 检查是否需要自动保存
-            if auto_save:
-                current_count = len(self.completed_files) + len(self.failed_files)
-                if current_count - self.last_save_count >= self.auto_save_interval:
-                    await self.save_checkpoint(self.completed_files, self.failed_files)
-                    self.last_save_count = current_count
+        路径会被驻留(sys.intern)，调用方多处持有同一路径时共享同一字符串对象
+        """
+        file_path = sys.intern(file_path)
+        # 状态表更新不含await，单事件循环内无需加锁；新状态覆盖旧状态
+        if status == 'completed':
+            self._set_status(file_path, STATUS_COMPLETED)
+        elif status == 'failed':
+            self._set_status(file_path, STATUS_FAILED)
+        else:
+            return
+        
+        # 检查是否需要自动保存：只追加状态变化到增量日志
+        if not auto_save:
+            return
+        op = 'c' if status == 'completed' else 'f'
+        record = dumps_json({"op": op, "p": file_path}) + b'\n'
+        
+        # 后台刷写任务运行时只入队，磁盘写入由刷写任务合并完成
+        if self._queue is not None:
+            self._queue.put_nowait(record)
+        else:
+            # 追加到写缓冲无需加锁；越过阈值时只安排一次延迟保存，
+            # 窗口内其他协程的更新都会被这次保存一并写出
+            self._pending_delta.append(record)
+            if len(self._pending_delta) >= self.auto_save_interval and self._pending_save is None:
+                self._pending_save = asyncio.create_task(self._delayed_save(self.commit_window))
+        # 本条记录已进入缓冲，之前的保存失败不会丢失它，只需报告错误
+        self._raise_save_error()
     
-    def get_progress_stats(self) -> Dict[str, Any]:
+    async def _delayed_save(self, delay: float) -> None:
         """
-        获取当前进度统计信息
+        等待组提交窗口后写出缓冲的全部状态变化
+        
+        Args:
+            delay: 窗口时长（秒）
+        """
+        try:
+            await asyncio.sleep(delay)
+            async with self.lock:
+                await self._flush_and_compact()
+        except Exception as e:
+            # 没有调用方等待这个任务，保留异常交给下一次update_progress/flush/close；
+            # 未写出的记录仍在缓冲区中，下次保存时重试
+            self._save_error = e
+        finally:
+            self._pending_save = None
+    
+    def _raise_save_error(self) -> None:
+        """抛出并清除后台保存记录的异常"""
+        error = self._save_error
+        if error is not None:
+            self._save_error = None
+            raise error
+    
+    async def _wait_pending_save(self) -> None:
+        """等待已安排的组提交完成"""
+        if self._pending_save is not None:
+            await self._pending_save
+    
+    async def _flush_and_compact(self) -> None:
+        """
+        写出缓冲的状态变化，必要时压缩为新快照（调用方需持有锁）
+        """
+        await self._flush_delta()
+        await self._maybe_compact()
+        self.last_save_count = self._completed_count + self._failed_count
+    
+    def start_flusher(self) -> None:
+        """
+        启动后台刷写任务，需在事件循环内调用
+        
+        启动后update_progress只把状态变化放入队列，由刷写任务每
+        auto_save_interval条或每flush_interval秒合并写入一次
+        """
+        if self._flusher_task is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._flusher_task = asyncio.create_task(self._flusher())
+    
+    def _drain_queue(self) -> bool:
+        """
+        将队列中已有的记录移入写缓冲
         
         Returns:
-            Dict: 包含进度统计的字典
+            bool: 是否取到了停止标记
         """
-        completed_count = len(self.completed_files)
-        failed_count = len(self.failed_files)
-        processed_count = completed_count + failed_count
+        stop = False
+        while True:
+            try:
+                record = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return stop
+            if record is None:
+                stop = True
+            else:
+                self._pending_delta.append(record)
+    
+    async def _flusher(self) -> None:
+        """
+        后台刷写循环：按条数或超时合并写入增量日志
         
-        stats = {
-            'completed_count': completed_count,
-            'failed_count': failed_count,
-            'processed_count': processed_count,
-            'total_files': self.total_files,
-            'remaining_count': max(0, self.total_files - processed_count),
-            'success_rate': (completed_count / processed_count * 100) if processed_count > 0 else 0,
-            'progress_percentage': (processed_count / self.total_files * 100) if self.total_files > 0 else 0,
-            'elapsed_time': time.time() - self.start_time
-        }
+        写入失败时不退出：未写出的记录留在缓冲区，异常交给下一次update_progress/flush，
+        之后只在超时或停止时重试，不再每来一条记录就重试一次
+        """
+        backoff = False
+        while True:
+            try:
+                record = await asyncio.wait_for(self._queue.get(), timeout=self.flush_interval)
+                timed_out = False
+            except asyncio.TimeoutError:
+                record = None
+                timed_out = True
+            
+            stop = record is None and not timed_out
+            if record is not None:
+                self._pending_delta.append(record)
+            stop = self._drain_queue() or stop
+            
+            if (stop or (timed_out and self._pending_delta)
+                    or (not backoff and len(self._pending_delta) >= self.auto_save_interval)):
+                try:
+                    async with self.lock:
+                        await self._flush_and_compact()
+                    backoff = False
+                except Exception as e:
+                    # 回溯中去掉刷写循环自身仍在运行的栈帧，
+                    # 调用方清理回溯(traceback.clear_frames)时不会终止刷写任务
+                    self._save_error = e.with_traceback(e.__traceback__.tb_next)
+                    backoff = True
+            if stop:
+                return
+    
+    async def flush(self) -> None:
+        """
+        立即写出队列和缓冲区中的全部状态变化
+        """
+        await self._wait_pending_save()
+        if self._queue is not None and self._drain_queue():
+            # 停止标记留给刷写任务处理
+            self._queue.put_nowait(None)
+        async with self.lock:
+            await self._flush_and_compact()
+        self._raise_save_error()
+    
+    async def _replay_delta(self) -> None:
+        """
+        将增量日志中的状态变化回放到已加载的快照上
+        """
+        self._delta_size = 0
+        if not os.path.exists(self.delta_file):
+            return
         
-        # 估算剩余时间
-        if processed_count > 0 and stats['remaining_count'] > 0:
-            avg_time_per_file = stats['elapsed_time'] / processed_count
-            stats['estimated_remaining_time'] = avg_time_per_file * stats['remaining_count']
-        else:
-            stats['estimated_remaining_time'] = 0
+        content = await self._run_io(_read_file, self.delta_file)
+        
+        for line in content.split(b'\n'):
+            try:
+                entry = loads_json(line)
+            except ValueError:
+                # 崩溃时可能留下不完整的末行，忽略即可
+                continue
+            file_path = entry.get('p')
+            if entry.get('op') == 'c':
+                self._set_status(file_path, STATUS_COMPLETED)
+            elif entry.get('op') == 'f':
+                self._set_status(file_path, STATUS_FAILED)
+        self._delta_size = len(content)
+    
+    async def _flush_delta(self) -> None:
+        """
+        将缓冲的状态变化追加写入增量日志（调用方需持有锁）
+        
+        写入成功后才从缓冲区移除记录，失败时记录保留到下一次保存重试
+        """
+        if not self._pending_delta:
+            return
+        
+        if self._delta_handle is None:
+            self._delta_handle = await self._run_io(open, self.delta_file, 'ab')
+        # 写入期间到达的记录追加在缓冲区末尾，只移除本次写出的部分
+        count = len(self._pending_delta)
+        data = b''.join(self._pending_delta)
+        if self._delta_torn:
+            data = b'\n' + data
+        try:
+            await self._run_io(_append_file, self._delta_handle, data)
+        except Exception:
+            # 丢弃句柄中未写出的缓冲，重试时重新打开并从新行开始
+            handle, self._delta_handle = self._delta_handle, None
+            self._delta_torn = True
+            try:
+                await self._run_io(handle.close)
+            except OSError:
+                pass
+            raise
+        self._delta_torn = False
+        del self._pending_delta[:count]
+        self._delta_size += len(data)
+    
+    async def _maybe_compact(self) -> None:
+        """
+        增量日志超过快照一半大小时，重写快照并清空增量日志（调用方需持有锁）
+        
+        每次完整快照后，下一次完整快照至少要再积累快照一半大小的增量，
+        快照间隔随进度按比例增长，整个任务的快照总开销与文件数成线性关系，
+        而不是每 auto_save_interval 个文件重写一次全部状态
+        """
+        if self._delta_size > self._base_size / 2:
+            await self._write_snapshot()
+    
+    async def _run_io(self, func, *args):
+        """
+        在检查点专用I/O线程中执行阻塞操作
+        
+        Args:
+            func: 阻塞函数
+            *args: 函数参数
             
+        Returns:
+            函数返回值
+        """
+        if self._io_exec is None:
+            self._io_exec = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ckpt-io')
+        return await asyncio.get_running_loop().run_in_executor(self._io_exec, func, *args)
+    
+    async def _close_delta_handle(self) -> None:
+        """关闭增量日志文件句柄"""
+        if self._delta_handle is not None:
+            await self._run_io(self._delta_handle.close)
+            self._delta_handle = None
+    
+    async def _truncate_delta(self) -> None:
+        """关闭并删除增量日志"""
+        await self._close_delta_handle()
+        _remove_if_exists(self.delta_file)
+        self._delta_size = 0
+        self._delta_torn = False
+    
+    async def close(self) -> None:
+        """
+        停止后台刷写任务，写出缓冲的状态变化，关闭增量日志文件和I/O线程
+        """
+        if self._flusher_task is not None:
+            self._queue.put_nowait(None)
+            await self._flusher_task
+            self._flusher_task = None
+            self._queue = None
+        await self._wait_pending_save()
+        
+        async with self.lock:
+            try:
+                await self._flush_delta()
+                await self._close_delta_handle()
+            finally:
+                if self._io_exec is not None:
+                    self._io_exec.shutdown(wait=False)
+                    self._io_exec = None
+        self._raise_save_error()
+    
+    def get_progress_stats(self) -> ProgressStats:
+        """
+        获取当前进度统计信息
+        
+        Returns:
+            ProgressStats: 复用的进度统计对象（支持字典式访问），
+                需要独立副本时调用 to_dict()
+        """
+        stats = self._stats
+        stats.completed_count = self._completed_count
+        stats.failed_count = self._failed_count
+        stats.total_files = self.total_files
+        stats.elapsed_time = time.monotonic() - self._start_monotonic
         return stats
     
     def should_skip_file(self, file_path: str, force_rerun: bool = False) -> bool:
@@ -195,10 +850,33 @@ class CheckpointManager:
             return False
             
         # 如果文件已经成功处理过，跳过
-        return file_path in self.completed_files
+        return self._status.get(file_path) == STATUS_COMPLETED
+    
+    def filter_pending_files(self, file_paths: Iterable[str], force_rerun: bool = False) -> List[str]:
+        """
+        批量筛选需要处理的文件，等价于对每个路径调用 should_skip_file
+        
+        扫描阶段一次性过滤全部候选路径，省去逐个方法调用的开销
+        
+        Args:
+            file_paths: 候选文件路径
+            force_rerun: 是否强制重新处理
+            
+        Returns:
+            List[str]: 未成功处理过的文件路径（保持原顺序）
+        """
+        if force_rerun or not self._completed_count:
+            return list(file_paths)
+        status_get = self._status.get
+        return [path for path in file_paths if status_get(path) != STATUS_COMPLETED]
     
     async def clear_checkpoint(self) -> None:
         """清除检查点文件"""
+        await self._wait_pending_save()
+        self._pending_delta.clear()
+        self._save_error = None
+        await self._truncate_delta()
+        _remove_if_exists(f"{self.checkpoint_file}.tmp")
         if os.path.exists(self.checkpoint_file):
             try:
                 os.remove(self.checkpoint_file)
@@ -207,26 +885,50 @@ class CheckpointManager:
                 print(f"{Fore.RED}❌ 清除检查点文件失败: {e}{Style.RESET_ALL}")
         
         # 重置内部状态
-        self.completed_files.clear()
-        self.failed_files.clear()
+        self._status.clear()
+        self._completed_count = 0
+        self._failed_count = 0
+        self._encoded = bytearray()
+        self._stale_records = 0
         self.total_files = 0
         self.last_save_count = 0
+        self._base_size = 0
         self.start_time = time.time()
+        self._start_monotonic = time.monotonic()
+        self._last_report = None
     
-    def print_progress_summary(self) -> None:
-        """打印进度摘要"""
+    def print_progress_summary(self, force: bool = False) -> None:
+        """
+        打印进度摘要
+        
+        Args:
+            force: 计数与上次打印相同时是否仍然打印（默认跳过）
+        """
         stats = self.get_progress_stats()
+        completed_count = stats.completed_count
+        failed_count = stats.failed_count
+        total_files = stats.total_files
+        
+        report_key = (completed_count, failed_count, total_files)
+        if not force and report_key == self._last_report:
+            return
+        self._last_report = report_key
         
-        print(f"\n{Fore.CYAN}📊 处理进度摘要{Style.RESET_ALL}")
-        print(f"  ✅ 已完成: {stats['completed_count']:,} 个文件")
-        print(f"  ❌ 失败: {stats['failed_count']:,} 个文件")
-        print(f"  📈 成功率: {stats['success_rate']:.1f}%")
-        print(f"  🎯 总进度: {stats['progress_percentage']:.1f}% ({stats['processed_count']:,}/{stats['total_files']:,})")
+        lines = [
+            f"\n{Fore.CYAN}📊 处理进度摘要{Style.RESET_ALL}",
+            f"  ✅ 已完成: {completed_count:,} 个文件",
+            f"  ❌ 失败: {failed_count:,} 个文件",
+            f"  📈 成功率: {stats.success_rate:.1f}%",
+            f"  🎯 总进度: {stats.progress_percentage:.1f}% ({completed_count + failed_count:,}/{total_files:,})",
+        ]
         
-        if stats['estimated_remaining_time'] > 0:
-            remaining_hours = stats['estimated_remaining_time'] / 3600
+        estimated_remaining_time = stats.estimated_remaining_time
+        if estimated_remaining_time > 0:
+            remaining_hours = estimated_remaining_time / 3600
             if remaining_hours > 1:
-                print(f"  ⏱️ 预计剩余时间: {remaining_hours:.1f} 小时")
+                lines.append(f"  ⏱️ 预计剩余时间: {remaining_hours:.1f} 小时")
             else:
-                remaining_minutes = stats['estimated_remaining_time'] / 60
-                print(f"  ⏱️ 预计剩余时间: {remaining_minutes:.1f} 分钟")
+                remaining_minutes = estimated_remaining_time / 60
+                lines.append(f"  ⏱️ 预计剩余时间: {remaining_minutes:.1f} 分钟")
+        
+        print('\n'.join(lines))
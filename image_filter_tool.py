@@ -3,18 +3,40 @@
 # -*- coding: utf-8 -*-
 
 import os
+import sys
+import errno
 import shutil
 import json
+import re
+import operator
 import argparse
 import logging
 import hashlib
+import mmap
+import tempfile
 import asyncio
-import aiofiles
-from typing import AsyncGenerator, Tuple, Dict, Any, List
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from tqdm.asyncio import tqdm
-from tqdm import tqdm as sync_tqdm
+import threading
+import time
+from collections import deque, namedtuple
+from typing import AsyncGenerator, AsyncIterator, Tuple, Dict, Any, List
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
 from colorama import init, Fore, Style
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+try:
+    import blake3
+    BLAKE3_AVAILABLE = True
+except ImportError:
+    BLAKE3_AVAILABLE = False
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
 
 # 导入批处理任务池
 try:
@@ -62,276 +84,698 @@ except ImportError:
                 "success_rate": success_rate
             }
 
-# 初始化colorama
-init(autoreset=True)
+# 仅当stdout是终端时才启用彩色输出并初始化colorama（不启用autoreset）。
+# 输出被重定向到日志文件或CI时不包装stdout/stderr，
+# 每次写入（包括tqdm刷新）都不经过colorama的ANSI解析
+USE_COLOR = sys.stdout is not None and sys.stdout.isatty()
+if USE_COLOR:
+    init()
+BLUE = Fore.BLUE if USE_COLOR else ''
+GREEN = Fore.GREEN if USE_COLOR else ''
+RESET = Style.RESET_ALL if USE_COLOR else ''
 
 # 支持的图片文件扩展名
 IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.gif', '.tiff', '.tif')
+# 小写扩展名集合，扫描时将扩展名转小写后做O(1)查找
+IMAGE_EXT_SET = frozenset(ext.lower() for ext in IMAGE_EXTENSIONS)
+
+# 文件落地方式：copy=完整复制，hardlink=硬链接，reflink=写时复制克隆，auto=依次尝试硬链接、克隆、复制
+LINK_MODES = ('copy', 'hardlink', 'reflink', 'auto')
+
+# JSON解析函数：orjson可用时使用其SIMD实现，两者都直接接受bytes
+# （orjson.JSONDecodeError是json.JSONDecodeError的子类，异常处理无需区分）
+_json_loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+
+# 目录扫描线程数：scandir在系统调用期间释放GIL，网络存储或磁盘阵列上并行扫描可掩盖单目录延迟
+DISCOVERY_WORKERS = 16
+
+# 文件I/O线程数：超过磁盘队列深度（NVMe约32~128）后更多线程只增加调度开销和栈内存
+MAX_IO_WORKERS = 128
+DEFAULT_IO_WORKERS = min((os.cpu_count() or 1) * 4, MAX_IO_WORKERS)
+
+# 每次投递给线程池的文件对数量上限：按批投递，摊薄事件循环往返和future创建开销
+PROCESS_BATCH_SIZE = 256
+
+# 分数比较运算符，与evaluate_conditions支持的OP一致
+SCORE_OPERATORS = {
+    '>': operator.gt,
+    '<': operator.lt,
+    '==': operator.eq,
+    '>=': operator.ge,
+    '<=': operator.le,
+}
+
+# 预过滤用的原始字节模式：未转义的键名及其后紧跟的字面量（非字面量时分组为None）
+PREFILTER_SCORE_PATTERN = re.compile(rb'"score"\s*:\s*(-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)?')
+PREFILTER_AI_PATTERN = re.compile(rb'"is_ai_generated"\s*:\s*(true|false)?')
+PREFILTER_WATERMARK_PATTERN = re.compile(rb'"watermark_present"\s*:\s*(true|false)?')
+
+# 复制文件时的缓冲大小：不小于此值的文件在支持时使用内核内复制（copy_file_range）
+COPY_BUFFER_SIZE = 1024 * 1024
+# 单次copy_file_range请求的最大字节数
+COPY_RANGE_CHUNK = 1 << 30
+
+# Linux ioctl FICLONE：在btrfs/XFS等写时复制文件系统上以O(1)克隆文件
+FICLONE = 0x40049409
+
+def scan_directory(dir_path, include_hidden=False):
+    """
+    使用os.scandir扫描单个目录（不递归），收集图片、JSON文件和子目录
+    
+    DirEntry自带文件类型信息，不需要额外stat；与os.walk一致，不进入指向目录的符号链接。
+    
+    Args:
+        dir_path: 目录路径
+        include_hidden: 是否包含以"."开头的隐藏子目录（如.git、.cache）
+        
+    Returns:
+        Tuple[list, dict, list]: ([(基础名, 图片路径)], {基础名: JSON路径}, [子目录路径])
+    """
+    images = []
+    jsons = {}
+    subdirs = []
+    try:
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if not entry.is_symlink() and (include_hidden or not entry.name.startswith('.')):
+                        subdirs.append(entry.path)
+                    continue
+                # 只切出并小写化扩展名部分；与os.path.splitext一致，开头的点不算扩展名分隔符
+                name = entry.name
+                dot = name.rfind('.')
+                if dot <= 0 or (name[0] == '.' and not name[:dot].lstrip('.')):
+                    continue
+                ext = name[dot:].lower()
+                if ext == '.json':
+                    jsons[name[:dot]] = entry.path
+                elif ext in IMAGE_EXT_SET:
+                    images.append((name[:dot], entry.path))
+    except OSError as e:
+        logging.warning(f"扫描目录时遇到错误: {e}")
+    return images, jsons, subdirs
 
-def find_image_json_pairs(source_dir):
+def scan_image_json_dirs(source_dir, include_hidden=False):
+    """
+    递归扫描目录，按目录产出图片与JSON文件的基础名映射
+    
+    每个目录只调用一次scandir，配对时只需集合查找，不再对每张图片调用os.path.exists。
+    
+    Args:
+        source_dir: 要扫描的源目录
+        include_hidden: 是否进入隐藏子目录
+        
+    Yields:
+        Tuple[str, list, dict]: (目录路径, [(基础名, 图片路径)], {基础名: JSON路径})
+    """
+    pending_dirs = [source_dir]
+    while pending_dirs:
+        dir_path = pending_dirs.pop()
+        images, jsons, subdirs = scan_directory(dir_path, include_hidden)
+        pending_dirs.extend(subdirs)
+        yield dir_path, images, jsons
+
+def find_image_json_pairs(source_dir, include_hidden=False):
     """
     递归扫描源目录，查找图片文件及其对应的JSON文件。
     
     Args:
         source_dir (str): 要扫描的源目录。
+        include_hidden (bool): 是否进入隐藏子目录。
         
     Returns:
         list: 包含(图片路径, JSON路径)元组的列表。
     """
     pairs = []
-    print(f"{Fore.BLUE}🔍 正在扫描源目录: {source_dir}...{Style.RESET_ALL}")
-    
-    all_files = []
-    for root, _, files in os.walk(source_dir):
-        for file in files:
-            all_files.append(os.path.join(root, file))
-
-    image_files = [f for f in all_files if f.lower().endswith(IMAGE_EXTENSIONS)]
-    
-    print(f"{Fore.GREEN}🖼️  发现 {len(image_files)} 张图片。正在匹配JSON文件...{Style.RESET_ALL}")
+    image_count = 0
+    print(f"{BLUE}🔍 正在扫描源目录: {source_dir}...{RESET}")
+
+    for _, images, jsons in scan_image_json_dirs(source_dir, include_hidden):
+        image_count += len(images)
+        for base_name, img_path in images:
+            json_path = jsons.get(base_name)
+            if json_path is not None:
+                pairs.append((img_path, json_path))
+            else:
+                logging.warning(f"图片 {img_path} 缺少对应的JSON文件，已跳过。")
 
-    for img_path in image_files:
-        json_path = os.path.splitext(img_path)[0] + '.json'
-        if os.path.exists(json_path):
-            pairs.append((img_path, json_path))
-        else:
-            logging.warning(f"图片 {img_path} 缺少对应的JSON文件，已跳过。")
-            
-    print(f"{Fore.GREEN}✅ 找到 {len(pairs)} 个有效的图片-JSON文件对。{Style.RESET_ALL}\n")
+    print(f"{GREEN}🖼️  发现 {image_count} 张图片。{RESET}")
+    print(f"{GREEN}✅ 找到 {len(pairs)} 个有效的图片-JSON文件对。{RESET}\n")
     return pairs
 
-async def discover_image_json_pairs_streaming(source_dir: str) -> AsyncGenerator[Tuple[str, str], None]:
+async def discover_image_json_pairs_streaming(
+    source_dir: str,
+    max_workers: int = DISCOVERY_WORKERS,
+    include_hidden: bool = False
+) -> AsyncGenerator[Tuple[str, str], None]:
     """
-    优化的流式发现图片-JSON文件对，消除嵌套循环
+    流式发现图片-JSON文件对
 
     优化特性:
-    - 单次os.walk遍历，使用字典映射避免重复搜索
-    - 预构建文件映射表，消除嵌套循环
-    - 实时yield有效文件对，支持流式处理
-    - 大幅减少字符串操作和文件系统访问
+    - 基于os.scandir的单次目录遍历，不对每个候选文件额外stat
+    - 多个目录在线程池中并行扫描（scandir在系统调用期间释放GIL），扫描不阻塞事件循环
+    - 每个目录内按基础名做字典查找配对，与文件列出顺序无关
+    - 实时yield有效文件对，同一目录的文件对连续产出
 
     Args:
         source_dir: 要扫描的源目录
+        max_workers: 并行扫描的线程数
+        include_hidden: 是否进入以"."开头的隐藏子目录
 
     Yields:
         Tuple[str, str]: (图片路径, JSON路径)
     """
-    # 预编译图片扩展名集合（包含大小写变体）
-    image_extensions = set()
-    for ext in IMAGE_EXTENSIONS:
-        image_extensions.add(ext.lower())
-        image_extensions.add(ext.upper())
-
+    loop = asyncio.get_running_loop()
     discovered_count = 0
 
-    try:
-        # 使用os.walk进行高效递归遍历
-        for root, dirs, files in os.walk(source_dir):
-            # 构建文件映射表，避免重复的splitext操作
-            file_map = {}  # base_name -> (full_path, extension)
-            json_bases = set()  # JSON文件的基础名集合
-            
-            # 单次遍历构建映射表
-            for file in files:
-                base_name, ext = os.path.splitext(file)
-                full_path = os.path.join(root, file)
-                
-                if ext in image_extensions:
-                    # 图片文件：存储到映射表
-                    file_map[base_name] = (full_path, ext)
-                elif ext.lower() == '.json':
-                    # JSON文件：添加到集合并检查是否有对应图片
-                    json_bases.add(base_name)
-                    if base_name in file_map:
-                        # 立即yield找到的配对
-                        img_path, _ = file_map[base_name]
-                        json_path = full_path
-                        discovered_count += 1
-                        yield img_path, json_path
-                        
-                        # 每发现100个文件就让出控制权，保持响应性
-                        if discovered_count % 100 == 0:
-                            await asyncio.sleep(0)
-
-            # 处理先遇到图片后遇到JSON的情况
-            for base_name, (img_path, _) in file_map.items():
-                if base_name in json_bases:
-                    continue  # 已经处理过
-                # 检查是否有对应的JSON文件
-                json_path = os.path.join(root, base_name + '.json')
-                if base_name + '.json' in [os.path.basename(f) for f in files if f.endswith('.json')]:
+    # 待扫描目录队列；同时在途的扫描任务数有上限，目录很多时也不会堆积大量future
+    pending_dirs = deque([source_dir])
+    in_flight = set()
+    max_in_flight = max_workers * 2
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='scan') as executor:
+        while pending_dirs or in_flight:
+            while pending_dirs and len(in_flight) < max_in_flight:
+                in_flight.add(loop.run_in_executor(executor, scan_directory, pending_dirs.popleft(), include_hidden))
+
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                images, jsons, subdirs = future.result()
+                pending_dirs.extend(subdirs)
+
+                for base_name, img_path in images:
+                    json_path = jsons.get(base_name)
+                    if json_path is None:
+                        continue
                     discovered_count += 1
                     yield img_path, json_path
-                    
+
                     # 每发现100个文件就让出控制权，保持响应性
                     if discovered_count % 100 == 0:
                         await asyncio.sleep(0)
 
-    except (PermissionError, OSError) as e:
-        logging.warning(f"扫描目录时遇到错误: {e}")
 
+# 侧车JSON一次读取的大小：绝大多数侧车文件远小于此，一次read即可读完
+SIDECAR_READ_SIZE = 64 * 1024
+
+def read_small_file(file_path: str) -> bytes:
+    """
+    以最少的系统调用读取小文件：open + read + close
+    
+    不经过Python的缓冲层（省去fstat/isatty和缓冲区拷贝），
+    普通文件的短读即表示已到文件末尾；超过SIDECAR_READ_SIZE时按fstat得到的大小一次读完剩余部分。
+    
+    Args:
+        file_path: 文件路径
+        
+    Returns:
+        bytes: 文件内容
+    """
+    fd = os.open(file_path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        data = os.read(fd, SIDECAR_READ_SIZE)
+        if len(data) < SIDECAR_READ_SIZE:
+            return data
+        # 大文件：按剩余大小一次读取（多请求1字节以确认到达末尾），文件仍在增长时继续读取
+        chunks = [data]
+        remaining = max(os.fstat(fd).st_size - len(data), 0) + 1
+        while True:
+            chunk = os.read(fd, remaining)
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+            remaining = SIDECAR_READ_SIZE
+    finally:
+        os.close(fd)
+
+# 哈希读取块大小：较大的块减少系统调用次数，让OpenSSL的SHA指令连续工作
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+
+# mmap哈希的映射窗口：超大文件按1GB分段映射，避免占用过多虚拟地址空间
+HASH_MMAP_WINDOW = 1024 * 1024 * 1024
+
+def _sha256_mmap(fd, size):
+    """将文件映射到内存，按窗口整段交给hashlib，C层一次处理整个窗口且期间释放GIL"""
+    sha256 = hashlib.sha256()
+    offset = 0
+    while offset < size:
+        length = min(HASH_MMAP_WINDOW, size - offset)
+        with mmap.mmap(fd, length, access=mmap.ACCESS_READ, offset=offset) as mm:
+            # 提示内核顺序访问并提前预读整个窗口
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            if hasattr(mmap, 'MADV_WILLNEED'):
+                mm.madvise(mmap.MADV_WILLNEED)
+            sha256.update(mm)
+        offset += length
+    return sha256.hexdigest()
 
 def get_file_sha256(file_path):
     """计算文件的SHA256哈希值，适用于大文件。"""
-    sha256 = hashlib.sha256()
     try:
-        with open(file_path, "rb") as f:
+        with open(file_path, "rb", buffering=0) as f:
+            size = os.fstat(f.fileno()).st_size
+            if size > 0:
+                try:
+                    return _sha256_mmap(f.fileno(), size)
+                except (ValueError, OSError):
+                    pass # 无法映射（如特殊文件），回退到流式读取
+
+            # 提示内核顺序读取，在哈希计算的同时预读后续数据
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            if hasattr(hashlib, 'file_digest'):
+                # Python 3.11+：整个读取-哈希循环在C层完成，期间释放GIL
+                return hashlib.file_digest(f, 'sha256').hexdigest()
+            sha256 = hashlib.sha256()
             while True:
-                # 读取1MB的数据块
-                data = f.read(1024 * 1024)
+                data = f.read(HASH_CHUNK_SIZE)
                 if not data:
                     break
                 sha256.update(data)
-        return sha256.hexdigest()
+            return sha256.hexdigest()
     except IOError:
         logging.error(f"无法读取文件进行哈希计算: {file_path}")
         return None
 
 async def get_file_sha256_async(file_path: str) -> str:
-    """异步计算文件的SHA256哈希值，适用于大文件。"""
-    sha256 = hashlib.sha256()
+    """异步计算文件的SHA256哈希值，整个文件在一次线程调度中完成。"""
+    return await asyncio.get_running_loop().run_in_executor(None, get_file_sha256, file_path)
+
+def get_file_hash(file_path):
+    """
+    计算用于平铺输出重命名的文件内容哈希（64位十六进制）。
+
+    安装了blake3时使用BLAKE3（mmap + SIMD多线程），否则回退到SHA256。
+
+    Args:
+        file_path (str): 文件路径。
+
+    Returns:
+        str: 十六进制哈希值，读取失败时返回None。
+    """
+    if not BLAKE3_AVAILABLE:
+        return get_file_sha256(file_path)
     try:
-        async with aiofiles.open(file_path, "rb") as f:
-            while True:
-                # 读取1MB的数据块
-                data = await f.read(1024 * 1024)
-                if not data:
-                    break
-                sha256.update(data)
-        return sha256.hexdigest()
-    except IOError:
-        logging.error(f"无法读取文件进行哈希计算: {file_path}")
-        return None
+        hasher = blake3.blake3(max_threads=blake3.blake3.AUTO)
+        hasher.update_mmap(file_path)
+        return hasher.hexdigest()
+    except (IOError, ValueError):
+        # 空文件无法mmap，回退到普通读取
+        try:
+            with open(file_path, "rb") as f:
+                return blake3.blake3(f.read()).hexdigest()
+        except IOError:
+            logging.error(f"无法读取文件进行哈希计算: {file_path}")
+            return None
+
+async def get_file_hash_async(file_path: str) -> str:
+    """异步计算平铺输出重命名用的文件哈希，在线程池中执行。"""
+    return await asyncio.get_running_loop().run_in_executor(None, get_file_hash, file_path)
+
+# 字段缺失哨兵：用dict.get代替热路径上的try/except KeyError
+_MISSING = object()
+
+# 缺少字段的文件按字段计数，运行结束时汇总输出一条警告，
+# 不再为每个文件格式化日志记录并争用日志处理器的锁
+_missing_field_counts = {}
+_missing_field_lock = threading.Lock()
+
+def _count_missing_field(key: str):
+    """记录一次字段缺失（线程安全）"""
+    with _missing_field_lock:
+        _missing_field_counts[key] = _missing_field_counts.get(key, 0) + 1
+
+def report_missing_fields():
+    """输出并清空字段缺失汇总，每个字段一条警告"""
+    with _missing_field_lock:
+        counts = sorted(_missing_field_counts.items())
+        _missing_field_counts.clear()
+    for key, count in counts:
+        logging.warning(f"{count} 个文件的JSON数据中缺少 '{key}' 字段，已跳过。")
+
+def _parse_score_condition(score_spec):
+    """
+    解析--score参数为分数比较函数
+    
+    Args:
+        score_spec: --score参数值，格式 'OP:VALUE' 或 'between:MIN:MAX'
+        
+    Returns:
+        Callable[[float], bool] 或 None（OP不支持时，与原逻辑一致不构成条件）
+        
+    Raises:
+        ValueError, IndexError: 参数格式无效
+    """
+    parts = score_spec.replace(' ', '').split(':')
+    op = parts[0]
 
-def evaluate_conditions(data, args):
+    if op == 'between':
+        min_val, max_val = float(parts[1]), float(parts[2])
+        return lambda score_val: min_val <= score_val <= max_val
+
+    val = float(parts[1])
+    compare = SCORE_OPERATORS.get(op)
+    if compare is None:
+        return None
+    return lambda score_val: compare(score_val, val)
+
+def _flag_condition(key, expected):
+    """构建布尔字段条件；字段缺失时返回None，表示整条记录判定失败"""
+    def condition(data):
+        value = data.get(key, _MISSING)
+        if value is _MISSING:
+            _count_missing_field(key)
+            return None
+        return bool(value) == expected
+    return condition
+
+def compile_predicate(args):
     """
-    根据传入的参数评估单个数据对象是否满足所有筛选条件。
+    将筛选参数编译为只接收数据字典的判断函数。
+    
+    参数在整个运行期间不变，分数条件的字符串解析只在这里做一次，
+    未指定的条件不会出现在生成的函数中。
     
     Args:
-        data (dict): 从JSON文件读取的数据。
         args (argparse.Namespace): 解析后的命令行参数。
         
     Returns:
-        bool: 如果满足条件则返回True，否则返回False。
+        Callable[[dict], bool]: 满足条件时返回True。
     """
+    use_and = args.logic == 'AND'
     conditions = []
-    
+
     # 1. 分数条件
     if args.score:
         try:
-            score_val = float(data.get('score', -1))
-            if score_val == -1:
-                raise KeyError
-                
-            parts = args.score.replace(' ', '').split(':')
-            op = parts[0]
-            
-            if op == 'between':
-                min_val, max_val = float(parts[1]), float(parts[2])
-                conditions.append(min_val <= score_val <= max_val)
-            else:
-                val = float(parts[1])
-                if op == '>': conditions.append(score_val > val)
-                elif op == '<': conditions.append(score_val < val)
-                elif op == '==': conditions.append(score_val == val)
-                elif op == '>=': conditions.append(score_val >= val)
-                elif op == '<=': conditions.append(score_val <= val)
+            score_check = _parse_score_condition(args.score)
         except (ValueError, IndexError):
             logging.error(f"无效的分数参数格式: {args.score}。已跳过此条件。")
-            conditions.append(False)
-        except KeyError:
-            logging.warning(f"JSON数据中缺少 'score' 字段。已跳过此文件。")
-            return False # 直接判定失败
+            score_check = lambda score_val: False
+        if score_check is None:
+            # OP不支持时不构成条件，用不影响组合结果的中性值代替
+            neutral = use_and and (args.is_ai is not None or args.has_watermark is not None)
+            score_check = lambda score_val: neutral
+
+        def score_condition(data):
+            try:
+                score_val = float(data.get('score', -1))
+            except ValueError:
+                return False
+            if score_val == -1:
+                _count_missing_field('score')
+                return None
+            return score_check(score_val)
+
+        conditions.append(score_condition)
 
     # 2. AI生成条件
     if args.is_ai is not None:
-        try:
-            ai_val = bool(data['is_ai_generated'])
-            expected_val = args.is_ai == 'true'
-            conditions.append(ai_val == expected_val)
-        except KeyError:
-            logging.warning(f"JSON数据中缺少 'is_ai_generated' 字段。已跳过此文件。")
-            return False
+        conditions.append(_flag_condition('is_ai_generated', args.is_ai == 'true'))
 
     # 3. 水印条件
     if args.has_watermark is not None:
-        try:
-            watermark_val = bool(data['watermark_present'])
-            expected_val = args.has_watermark == 'true'
-            conditions.append(watermark_val == expected_val)
-        except KeyError:
-            logging.warning(f"JSON数据中缺少 'watermark_present' 字段。已跳过此文件。")
-            return False
+        conditions.append(_flag_condition('watermark_present', args.has_watermark == 'true'))
 
     if not conditions:
-        return False # 如果没有任何筛选条件，则默认不匹配
+        return lambda data: False # 如果没有任何筛选条件，则默认不匹配
+
+    # 按逻辑关系生成专用函数，热路径上不再判断AND/OR；
+    # 条件返回None表示缺少字段，无论AND还是OR都直接判定失败
+    if len(conditions) == 1:
+        only_condition = conditions[0]
+        return lambda data: only_condition(data) is True
+
+    if use_and:
+        def predicate_and(data):
+            # 任一条件不满足（或缺少字段）立即返回
+            for condition in conditions:
+                if not condition(data):
+                    return False
+            return True
+        return predicate_and
+
+    def predicate_or(data):
+        # 与原逻辑一致，后续条件缺少字段时整条记录仍判定失败，因此不能在首个满足时提前返回
+        matched = False
+        for condition in conditions:
+            result = condition(data)
+            if result is None:
+                return False
+            if result:
+                matched = True
+        return matched
+
+    return predicate_or
+
+def evaluate_conditions(data, args):
+    """
+    根据传入的参数评估单个数据对象是否满足所有筛选条件。
+    
+    批量处理时应使用compile_predicate预先编译一次，这里保留逐次编译的入口以兼容旧调用。
+    
+    Args:
+        data (dict): 从JSON文件读取的数据。
+        args (argparse.Namespace): 解析后的命令行参数。
+        
+    Returns:
+        bool: 如果满足条件则返回True，否则返回False。
+    """
+    return compile_predicate(args)(data)
 
-    if args.logic == 'AND':
-        return all(conditions)
-    else: # OR
-        return any(conditions)
+def _prefilter_fails(pattern, content, holds):
+    """
+    判断原始字节中某个字段是否确定不满足条件
+    
+    同名键可能出现在嵌套对象中，只有所有出现处都是字面量且都不满足时才能确定失败。
+    
+    Returns:
+        bool: True表示确定失败，False表示无法判断
+    """
+    found = False
+    for match in pattern.finditer(content):
+        raw = match.group(1)
+        if raw is None or holds(raw):
+            return False
+        found = True
+    return found
 
-def process_image_sync(img_path: str, json_path: str, args) -> Dict[str, Any]:
+def build_prefilter(args):
     """
-    同步处理单个图片-JSON文件对，优化用于多线程环境
+    根据筛选参数构建JSON字节预过滤函数，先做廉价的字节扫描，能不解析就不解析
+    
+    返回的函数只在能确定记录不满足筛选条件时返回True；键缺失、值不是字面量等
+    无法判断的情况一律交给完整解析，不会误拒。要求键名未使用\\u转义。
+    
+    Args:
+        args (argparse.Namespace): 命令行参数
+        
+    Returns:
+        Callable[[bytes], bool] 或 None（没有可预判的条件时）
+    """
+    checks = []
+
+    if args.score:
+        try:
+            score_check = _parse_score_condition(args.score)
+        except (ValueError, IndexError):
+            score_check = None
+        if score_check is not None:
+            def score_holds(raw):
+                score_val = float(raw)
+                # -1视为缺少分数，直接判定失败
+                return score_val != -1 and score_check(score_val)
+            checks.append((PREFILTER_SCORE_PATTERN, score_holds))
+
+    if args.is_ai is not None:
+        expected_ai = args.is_ai.encode('ascii')
+        checks.append((PREFILTER_AI_PATTERN, lambda raw: raw == expected_ai))
+
+    if args.has_watermark is not None:
+        expected_watermark = args.has_watermark.encode('ascii')
+        checks.append((PREFILTER_WATERMARK_PATTERN, lambda raw: raw == expected_watermark))
+
+    if not checks:
+        return None
+
+    # AND：任一条件确定失败即可拒绝；OR：所有条件都确定失败才能拒绝
+    combine = any if args.logic == 'AND' else all
+
+    def rejects(content: bytes) -> bool:
+        return combine(_prefilter_fails(pattern, content, holds) for pattern, holds in checks)
+
+    return rejects
+
+# 工作线程所需的运行参数，启动时从argparse.Namespace提取一次，
+# 热路径上按元组下标访问，不再逐文件查找Namespace属性。
+# source_prefix/dest_prefix是带结尾分隔符的源/目标目录，落地路径直接切片拼接得到
+WorkerConfig = namedtuple('WorkerConfig', 'source dest flat_output dry_run predicate prefilter link_mode same_device '
+                                          'source_prefix dest_prefix')
+
+def build_worker_config(args) -> WorkerConfig:
+    """
+    从命令行参数构建工作线程配置，同时编译筛选条件与字节预过滤
+    
+    Args:
+        args: 命令行参数；已是WorkerConfig时原样返回
+        
+    Returns:
+        WorkerConfig: 工作线程配置
+    """
+    if isinstance(args, WorkerConfig):
+        return args
+    return WorkerConfig(
+        source=args.source,
+        dest=args.dest,
+        flat_output=args.flat_output,
+        dry_run=args.dry_run,
+        predicate=compile_predicate(args),
+        prefilter=build_prefilter(args),
+        link_mode=getattr(args, 'link_mode', 'copy'),
+        same_device=getattr(args, 'same_device', True),
+        # 扫描得到的路径由源目录字面值拼接而来，因此前缀也取字面值而非normpath
+        source_prefix=os.path.join(args.source, ''),
+        dest_prefix=os.path.join(args.dest, ''),
+    )
+
+# 处理状态码：批处理热路径上以整数代替字符串标签，计数直接按下标累加。
+# COPIED/SKIPPED/ERROR同时是计数列表的下标；MATCHED只是评估阶段的中间状态
+COPIED, SKIPPED, ERROR, MATCHED = 0, 1, 2, 3
+STATUS_NAMES = ('copied', 'skipped', 'error', 'matched')
+_STATUS_DETAILS = ('成功复制', '不满足筛选条件', '处理失败，详见日志', '满足筛选条件')
+
+def _status_result(status: int, path: str) -> Dict[str, Any]:
+    """将状态码转换为兼容旧接口的结果字典"""
+    return {"status": STATUS_NAMES[status], "path": path, "details": _STATUS_DETAILS[status]}
+
+def evaluate_sidecar_status(json_path: str, cfg: WorkerConfig) -> int:
+    """
+    读取侧车JSON并评估筛选条件，不落地任何文件
     
     Args:
-        img_path: 图片文件路径
         json_path: JSON文件路径
-        args: 命令行参数
+        cfg: 工作线程配置（由build_worker_config构建）
         
     Returns:
-        Dict: 处理结果 {"status": str, "path": str, "details": str}
+        int: MATCHED、SKIPPED或ERROR
     """
     try:
-        # 同步读取JSON文件
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        if evaluate_conditions(data, args):
-            if not args.dry_run:
-                if args.flat_output:
-                    # 平铺输出模式：使用SHA256重命名并复制到根目录
-                    img_hash = get_file_sha256(img_path)
-                    if not img_hash:
-                        return {"status": "error", "path": img_path, "details": "哈希计算失败"}
+        # 以字节读取JSON文件，省去解码为str的开销
+        content = read_small_file(json_path)
 
-                    _, img_ext = os.path.splitext(img_path)
-                    
-                    dest_img_path = os.path.join(args.dest, f"{img_hash}{img_ext}")
-                    dest_json_path = os.path.join(args.dest, f"{img_hash}.json")
-                    
-                    # 仅创建目标根目录（线程安全）
-                    os.makedirs(args.dest, exist_ok=True)
-                    
-                    # 同步复制文件
-                    shutil.copy2(img_path, dest_img_path)
-                    shutil.copy2(json_path, dest_json_path)
+        # 字节预过滤：确定不满足条件的记录直接跳过，免去JSON解析
+        if cfg.prefilter is not None and cfg.prefilter(content):
+            return SKIPPED
 
-                else:
-                    # 默认模式：保持目录结构
-                    relative_path = os.path.relpath(img_path, args.source)
-                    dest_img_path = os.path.join(args.dest, relative_path)
-                    dest_json_path = os.path.splitext(dest_img_path)[0] + '.json'
-                    
-                    # 创建目标目录（线程安全）
-                    dest_dir = os.path.dirname(dest_img_path)
-                    if dest_dir:
-                        os.makedirs(dest_dir, exist_ok=True)
-                    
-                    # 同步复制文件
-                    shutil.copy2(img_path, dest_img_path)
-                    shutil.copy2(json_path, dest_json_path)
+        return MATCHED if cfg.predicate(_json_loads(content)) else SKIPPED
 
-            return {"status": "copied", "path": img_path, "details": "成功复制"}
-        else:
-            return {"status": "skipped", "path": img_path, "details": "不满足筛选条件"}
-            
     except json.JSONDecodeError:
-        return {"status": "error", "path": json_path, "details": "JSON格式错误"}
+        logging.error(f"JSON格式错误: {json_path}")
+        return ERROR
+    except Exception as e:
+        logging.error(f"处理 {json_path} 时发生未知错误: {e}")
+        return ERROR
+
+def _destination_paths(img_path: str, cfg: WorkerConfig, img_hash: str = None) -> Tuple[str, str, str]:
+    """
+    计算文件对的落地路径，只做字符串切片与拼接，不逐文件调用os.path
+    
+    Args:
+        img_path: 图片文件路径（扫描阶段已保证带扩展名）
+        cfg: 工作线程配置
+        img_hash: 平铺输出模式下的内容哈希；为None时保持目录结构
+        
+    Returns:
+        Tuple[str, str, str]: (目标图片路径, 目标JSON路径, 目标目录)
+    """
+    if img_hash is not None:
+        # 平铺输出：以内容哈希命名，全部放在目标根目录；最后一个点即扩展名起点
+        img_ext = img_path[img_path.rfind('.'):]
+        return cfg.dest_prefix + img_hash + img_ext, cfg.dest_prefix + img_hash + '.json', cfg.dest
+
+    # 扫描路径均以源目录前缀开头，切片即得相对路径；其他来源的路径退回relpath
+    if img_path.startswith(cfg.source_prefix):
+        relative_path = img_path[len(cfg.source_prefix):]
+    else:
+        relative_path = os.path.relpath(img_path, cfg.source)
+    dest_img_path = cfg.dest_prefix + relative_path
+    dest_json_path = dest_img_path[:dest_img_path.rfind('.')] + '.json'
+    return dest_img_path, dest_json_path, dest_img_path[:dest_img_path.rfind(os.sep)]
+
+def place_pair_status(img_path: str, json_path: str, cfg: WorkerConfig) -> int:
+    """
+    将满足条件的图片-JSON文件对落地到目标目录（模拟运行时不做任何操作）
+    
+    Args:
+        img_path: 图片文件路径
+        json_path: JSON文件路径
+        cfg: 工作线程配置
+        
+    Returns:
+        int: COPIED或ERROR
+    """
+    try:
+        if not cfg.dry_run:
+            if cfg.flat_output:
+                # 平铺输出模式：使用内容哈希重命名并复制到根目录
+                img_hash = get_file_hash(img_path)
+                if not img_hash:
+                    # 失败原因已由get_file_hash记录
+                    return ERROR
+            else:
+                # 默认模式：保持目录结构
+                img_hash = None
+
+            dest_img_path, dest_json_path, dest_dir = _destination_paths(img_path, cfg, img_hash)
+
+            # 创建目标目录（线程安全，每个目录只创建一次；平铺输出时只是缓存命中）
+            ensure_dir(dest_dir)
+
+            # 同步落地文件（按link_mode链接、克隆或复制）
+            transfer_file(img_path, dest_img_path, cfg.link_mode, cfg.same_device)
+            transfer_file(json_path, dest_json_path, cfg.link_mode, cfg.same_device)
+
+        return COPIED
+
     except Exception as e:
         logging.error(f"处理 {img_path} 时发生未知错误: {e}")
-        return {"status": "error", "path": img_path, "details": str(e)}
+        return ERROR
+
+def evaluate_sidecar_sync(img_path: str, json_path: str, cfg: WorkerConfig) -> Dict[str, Any]:
+    """
+    读取侧车JSON并评估筛选条件（返回结果字典，兼容旧接口）
+    
+    Returns:
+        Dict: {"status": "matched"/"skipped"/"error", "path": str, "details": str}
+    """
+    return _status_result(evaluate_sidecar_status(json_path, cfg), img_path)
+
+def place_pair_sync(img_path: str, json_path: str, cfg: WorkerConfig) -> Dict[str, Any]:
+    """
+    落地满足条件的图片-JSON文件对（返回结果字典，兼容旧接口）
+    
+    Returns:
+        Dict: {"status": "copied"/"error", "path": str, "details": str}
+    """
+    return _status_result(place_pair_status(img_path, json_path, cfg), img_path)
+
+def process_image_sync(img_path: str, json_path: str, cfg: WorkerConfig) -> Dict[str, Any]:
+    """
+    同步处理单个图片-JSON文件对，优化用于多线程环境
+    
+    Args:
+        img_path: 图片文件路径
+        json_path: JSON文件路径
+        cfg: 工作线程配置（由build_worker_config构建）
+        
+    Returns:
+        Dict: 处理结果 {"status": str, "path": str, "details": str}
+    """
+    status = evaluate_sidecar_status(json_path, cfg)
+    if status == MATCHED:
+        status = place_pair_status(img_path, json_path, cfg)
+    return _status_result(status, img_path)
 
 def process_image(img_path, json_path, args):
     """
@@ -345,63 +789,52 @@ def process_image(img_path, json_path, args):
     Returns:
         tuple: (状态, 文件路径)
     """
-    result = process_image_sync(img_path, json_path, args)
+    result = process_image_sync(img_path, json_path, build_worker_config(args))
     return result["status"], result["path"]
 
-async def process_image_async(img_path: str, json_path: str, args) -> Dict[str, Any]:
+async def process_image_async(img_path: str, json_path: str, cfg: WorkerConfig) -> Dict[str, Any]:
     """
     异步处理单个图片-JSON文件对
 
     Args:
         img_path: 图片文件路径
         json_path: JSON文件路径
-        args: 命令行参数
+        cfg: 工作线程配置（由build_worker_config构建）
 
     Returns:
         Dict: 处理结果 {"status": str, "path": str, "details": str}
     """
     try:
-        # 使用aiofiles异步读取JSON文件
-        async with aiofiles.open(json_path, 'r', encoding='utf-8') as f:
-            content = await f.read()
-            data = json.loads(content)
-
-        if evaluate_conditions(data, args):
-            if not args.dry_run:
-                if args.flat_output:
-                    # 平铺输出模式：使用SHA256重命名并复制到根目录
-                    img_hash = await get_file_sha256_async(img_path)
-                    if not img_hash:
-                        return {"status": "error", "path": img_path, "details": "哈希计算失败"}
-
-                    _, img_ext = os.path.splitext(img_path)
-
-                    dest_img_path = os.path.join(args.dest, f"{img_hash}{img_ext}")
-                    dest_json_path = os.path.join(args.dest, f"{img_hash}.json")
+        # 在线程池中读取JSON文件（字节）
+        content = await asyncio.get_running_loop().run_in_executor(None, read_small_file, json_path)
 
-                    # 仅创建目标根目录
-                    os.makedirs(args.dest, exist_ok=True)
+        # 字节预过滤：确定不满足条件的记录直接跳过，免去JSON解析
+        if cfg.prefilter is not None and cfg.prefilter(content):
+            return {"status": "skipped", "path": img_path, "details": "不满足筛选条件"}
 
-                    # 异步复制文件
-                    await asyncio.gather(
-                        copy_file_async(img_path, dest_img_path),
-                        copy_file_async(json_path, dest_json_path)
-                    )
+        data = _json_loads(content)
 
+        if cfg.predicate(data):
+            if not cfg.dry_run:
+                if cfg.flat_output:
+                    # 平铺输出模式：使用内容哈希重命名并复制到根目录
+                    img_hash = await get_file_hash_async(img_path)
+                    if not img_hash:
+                        return {"status": "error", "path": img_path, "details": "哈希计算失败"}
                 else:
                     # 默认模式：保持目录结构
-                    relative_path = os.path.relpath(img_path, args.source)
-                    dest_img_path = os.path.join(args.dest, relative_path)
-                    dest_json_path = os.path.splitext(dest_img_path)[0] + '.json'
+                    img_hash = None
 
-                    # 创建目标目录
-                    os.makedirs(os.path.dirname(dest_img_path), exist_ok=True)
+                dest_img_path, dest_json_path, dest_dir = _destination_paths(img_path, cfg, img_hash)
 
-                    # 异步复制文件
-                    await asyncio.gather(
-                        copy_file_async(img_path, dest_img_path),
-                        copy_file_async(json_path, dest_json_path)
-                    )
+                # 创建目标目录（每个目录只创建一次；平铺输出时只是缓存命中）
+                ensure_dir(dest_dir)
+
+                # 异步复制文件
+                await asyncio.gather(
+                    copy_file_async(img_path, dest_img_path, cfg.link_mode, cfg.same_device),
+                    copy_file_async(json_path, dest_json_path, cfg.link_mode, cfg.same_device)
+                )
 
             return {"status": "copied", "path": img_path, "details": "成功复制"}
         else:
@@ -413,16 +846,197 @@ async def process_image_async(img_path: str, json_path: str, args) -> Dict[str,
         logging.error(f"处理 {img_path} 时发生未知错误: {e}")
         return {"status": "error", "path": img_path, "details": str(e)}
 
-async def copy_file_async(src_path: str, dest_path: str):
-    """异步复制文件"""
+# 已创建的目标目录缓存：每个目录只调用一次os.makedirs，避免逐文件stat
+_mkdir_cache = set()
+_mkdir_lock = threading.Lock()
+
+def ensure_dir(dir_path: str):
+    """
+    确保目录存在，同一目录在进程内只创建一次（线程安全）
+    
+    Args:
+        dir_path: 目录路径，为空时不做任何操作
+    """
+    if not dir_path or dir_path in _mkdir_cache:
+        return
+    with _mkdir_lock:
+        if dir_path not in _mkdir_cache:
+            os.makedirs(dir_path, exist_ok=True)
+            _mkdir_cache.add(dir_path)
+
+def is_same_device(source_dir: str, dest_dir: str) -> bool:
+    """
+    判断源目录与目标目录是否位于同一文件系统（目标目录不存在时检查最近的已存在父目录）
+
+    Args:
+        source_dir: 源目录
+        dest_dir: 目标目录
+
+    Returns:
+        bool: 同一设备返回True
+    """
+    dest_probe = os.path.abspath(dest_dir)
+    while not os.path.exists(dest_probe):
+        parent = os.path.dirname(dest_probe)
+        if parent == dest_probe:
+            return False
+        dest_probe = parent
     try:
-        async with aiofiles.open(src_path, 'rb') as src:
-            async with aiofiles.open(dest_path, 'wb') as dest:
-                while True:
-                    chunk = await src.read(1024 * 1024)  # 1MB chunks
-                    if not chunk:
-                        break
-                    await dest.write(chunk)
+        return os.stat(source_dir).st_dev == os.stat(dest_probe).st_dev
+    except OSError:
+        return False
+
+def reflink_file(src_path: str, dest_path: str):
+    """
+    通过FICLONE创建写时复制克隆，仅复制元数据
+
+    先克隆到目标目录下的临时文件再原子替换目标路径：已有的目标文件
+    （例如之前以硬链接落地、与源文件是同一inode）在克隆成功前不会被打开或截断，
+    克隆失败时目标文件与源文件都保持原样。目标就是源文件本身时不做任何操作。
+
+    Args:
+        src_path: 源文件路径
+        dest_path: 目标文件路径
+
+    Raises:
+        OSError: 平台或文件系统不支持克隆
+    """
+    if not FCNTL_AVAILABLE:
+        raise OSError("当前平台不支持reflink")
+    with open(src_path, 'rb') as src:
+        src_stat = os.fstat(src.fileno())
+        try:
+            dest_stat = os.stat(dest_path)
+        except FileNotFoundError:
+            pass
+        else:
+            if (dest_stat.st_dev, dest_stat.st_ino) == (src_stat.st_dev, src_stat.st_ino):
+                return
+
+        temp_fd, temp_path = tempfile.mkstemp(
+            prefix='.' + os.path.basename(dest_path) + '.',
+            suffix='.tmp',
+            dir=os.path.dirname(dest_path) or '.'
+        )
+        try:
+            try:
+                fcntl.ioctl(temp_fd, FICLONE, src.fileno())
+            finally:
+                os.close(temp_fd)
+            shutil.copystat(src_path, temp_path)
+            os.replace(temp_path, dest_path)
+        except BaseException:
+            # 克隆失败时只删除临时文件
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+def _write_all(fd, data):
+    """将数据完整写入文件描述符（处理部分写入）"""
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+def _copy_fd(src_fd, dest_fd, size):
+    """
+    在两个文件描述符之间复制全部剩余内容
+    
+    大文件优先使用copy_file_range在内核内复制；不支持时（非Linux、跨文件系统等）
+    从当前偏移继续用read/write复制。
+    """
+    if size >= COPY_BUFFER_SIZE and hasattr(os, 'copy_file_range'):
+        try:
+            while os.copy_file_range(src_fd, dest_fd, COPY_RANGE_CHUNK):
+                pass
+            return
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+
+    while True:
+        chunk = os.read(src_fd, COPY_BUFFER_SIZE)
+        if not chunk:
+            return
+        _write_all(dest_fd, chunk)
+
+def fast_copy(src_path: str, dest_path: str):
+    """
+    复制文件内容并保留访问/修改时间
+    
+    与shutil.copy2相比省去了samefile的两次stat以及copystat中的权限、标志位和扩展属性调用，
+    只额外调用一次utime；目标文件按umask创建权限。目标就是源文件本身时不做任何操作。
+    
+    Args:
+        src_path: 源文件路径
+        dest_path: 目标文件路径
+    """
+    binary_flag = getattr(os, 'O_BINARY', 0)
+    src_fd = os.open(src_path, os.O_RDONLY | binary_flag)
+    try:
+        src_stat = os.fstat(src_fd)
+        # 不带O_TRUNC打开，先确认不是同一文件再截断，避免清空源文件
+        dest_fd = os.open(dest_path, os.O_WRONLY | os.O_CREAT | binary_flag, 0o666)
+        try:
+            dest_stat = os.fstat(dest_fd)
+            if (dest_stat.st_dev, dest_stat.st_ino) == (src_stat.st_dev, src_stat.st_ino):
+                return
+            if dest_stat.st_size:
+                os.ftruncate(dest_fd, 0)
+            _copy_fd(src_fd, dest_fd, src_stat.st_size)
+            times = (src_stat.st_atime_ns, src_stat.st_mtime_ns)
+            if os.utime in os.supports_fd:
+                os.utime(dest_fd, ns=times)
+            else:
+                os.utime(dest_path, ns=times)
+        finally:
+            os.close(dest_fd)
+    finally:
+        os.close(src_fd)
+
+def transfer_file(src_path: str, dest_path: str, link_mode: str = 'auto', same_device: bool = True):
+    """
+    按指定方式把源文件落地到目标路径
+
+    Args:
+        src_path: 源文件路径
+        dest_path: 目标文件路径
+        link_mode: LINK_MODES之一；hardlink/reflink失败时直接报错，auto失败时逐级回退
+        same_device: 源与目标是否在同一文件系统，不同时跳过链接和克隆尝试
+    """
+    if link_mode in ('hardlink', 'auto') and same_device:
+        try:
+            os.link(src_path, dest_path)
+            return
+        except FileExistsError:
+            # 目标已存在：已是同一文件则无需处理，否则由后续方式覆盖
+            if os.path.samefile(src_path, dest_path):
+                return
+        except OSError:
+            if link_mode == 'hardlink':
+                raise
+
+    if link_mode in ('reflink', 'auto') and same_device:
+        try:
+            reflink_file(src_path, dest_path)
+            return
+        except OSError:
+            if link_mode == 'reflink':
+                raise
+
+    if link_mode in ('hardlink', 'reflink') and not same_device:
+        raise OSError(f"源与目标不在同一文件系统，无法使用 {link_mode}")
+
+    fast_copy(src_path, dest_path)
+
+async def copy_file_async(src_path: str, dest_path: str, link_mode: str = 'auto', same_device: bool = True):
+    """异步复制文件（在线程池中执行硬链接、克隆或内核级复制）"""
+    try:
+        await asyncio.get_running_loop().run_in_executor(
+            None, transfer_file, src_path, dest_path, link_mode, same_device
+        )
     except Exception as e:
         logging.error(f"复制文件失败 {src_path} -> {dest_path}: {e}")
         raise
@@ -471,103 +1085,213 @@ def setup_parser():
     
     # 控制参数
     parser.add_argument('--logic', type=str, choices=['AND', 'OR'], default='AND', help="多个筛选条件之间的逻辑关系 (默认: AND)。")
-    parser.add_argument('--workers', type=int, default=os.cpu_count() * 4, help='并行处理的线程数量 (默认: CPU核心数*4，最多16384个线程)。')
-    parser.add_argument('--dry-run', action='store_true', help='模拟运行，只打印操作信息而不实际复制文件。')
-    parser.add_argument('--flat-output', action='store_true', help='将所有文件复制到目标目录的根级别，并以SHA256重命名。')
+    parser.add_argument('--workers', type=int, default=DEFAULT_IO_WORKERS, help=f'并行处理的线程数量 (默认: CPU核心数*4，最多{MAX_IO_WORKERS}个线程)。')
+    parser.add_argument('--dry-run', action='store_true', help='模拟运行，只输出匹配的图片路径而不实际复制文件。')
+    parser.add_argument('--flat-output', action='store_true', help='将所有文件复制到目标目录的根级别，并以内容哈希重命名\n(安装blake3时为BLAKE3，否则为SHA256)。')
     parser.add_argument('--log-file', type=str, default='filter_log.txt', help='指定日志文件的路径 (默认: filter_log.txt)。')
+    parser.add_argument('--include-hidden', action='store_true', help='扫描时也进入以"."开头的隐藏目录（如.git、.cache），默认跳过。')
+    parser.add_argument('--link-mode', type=str, choices=LINK_MODES, default='auto',
+                        help="文件落地方式 (默认: auto)。\n"
+                             "copy: 完整复制; hardlink: 硬链接(需同一文件系统);\n"
+                             "reflink: 写时复制克隆(btrfs/XFS等); auto: 依次尝试硬链接、克隆、复制。\n"
+                             "注意: 硬链接与源文件共享数据，修改其中一个会影响另一个。")
     
     return parser
 
-async def process_images_threaded(
-    image_pairs: List[Tuple[str, str]],
+def process_batch_sync(pairs: List[Tuple[str, str]], cfg: WorkerConfig) -> Tuple[List[int], List[str]]:
+    """
+    在单个线程中处理一批图片-JSON文件对，先评估全部侧车JSON再集中落地，只返回状态计数
+    
+    Args:
+        pairs: 图片-JSON文件对列表
+        cfg: 工作线程配置
+        
+    Returns:
+        Tuple[List[int], List[str]]: ([成功数, 跳过数, 失败数], 模拟运行时匹配的图片路径)
+    """
+    # 按状态码下标计数，按批返回定长计数列表，汇总时每批只需三次加法
+    counts = [0, 0, 0]
+    matched = []
+
+    # 第一阶段：连续读取并评估本批次全部侧车JSON，小文件读取集中进行，不与大文件复制交替
+    to_place = []
+    for img_path, json_path in pairs:
+        status = evaluate_sidecar_status(json_path, cfg)
+        if status == MATCHED:
+            to_place.append((img_path, json_path))
+        else:
+            counts[status] += 1
+
+    # 第二阶段：集中落地满足条件的文件对
+    for img_path, json_path in to_place:
+        status = place_pair_status(img_path, json_path, cfg)
+        counts[status] += 1
+        if cfg.dry_run and status == COPIED:
+            matched.append(img_path)
+    return counts, matched
+
+def write_matched_paths(paths: List[str]):
+    """
+    模拟运行时整批输出匹配的图片路径，一次写入代替逐文件print
+    
+    Args:
+        paths: 图片路径列表
+    """
+    # 暂时清除进度条，避免与输出交错
+    with tqdm.external_write_mode():
+        sys.stdout.flush()
+        buffer = getattr(sys.stdout, 'buffer', None)
+        if buffer is not None:
+            buffer.write(b'\n'.join(map(os.fsencode, paths)) + b'\n')
+            buffer.flush()
+        else:
+            sys.stdout.write('\n'.join(paths) + '\n')
+
+async def process_images_streaming(
+    pair_stream: AsyncIterator[Tuple[str, str]],
     args,
-    max_workers: int = None
+    max_workers: int = None,
+    total: int = None
 ) -> Dict[str, int]:
     """
-    使用线程池处理图片文件对，优化I/O密集型操作
+    边发现边处理图片文件对，文件对不在内存中整体驻留
+
+    生产者协程把文件对按批放入有界队列，工作协程取出整批投递到线程池。
+    队列为空（有线程空闲）时立即投递当前批次，否则攒满一批再投递。
 
     Args:
-        image_pairs: 图片-JSON文件对列表
-        args: 命令行参数
-        max_workers: 最大线程数，默认为CPU核心数*4
+        pair_stream: 产出(图片路径, JSON路径)的异步迭代器
+        args: 命令行参数或已构建的WorkerConfig
+        max_workers: 最大线程数，默认为CPU核心数*4，不超过MAX_IO_WORKERS
+        total: 文件对总数；未知时为None，发现结束后再补上进度条总数
 
     Returns:
         Dict[str, int]: 处理结果统计
     """
-    if not image_pairs:
-        return {'copied': 0, 'skipped': 0, 'error': 0}
-
-    # 智能设置线程数：I/O密集型操作使用更多线程
+    # 线程数超过磁盘队列深度后只增加调度开销，上限MAX_IO_WORKERS
     if max_workers is None:
-        max_workers = min(os.cpu_count() * 4, 16384)  # 最多16384个线程
-    
-    print(f"THREADS: {max_workers} workers")
+        max_workers = DEFAULT_IO_WORKERS
+    max_workers = max(1, min(max_workers, MAX_IO_WORKERS))
 
-    # 初始化计数器
-    success_count = 0
-    skip_count = 0
-    error_count = 0
-    results = []
+    # 运行参数只提取一次，工作线程拿到的是不可变的WorkerConfig
+    cfg = build_worker_config(args)
+    # 模拟运行时标准输出只输出匹配的图片路径
+    out = sys.stderr if cfg.dry_run else sys.stdout
 
-    # 使用ThreadPoolExecutor处理I/O密集型任务
+    print(f"THREADS: {max_workers} workers", file=out)
+
+    # 初始化计数器（按状态码下标累加）
+    totals = [0, 0, 0]
+    loop = asyncio.get_running_loop()
+
+    # 批大小：总数已知且较少时缩小批次，保证每个线程都能分到多批任务
+    batch_size = PROCESS_BATCH_SIZE
+    if total is not None:
+        batch_size = max(1, min(PROCESS_BATCH_SIZE, total // (max_workers * 4)))
+
+    # 有界队列：发现快于处理时生产者在此等待，内存中最多驻留约2倍线程数的批次
+    batch_queue = asyncio.Queue(maxsize=max_workers * 2)
+
+    # 固定大小的线程池 + 同等数量的工作协程，同时在途的批次数不超过线程数
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # 提交所有任务
-        future_to_pair = {
-            executor.submit(process_image_sync, img_path, json_path, args): (img_path, json_path)
-            for img_path, json_path in image_pairs
-        }
-
-        # 使用tqdm显示处理进度
-        with sync_tqdm(total=len(image_pairs), desc="PROCESS", unit="pairs", ncols=80) as pbar:
-            # 使用as_completed获取完成的任务，避免轮询
-            for future in as_completed(future_to_pair):
+        # 使用tqdm显示处理进度：按批更新，最多每0.5秒重绘一次
+        with tqdm(total=total, desc="PROCESS", unit="pairs", ncols=80, mininterval=0.5) as pbar:
+            # 进度条后缀最多每秒格式化一次
+            postfix_time = 0.0
+
+            def update_postfix():
+                nonlocal postfix_time
+                postfix_time = time.monotonic()
+                pbar.set_postfix_str(
+                    f"成功={totals[COPIED]}，跳过={totals[SKIPPED]}，失败={totals[ERROR]}",
+                    refresh=False
+                )
+
+            async def producer():
+                discovered_count = 0
+                batch = []
                 try:
-                    result = future.result()
-                    results.append(result)
+                    async for pair in pair_stream:
+                        batch.append(pair)
+                        discovered_count += 1
+                        if len(batch) >= batch_size or batch_queue.empty():
+                            await batch_queue.put(batch)
+                            batch = []
+                    if batch:
+                        await batch_queue.put(batch)
+                finally:
+                    # 每个工作协程一个结束标记
+                    for _ in range(max_workers):
+                        await batch_queue.put(None)
+
+                # 发现结束，补上进度条总数
+                if pbar.total is None:
+                    pbar.total = discovered_count
+                    pbar.refresh()
+
+            async def worker():
+                while True:
+                    batch = await batch_queue.get()
+                    if batch is None:
+                        break
+                    counts, matched = await loop.run_in_executor(executor, process_batch_sync, batch, cfg)
+                    if matched:
+                        write_matched_paths(matched)
 
                     # 更新计数器
-                    status = result.get("status", "unknown")
-                    if status == "copied":
-                        success_count += 1
-                    elif status == "skipped":
-                        skip_count += 1
-                    else:
-                        error_count += 1
-
-                    # 更新进度条
-                    pbar.update(1)
-                    pbar.set_postfix_str(f"成功={success_count}，跳过={skip_count}，失败={error_count}")
-
-                except Exception as e:
-                    # 处理任务异常
-                    img_path, json_path = future_to_pair[future]
-                    error_result = {
-                        "status": "error",
-                        "path": img_path,
-                        "details": f"线程执行错误: {str(e)}"
-                    }
-                    results.append(error_result)
-                    error_count += 1
-                    
-                    pbar.update(1)
-                    pbar.set_postfix_str(f"成功={success_count}，跳过={skip_count}，失败={error_count}")
-
-    # 统计结果
-    result_counts = {'copied': 0, 'skipped': 0, 'error': 0}
-    for result in results:
-        status = result.get("status", "error")
-        if status in result_counts:
-            result_counts[status] += 1
-        else:
-            result_counts['error'] += 1
+                    totals[COPIED] += counts[COPIED]
+                    totals[SKIPPED] += counts[SKIPPED]
+                    totals[ERROR] += counts[ERROR]
+
+                    # 更新进度条：后缀只更新内容不强制重绘，由update按mininterval统一刷新
+                    if time.monotonic() - postfix_time >= 1.0:
+                        update_postfix()
+                    pbar.update(len(batch))
+
+            await asyncio.gather(producer(), *(worker() for _ in range(max_workers)))
+
+            # 结束时输出最终计数
+            update_postfix()
+            pbar.refresh()
+
+    # 进度条关闭后再输出字段缺失汇总，避免与进度条交错
+    report_missing_fields()
 
     # 显示处理统计
-    total_processed = len(results)
+    result_counts = dict(zip(STATUS_NAMES, totals))
+    success_count = totals[COPIED]
+    total_processed = sum(totals)
     success_rate = (success_count / total_processed * 100) if total_processed > 0 else 0
-    print(f"STATS: {success_rate:.1f}% success ({success_count}/{total_processed})")
+    print(f"STATS: {success_rate:.1f}% success ({success_count}/{total_processed})", file=out)
 
     return result_counts
 
+async def _iter_pairs(image_pairs: List[Tuple[str, str]]) -> AsyncGenerator[Tuple[str, str], None]:
+    """将文件对列表包装为异步迭代器"""
+    for pair in image_pairs:
+        yield pair
+
+async def process_images_threaded(
+    image_pairs: List[Tuple[str, str]],
+    args,
+    max_workers: int = None
+) -> Dict[str, int]:
+    """
+    使用线程池处理图片文件对列表，优化I/O密集型操作
+
+    Args:
+        image_pairs: 图片-JSON文件对列表
+        args: 命令行参数或已构建的WorkerConfig
+        max_workers: 最大线程数，默认为CPU核心数*4，不超过MAX_IO_WORKERS
+
+    Returns:
+        Dict[str, int]: 处理结果统计
+    """
+    if not image_pairs:
+        return {'copied': 0, 'skipped': 0, 'error': 0}
+
+    return await process_images_streaming(_iter_pairs(image_pairs), args, max_workers, total=len(image_pairs))
+
 async def process_images_concurrent(
     image_pairs: List[Tuple[str, str]],
     args,
@@ -586,7 +1310,7 @@ async def process_images_concurrent(
     """
     # 对于大量文件，自动切换到线程池模式
     if len(image_pairs) > 1000:
-        print("检测到大量文件，自动切换到优化的线程池模式...")
+        print("检测到大量文件，自动切换到优化的线程池模式...", file=sys.stderr if args.dry_run else sys.stdout)
         return await process_images_threaded(image_pairs, args)
     
     # 小量文件保持原有逻辑（但降低并发数）
@@ -599,71 +1323,68 @@ async def main_async():
     args = parser.parse_args()
     
     # 获取实际的并发配置 - 改为线程数配置
-    max_workers = int(os.getenv('IMAGE_FILTER_THREAD_WORKERS', str(os.cpu_count() * 4)))
-    max_workers = min(max_workers, 16384)  # 限制最大线程数
+    max_workers = int(os.getenv('IMAGE_FILTER_THREAD_WORKERS', str(DEFAULT_IO_WORKERS)))
+    max_workers = min(max_workers, MAX_IO_WORKERS)  # 限制最大线程数
+
+    # 模拟运行时标准输出只留给匹配的图片路径，横幅和统计信息改写到标准错误
+    out = sys.stderr if args.dry_run else sys.stdout
 
     # DOS风格配置显示
-    print("=" * 60)
-    print("IMAGE FILTER v3.0 - THREADED EDITION")
-    print("=" * 60)
-    print(f"SOURCE: {args.source}")
-    print(f"DEST  : {args.dest}")
-    print(f"FILTER: {args.score or 'NONE'} | AI:{args.is_ai or 'ANY'} | WM:{args.has_watermark or 'ANY'}")
-    print(f"THREADS: {max_workers} WORKERS")
+    print("=" * 60, file=out)
+    print("IMAGE FILTER v3.0 - THREADED EDITION", file=out)
+    print("=" * 60, file=out)
+    print(f"SOURCE: {args.source}", file=out)
+    print(f"DEST  : {args.dest}", file=out)
+    print(f"FILTER: {args.score or 'NONE'} | AI:{args.is_ai or 'ANY'} | WM:{args.has_watermark or 'ANY'}", file=out)
+    print(f"THREADS: {max_workers} WORKERS", file=out)
+    print(f"LINK  : {args.link_mode}", file=out)
     if args.dry_run:
-        print("MODE  : DRY RUN (SIMULATION)")
-    print("=" * 60)
+        print("MODE  : DRY RUN (SIMULATION)", file=out)
+    print("=" * 60, file=out)
 
     # 配置日志
     setup_logging(args.log_file)
 
+    # 启动时判断一次源与目标是否同一文件系统，不同时直接跳过链接尝试
+    args.same_device = is_same_device(args.source, args.dest)
+
+    # 平铺输出只有一个目标目录，启动时创建后工作线程不再触碰mkdir
+    if args.flat_output and not args.dry_run:
+        ensure_dir(args.dest)
+
     # 检查筛选条件
     if not any([args.score, args.is_ai, args.has_watermark]):
-        print("WARNING: No filter conditions specified!")
+        print("WARNING: No filter conditions specified!", file=out)
         return
 
-    # 文件发现阶段
-    print("\nSCANNING...")
-    image_pairs = []
-    discovered_count = 0
-
-    # 使用流式发现并显示实时进度
-    with tqdm(desc="DISCOVER", unit="pairs", ncols=80) as discovery_pbar:
-        async for img_path, json_path in discover_image_json_pairs_streaming(args.source):
-            image_pairs.append((img_path, json_path))
-            discovered_count += 1
-            discovery_pbar.update(1)
-
-            # 每发现1000个文件就让出控制权
-            if discovered_count % 1000 == 0:
-                await asyncio.sleep(0)
+    # 发现与处理同时进行：扫描按目录产出文件对，同一目录的文件对自然相邻，
+    # 不再把全部文件对收集到列表中
+    print("\nSCANNING + PROCESSING...", file=out)
+    results = await process_images_streaming(
+        discover_image_json_pairs_streaming(args.source, include_hidden=args.include_hidden),
+        build_worker_config(args),
+        max_workers=max_workers
+    )
 
-    if not image_pairs:
-        print("ERROR: No image-JSON pairs found!")
+    total_found = sum(results.values())
+    if not total_found:
+        print("ERROR: No image-JSON pairs found!", file=out)
         return
 
-    print(f"FOUND: {len(image_pairs)} pairs")
-
-    # 处理阶段
-    print("PROCESSING...")
-    results = await process_images_threaded(
-        image_pairs,
-        args,
-        max_workers=max_workers
-    )
+    print(f"FOUND: {total_found} pairs", file=out)
 
     # 结果统计
-    print("\n" + "=" * 60)
-    print("RESULTS:")
-    print(f"COPIED : {results['copied']}")
-    print(f"SKIPPED: {results['skipped']}")
-    print(f"ERRORS : {results['error']}")
-    print(f"LOG    : {args.log_file}")
+    print("\n" + "=" * 60, file=out)
+    print("RESULTS:", file=out)
+    print(f"COPIED : {results['copied']}", file=out)
+    print(f"SKIPPED: {results['skipped']}", file=out)
+    print(f"ERRORS : {results['error']}", file=out)
+    print(f"LOG    : {args.log_file}", file=out)
     if args.dry_run:
-        print("STATUS : SIMULATION COMPLETE")
+        print("STATUS : SIMULATION COMPLETE", file=out)
     else:
-        print("STATUS : OPERATION COMPLETE")
-    print("=" * 60)
+        print("STATUS : OPERATION COMPLETE", file=out)
+    print("=" * 60, file=out)
 
 def main():
     """同步入口点，调用异步主函数"""
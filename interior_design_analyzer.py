@@ -8,13 +8,12 @@ import os
 import asyncio
 import aiohttp
 import traceback
-import base64
 import io
 from typing import Dict, Any, Optional
 
 # 导入共享工具模块
 from vlm_common import (
-    image_to_base64, get_image_type, extract_interior_design_result, 
+    image_to_base64, encode_base64, get_image_type, extract_interior_design_result, 
     INTERIOR_DESIGN_PROMPT, Fore, Style, resize_to_1024px, quick_validate_image
 )
 
@@ -184,7 +183,7 @@ class InteriorDesignAnalyzer:
                 
                 if resized_data:
                     # 使用调整后的图片重试
-                    base64_image = base64.b64encode(resized_data).decode('utf-8')
+                    base64_image = encode_base64(resized_data)
                     img_type = 'jpeg'  # 调整后统一使用JPEG格式
                     payload = self._build_payload(base64_image, img_type)
                     
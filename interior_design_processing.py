@@ -6,7 +6,6 @@
 
 import os
 import json
-import asyncio
 import aiohttp
 import aiofiles
 import time
@@ -196,9 +195,6 @@ async def process_images_interior_design(root_dir: str, force_rerun: bool = Fals
 
 
         async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
-            # 动态提交任务到池中
-            pending_tasks = {}
-
             # 使用tqdm进度条显示完成进度
             with tqdm(total=len(tasks_to_process), desc="Processing") as pbar:
 
@@ -209,49 +205,29 @@ async def process_images_interior_design(root_dir: str, force_rerun: bool = Fals
                     task_data = {"path": img_path, "index": processed_count}
 
                     # 提交到任务池（如果池满会等待）
-                    task_id, task = await task_pool.submit_task(coro, task_data)
-                    pending_tasks[task_id] = {"task": task, "data": task_data}
+                    await task_pool.submit_task(coro, task_data)
 
                     processed_count += 1
 
-                # 收集完成的任务并更新进度条
-                while pending_tasks:
-                    completed_task_ids = []
-                    for task_id, task_info in pending_tasks.items():
-                        if task_info["task"].done():
-                            try:
-                                result = await task_info["task"]
-                                results.append(result)
-
-                                # 更新进度条
-                                pbar.update(1)
-
-                                # 显示当前处理的文件名和状态
-                                filename = os.path.basename(result.get("path", "unknown"))
-                                if result.get("status") == "success":
-                                    pbar.set_postfix_str(f"✓ {filename}")
-                                else:
-                                    pbar.set_postfix_str(f"✗ {filename}")
-
-                            except Exception as e:
-                                results.append({
-                                    "status": "collection_error",
-                                    "path": task_info["data"]["path"],
-                                    "error": str(e)
-                                })
-                                pbar.update(1)
-                                filename = os.path.basename(task_info["data"]["path"])
-                                pbar.set_postfix_str(f"✗ {filename}")
-
-                            completed_task_ids.append(task_id)
-
-                    # 移除已完成的任务
-                    for task_id in completed_task_ids:
-                        pending_tasks.pop(task_id)
-
-                    # 短暂等待，避免过度占用CPU
-                    if pending_tasks:
-                        await asyncio.sleep(0.1)
+                # 按完成顺序收集任务结果并更新进度条
+                async for task_data, task in task_pool.iter_completed():
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        result = {
+                            "status": "collection_error",
+                            "path": task_data["path"],
+                            "error": str(e)
+                        }
+                    results.append(result)
+
+                    # 更新进度条，显示当前处理的文件名和状态
+                    pbar.update(1)
+                    filename = os.path.basename(result.get("path", task_data["path"]))
+                    if result.get("status") == "success":
+                        pbar.set_postfix_str(f"✓ {filename}")
+                    else:
+                        pbar.set_postfix_str(f"✗ {filename}")
 
         # 统计结果
         processing_time = time.time() - start_time
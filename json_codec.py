@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+JSON编解码工具
+只依赖标准库（可选orjson），供检查点等无需图片处理依赖的模块直接导入
+"""
+
+import json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def dumps_json(obj, indent: bool = False) -> bytes:
+    """
+    将对象序列化为UTF-8编码的JSON字节，优先使用orjson
+
+    Args:
+        obj: 待序列化的对象
+        indent: 是否以2空格缩进输出
+
+    Returns:
+        bytes: JSON字节串（非ASCII字符不转义）
+    """
+    if ORJSON_AVAILABLE:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, option=option)
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+    # 紧凑分隔符，与orjson输出一致
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads_json(data):
+    """
+    解析JSON文本或字节，优先使用orjson
+
+    Args:
+        data: JSON字符串、bytes或bytearray
+
+    Returns:
+        解析后的对象
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -26,6 +26,8 @@ except ImportError:
             self.task_counter = 0
             self.completed_count = 0
             self.failed_count = 0
+            self._done_queue = asyncio.Queue()
+            self._unreported_count = 0
 
         async def submit_task(self, coro, task_data):
             await self.semaphore.acquire()
@@ -34,8 +36,16 @@ except ImportError:
 
             task = asyncio.create_task(self._execute_task(coro, task_id))
             self.active_tasks[task_id] = task
+            self._unreported_count += 1
+            task.add_done_callback(lambda t: self._done_queue.put_nowait((task_data, t)))
             return task_id, task
 
+        async def iter_completed(self):
+            while self._unreported_count > 0:
+                task_data, task = await self._done_queue.get()
+                self._unreported_count -= 1
+                yield task_data, task
+
         async def _execute_task(self, coro, task_id):
             try:
                 result = await coro
@@ -925,7 +935,6 @@ async def process_json_files_concurrent(
     # 初始化任务池
     task_pool = BatchTaskPool(max_concurrent=max_concurrent)
     results = []
-    pending_tasks = {}
 
     print(f"{Fore.CYAN}🚀 启动并发验证，最大并发数: {max_concurrent}{Style.RESET_ALL}")
 
@@ -937,57 +946,42 @@ async def process_json_files_concurrent(
             coro = validate_single_file_async(validator, json_file)
             task_data = {"path": json_file}
 
-            task_id, task = await task_pool.submit_task(coro, task_data)
-            pending_tasks[task_id] = {"task": task, "data": task_data}
-
-        # 收集完成的任务
-        while pending_tasks:
-            completed_task_ids = []
-
-            for task_id, task_info in pending_tasks.items():
-                if task_info["task"].done():
-                    try:
-                        result = await task_info["task"]
-                        results.append(result)
-
-                        # 更新进度条
-                        pbar.update(1)
-
-                        # 显示处理状态
-                        filename = os.path.basename(result.get("file_path", "unknown"))
-                        if result.get("is_valid"):
-                            pbar.set_postfix_str(f"{Fore.GREEN}✓{Style.RESET_ALL} {filename}")
-                            if verbose:
-                                print(f"  验证: {filename} ... {Fore.GREEN}✓{Style.RESET_ALL}")
-                        else:
-                            pbar.set_postfix_str(f"{Fore.RED}✗{Style.RESET_ALL} {filename}")
-                            if verbose:
-                                print(f"  验证: {filename} ... {Fore.RED}✗{Style.RESET_ALL}")
-
-                    except Exception as e:
-                        # 处理任务异常
-                        error_result = {
-                            'file_path': task_info["data"]["path"],
-                            'is_valid': False,
-                            'errors': [f"任务执行错误: {str(e)}"],
-                            'warnings': [],
-                            'data': None
-                        }
-                        results.append(error_result)
-                        pbar.update(1)
-
-                        filename = os.path.basename(task_info["data"]["path"])
-                        pbar.set_postfix_str(f"{Fore.RED}✗{Style.RESET_ALL} {filename}")
-
-                    completed_task_ids.append(task_id)
-
-            # 移除已完成的任务
-            for task_id in completed_task_ids:
-                pending_tasks.pop(task_id)
-
-            # 如果还有未完成的任务，短暂等待
-            if pending_tasks:
-                await asyncio.sleep(0.1)
+            await task_pool.submit_task(coro, task_data)
+
+        # 按完成顺序收集任务结果：完成回调直接唤醒，无需轮询和逐个扫描
+        async for task_data, task in task_pool.iter_completed():
+            try:
+                result = task.result()
+                results.append(result)
+
+                # 更新进度条
+                pbar.update(1)
+
+                # 显示处理状态
+                filename = os.path.basename(result.get("file_path", "unknown"))
+                if result.get("is_valid"):
+                    pbar.set_postfix_str(f"{Fore.GREEN}✓{Style.RESET_ALL} {filename}")
+                    if verbose:
+                        print(f"  验证: {filename} ... {Fore.GREEN}✓{Style.RESET_ALL}")
+                else:
+                    pbar.set_postfix_str(f"{Fore.RED}✗{Style.RESET_ALL} {filename}")
+                    if verbose:
+                        print(f"  验证: {filename} ... {Fore.RED}✗{Style.RESET_ALL}")
+
+            except Exception as e:
+                # 处理任务异常
+                error_result = {
+                    'file_path': task_data["path"],
+                    'is_valid': False,
+                    'errors': [f"任务执行错误: {str(e)}"],
+                    'warnings': [],
+                    'data': None
+                }
+                results.append(error_result)
+                pbar.update(1)
+
+                filename = os.path.basename(task_data["path"])
+                pbar.set_postfix_str(f"{Fore.RED}✗{Style.RESET_ALL} {filename}")
 
     # 显示任务池统计
     stats = task_pool.get_stats()
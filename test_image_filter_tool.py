@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+image_filter_tool模块单元测试
+测试筛选条件、字节预过滤和文件落地方式
+"""
+
+import os
+import sys
+import json
+import shutil
+import logging
+import tempfile
+import unittest
+from argparse import Namespace
+from itertools import product
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from image_filter_tool import transfer_file, compile_predicate, evaluate_conditions, build_prefilter
+
+# 覆盖合法、不支持的OP和格式错误的分数参数
+SCORE_SPECS = [None, '>:5', '<:5', '==:5', '>=:5', '<=:5', 'between:3:7', '> : 5',
+               '!=:5', '>:abc', 'between:3']
+FLAG_SPECS = [None, 'true', 'false']
+MISSING = object()
+SCORE_VALUES = [MISSING, -1, -1.0, 5, 5.0, 7.5, 2, 9, '6', 'abc']
+FLAG_VALUES = [MISSING, True, False, 0, 1]
+
+
+def legacy_evaluate_conditions(data, args):
+    """重构前evaluate_conditions的逐行实现，作为等价性测试的参照"""
+    conditions = []
+
+    if args.score:
+        try:
+            score_val = float(data.get('score', -1))
+            if score_val == -1:
+                raise KeyError
+
+            parts = args.score.replace(' ', '').split(':')
+            op = parts[0]
+
+            if op == 'between':
+                min_val, max_val = float(parts[1]), float(parts[2])
+                conditions.append(min_val <= score_val <= max_val)
+            else:
+                val = float(parts[1])
+                if op == '>': conditions.append(score_val > val)
+                elif op == '<': conditions.append(score_val < val)
+                elif op == '==': conditions.append(score_val == val)
+                elif op == '>=': conditions.append(score_val >= val)
+                elif op == '<=': conditions.append(score_val <= val)
+        except (ValueError, IndexError):
+            conditions.append(False)
+        except KeyError:
+            return False
+
+    if args.is_ai is not None:
+        try:
+            conditions.append(bool(data['is_ai_generated']) == (args.is_ai == 'true'))
+        except KeyError:
+            return False
+
+    if args.has_watermark is not None:
+        try:
+            conditions.append(bool(data['watermark_present']) == (args.has_watermark == 'true'))
+        except KeyError:
+            return False
+
+    if not conditions:
+        return False
+
+    if args.logic == 'AND':
+        return all(conditions)
+    return any(conditions)
+
+
+def all_args():
+    """枚举全部筛选参数组合"""
+    for score, is_ai, watermark, logic in product(SCORE_SPECS, FLAG_SPECS, FLAG_SPECS, ('AND', 'OR')):
+        yield Namespace(score=score, is_ai=is_ai, has_watermark=watermark, logic=logic)
+
+
+def all_records():
+    """枚举字段取值组合，MISSING表示缺少该字段"""
+    for score, is_ai, watermark in product(SCORE_VALUES, FLAG_VALUES, FLAG_VALUES):
+        data = {'reason': 'test'}
+        for key, value in (('score', score), ('is_ai_generated', is_ai), ('watermark_present', watermark)):
+            if value is not MISSING:
+                data[key] = value
+        yield data
+
+
+class TestCompiledPredicate(unittest.TestCase):
+    """测试编译后的判断函数与原evaluate_conditions逐条等价"""
+
+    def setUp(self):
+        """屏蔽无效参数和字段缺失产生的日志"""
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_matches_legacy_evaluation(self):
+        """测试全部参数与字段组合下结果一致，包括不支持的OP和-1分数"""
+        records = list(all_records())
+        for args in all_args():
+            predicate = compile_predicate(args)
+            for data in records:
+                expected = legacy_evaluate_conditions(data, args)
+                self.assertIs(predicate(data), expected, (vars(args), data))
+                self.assertIs(evaluate_conditions(data, args), expected, (vars(args), data))
+
+    def test_unsupported_operator_is_neutral(self):
+        """测试不支持的OP不构成条件：AND时不影响其他条件，OR时不单独成立"""
+        data = {'score': 9, 'is_ai_generated': False}
+        self.assertTrue(compile_predicate(Namespace(score='!=:5', is_ai='false', has_watermark=None, logic='AND'))(data))
+        self.assertTrue(compile_predicate(Namespace(score='!=:5', is_ai='false', has_watermark=None, logic='OR'))(data))
+        self.assertFalse(compile_predicate(Namespace(score='!=:5', is_ai='true', has_watermark=None, logic='OR'))(data))
+        self.assertFalse(compile_predicate(Namespace(score='!=:5', is_ai=None, has_watermark=None, logic='AND'))(data))
+
+    def test_missing_score_fails_record(self):
+        """测试分数为-1视为缺少分数，OR逻辑下也直接判定失败"""
+        predicate = compile_predicate(Namespace(score='<:5', is_ai='true', has_watermark=None, logic='OR'))
+        self.assertFalse(predicate({'score': -1, 'is_ai_generated': True}))
+        self.assertTrue(predicate({'score': 9, 'is_ai_generated': True}))
+
+
+class TestPrefilter(unittest.TestCase):
+    """测试字节预过滤不会误拒，且与完整解析组合后结果不变"""
+
+    def setUp(self):
+        """屏蔽无效参数和字段缺失产生的日志"""
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def encodings(self, data):
+        """同一记录的几种序列化形式：紧凑、带缩进、键嵌套在子对象中"""
+        yield json.dumps(data).encode('utf-8')
+        yield json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+        yield json.dumps({'meta': data, **data}, separators=(',', ':')).encode('utf-8')
+        yield json.dumps({**data, 'meta': {'score': 0, 'is_ai_generated': True}}).encode('utf-8')
+
+    def test_never_rejects_matching_records(self):
+        """测试预过滤与完整解析组合后与单独完整解析结果一致"""
+        records = list(all_records())
+        for args in all_args():
+            predicate = compile_predicate(args)
+            prefilter = build_prefilter(args)
+            if prefilter is None:
+                continue
+            for data in records:
+                for content in self.encodings(data):
+                    expected = predicate(json.loads(content))
+                    rejected = prefilter(content)
+                    if rejected:
+                        self.assertFalse(expected, (vars(args), content))
+                    self.assertIs(not rejected and predicate(json.loads(content)), expected, (vars(args), content))
+
+    def test_rejects_literal_mismatches(self):
+        """测试字面量确定不满足时无需解析即可拒绝"""
+        prefilter = build_prefilter(Namespace(score='>:5', is_ai='false', has_watermark=None, logic='AND'))
+        self.assertTrue(prefilter(b'{"score": 2, "is_ai_generated": false}'))
+        self.assertTrue(prefilter(b'{"score": 9, "is_ai_generated": true}'))
+        # -1表示缺少分数，即使满足比较也确定失败
+        low_prefilter = build_prefilter(Namespace(score='<:5', is_ai=None, has_watermark=None, logic='AND'))
+        self.assertTrue(low_prefilter(b'{"score": -1}'))
+        self.assertFalse(low_prefilter(b'{"score": 2}'))
+        self.assertFalse(prefilter(b'{"score": 9, "is_ai_generated": false}'))
+        # 值不是字面量、键缺失或嵌套对象中存在满足的值时交给完整解析
+        self.assertFalse(prefilter(b'{"score": "2", "is_ai_generated": false}'))
+        self.assertFalse(prefilter(b'{"is_ai_generated": false}'))
+        self.assertFalse(prefilter(b'{"score": 2, "m": {"score": 9}, "is_ai_generated": false}'))
+
+    def test_no_prefilter_without_checks(self):
+        """测试没有可预判的条件时不构建预过滤"""
+        self.assertIsNone(build_prefilter(Namespace(score=None, is_ai=None, has_watermark=None, logic='AND')))
+        self.assertIsNone(build_prefilter(Namespace(score='!=:5', is_ai=None, has_watermark=None, logic='AND')))
+
+
+class TestTransferFile(unittest.TestCase):
+    """测试transfer_file各落地方式"""
+
+    def setUp(self):
+        """创建源文件"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.src = os.path.join(self.temp_dir, 'src.jpg')
+        self.dest = os.path.join(self.temp_dir, 'dest.jpg')
+        self.content = os.urandom(5000)
+        with open(self.src, 'wb') as f:
+            f.write(self.content)
+
+    def tearDown(self):
+        """清理测试目录"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_copy(self):
+        """测试复制模式生成独立文件"""
+        transfer_file(self.src, self.dest, 'copy')
+        self.assertEqual(self.read(self.dest), self.content)
+        self.assertFalse(os.path.samefile(self.src, self.dest))
+
+    def test_copy_overwrites_existing_dest(self):
+        """测试复制模式覆盖已有的较长目标文件"""
+        with open(self.dest, 'wb') as f:
+            f.write(b'x' * 10000)
+        transfer_file(self.src, self.dest, 'copy')
+        self.assertEqual(self.read(self.dest), self.content)
+
+    def test_hardlink_and_auto(self):
+        """测试硬链接与auto模式在同一文件系统上生成硬链接"""
+        for mode in ('hardlink', 'auto'):
+            with self.subTest(mode=mode):
+                transfer_file(self.src, self.dest, mode)
+                self.assertTrue(os.path.samefile(self.src, self.dest))
+                # 重复落地到同一inode时不做任何操作
+                transfer_file(self.src, self.dest, mode)
+                self.assertEqual(self.read(self.src), self.content)
+                os.remove(self.dest)
+
+    def test_same_inode_dest_keeps_source(self):
+        """测试目标已是源文件的硬链接时，任何模式都不会截断源文件"""
+        os.link(self.src, self.dest)
+        for mode in ('copy', 'reflink', 'auto'):
+            with self.subTest(mode=mode):
+                try:
+                    transfer_file(self.src, self.dest, mode)
+                except OSError:
+                    pass
+                self.assertEqual(self.read(self.src), self.content)
+                self.assertEqual(self.read(self.dest), self.content)
+
+    def test_failed_reflink_keeps_existing_dest(self):
+        """测试克隆失败时保留已有目标文件且不留临时文件"""
+        with open(self.dest, 'wb') as f:
+            f.write(b'old')
+        try:
+            transfer_file(self.src, self.dest, 'reflink')
+        except OSError:
+            # 文件系统不支持克隆：目标文件保持原样
+            self.assertEqual(self.read(self.dest), b'old')
+        else:
+            self.assertEqual(self.read(self.dest), self.content)
+        self.assertEqual(self.read(self.src), self.content)
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), ['dest.jpg', 'src.jpg'])
+
+    def test_cross_device_link_modes_raise(self):
+        """测试跨文件系统时硬链接和克隆模式直接报错"""
+        for mode in ('hardlink', 'reflink'):
+            with self.subTest(mode=mode):
+                with self.assertRaises(OSError):
+                    transfer_file(self.src, self.dest, mode, same_device=False)
+                self.assertFalse(os.path.exists(self.dest))
+        transfer_file(self.src, self.dest, 'auto', same_device=False)
+        self.assertEqual(self.read(self.dest), self.content)
+
+
+def run_tests():
+    """运行所有测试"""
+    loader = unittest.TestLoader()
+    suite = unittest.TestSuite()
+
+    test_classes = [
+        TestCompiledPredicate,
+        TestPrefilter,
+        TestTransferFile
+    ]
+
+    for test_class in test_classes:
+        suite.addTests(loader.loadTestsFromTestCase(test_class))
+
+    runner = unittest.TextTestRunner(verbosity=2)
+    result = runner.run(suite)
+
+    return result.wasSuccessful()
+
+
+if __name__ == '__main__':
+    success = run_tests()
+    sys.exit(0 if success else 1)
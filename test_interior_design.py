@@ -8,6 +8,8 @@ import unittest
 import tempfile
 import os
 import json
+import time
+import errno
 import asyncio
 import aiofiles
 from unittest.mock import patch, AsyncMock, MagicMock
@@ -15,8 +17,10 @@ from typing import Dict, Any
 
 # 导入要测试的模块
 from vlm_common import extract_interior_design_result, resize_to_1024px, INTERIOR_DESIGN_PROMPT, convert_score_to_range
+import checkpoint_manager
 from checkpoint_manager import CheckpointManager
 from interior_design_analyzer import InteriorDesignAnalyzer
+from batch_task_pool import BatchTaskPool, AdaptiveLimiter
 
 
 class TestInteriorDesignXMLParser(unittest.TestCase):
@@ -176,6 +180,232 @@ class TestCheckpointManager(unittest.TestCase):
         
         asyncio.run(run_test())
     
+    def test_load_legacy_json_checkpoint(self):
+        """测试加载旧版整体JSON格式的检查点"""
+        legacy_state = {
+            'completed': ['file1.jpg', 'file2.jpg'],
+            'failed': ['file3.jpg'],
+            'total_files': 5,
+            'start_time': 0,
+            'version': '1.0'
+        }
+        with open(self.checkpoint_file, 'w', encoding='utf-8') as f:
+            json.dump(legacy_state, f, indent=2)
+
+        completed, failed = asyncio.run(self.manager.load_checkpoint())
+
+        self.assertEqual(completed, {'file1.jpg', 'file2.jpg'})
+        self.assertEqual(failed, {'file3.jpg'})
+        self.assertEqual(self.manager.total_files, 5)
+
+    def test_special_characters_in_paths(self):
+        """测试路径中的换行符和反斜杠在快照中转义后原样还原"""
+        paths = ['a\nc\tb.jpg', 'dir\\n.jpg', 'end\\', 'f\tx\n', 'ü.jpg']
+
+        async def run_test():
+            # 重建记录与追加记录两条编码路径都要覆盖
+            await self.manager.save_checkpoint(set(paths[:2]), {paths[2]}, 5)
+            self.manager.commit_window = 0
+            await self.manager.update_progress(paths[3], 'failed')
+            await self.manager.update_progress(paths[4], 'completed')
+            await self.manager.save_checkpoint(self.manager.completed_files, self.manager.failed_files)
+            await self.manager.close()
+
+            new_manager = CheckpointManager(self.checkpoint_file)
+            loaded_completed, loaded_failed = await new_manager.load_checkpoint()
+
+            self.assertEqual(loaded_completed, {paths[0], paths[1], paths[4]})
+            self.assertEqual(loaded_failed, {paths[2], paths[3]})
+
+        asyncio.run(run_test())
+
+    def test_load_unescaped_version2_checkpoint(self):
+        """测试读取未转义路径的version 2快照，反斜杠不被误解析"""
+        with open(self.checkpoint_file, 'wb') as f:
+            f.write(b'{"total_files":3,"start_time":0,"version":2}\n')
+            f.write(b'c\tC:\\data\\new.jpg\nf\tplain.jpg\n')
+
+        async def run_test():
+            completed, failed = await self.manager.load_checkpoint()
+            self.assertEqual(completed, {'C:\\data\\new.jpg'})
+            self.assertEqual(failed, {'plain.jpg'})
+
+            # 重新保存后按新格式写出，仍能读回相同状态
+            await self.manager.save_checkpoint(completed, failed)
+            new_manager = CheckpointManager(self.checkpoint_file)
+            loaded_completed, _ = await new_manager.load_checkpoint()
+            self.assertEqual(loaded_completed, {'C:\\data\\new.jpg'})
+
+        asyncio.run(run_test())
+
+    def test_delta_log_replay(self):
+        """测试增量日志在重新加载时被回放"""
+        async def run_test():
+            for i in range(12):
+                status = 'completed' if i % 4 else 'failed'
+                await self.manager.update_progress(f'file{i}.jpg', status)
+            await self.manager.update_progress('file0.jpg', 'completed')
+            await self.manager.close()
+
+            new_manager = CheckpointManager(self.checkpoint_file)
+            loaded_completed, loaded_failed = await new_manager.load_checkpoint()
+
+            self.assertEqual(loaded_completed, self.manager.completed_files)
+            self.assertEqual(loaded_failed, self.manager.failed_files)
+            self.assertIn('file0.jpg', loaded_completed)
+
+        asyncio.run(run_test())
+
+    def test_full_snapshots_are_geometric(self):
+        """测试完整快照次数随文件数对数增长，而非每个保存间隔一次"""
+        async def run_test():
+            snapshots = 0
+            write_snapshot = self.manager._write_snapshot
+
+            async def counting_write_snapshot():
+                nonlocal snapshots
+                snapshots += 1
+                await write_snapshot()
+
+            self.manager._write_snapshot = counting_write_snapshot
+            self.manager.commit_window = 0
+            for i in range(5000):
+                await self.manager.update_progress(f'file{i}.jpg', 'completed')
+                if i % 5 == 4:
+                    await self.manager.flush()
+            await self.manager.close()
+
+            # 5000个文件、每5个保存一次：全量重写需要1000次快照
+            self.assertLess(snapshots, 40)
+
+        asyncio.run(run_test())
+
+    def test_background_flusher(self):
+        """测试后台刷写任务在关闭时写出全部状态变化"""
+        async def run_test():
+            self.manager.start_flusher()
+            await self.manager.update_progress('file1.jpg', 'completed')
+            await self.manager.update_progress('file2.jpg', 'failed')
+            self.assertIn('file1.jpg', self.manager.completed_files)
+            await self.manager.close()
+
+            new_manager = CheckpointManager(self.checkpoint_file)
+            loaded_completed, loaded_failed = await new_manager.load_checkpoint()
+
+            self.assertEqual(loaded_completed, {'file1.jpg'})
+            self.assertEqual(loaded_failed, {'file2.jpg'})
+
+        asyncio.run(run_test())
+
+    def test_update_during_snapshot_is_persisted(self):
+        """测试快照写入期间到达的状态变化不会随增量日志一起被丢弃"""
+        async def run_test():
+            write_atomic = checkpoint_manager._write_atomic
+
+            def slow_write_atomic(*args):
+                time.sleep(0.05)
+                write_atomic(*args)
+
+            await self.manager.update_progress('early.jpg', 'completed')
+            with patch('checkpoint_manager._write_atomic', slow_write_atomic):
+                snapshot = asyncio.create_task(self.manager.save_checkpoint(
+                    self.manager.completed_files, self.manager.failed_files, 2))
+                await asyncio.sleep(0.01)
+                await self.manager.update_progress('late.jpg', 'completed')
+                await snapshot
+            await self.manager.close()
+
+            new_manager = CheckpointManager(self.checkpoint_file)
+            loaded_completed, _ = await new_manager.load_checkpoint()
+
+            self.assertEqual(loaded_completed, {'early.jpg', 'late.jpg'})
+
+        asyncio.run(run_test())
+
+    def test_failed_delta_append_is_retried_and_reported(self):
+        """测试增量日志追加失败时记录不丢失，错误交给下一次update_progress"""
+        async def run_test():
+            await self.manager.save_checkpoint({f'old{i}.jpg' for i in range(2000)}, set(), 2002)
+            self.manager.commit_window = 0
+            append_file = checkpoint_manager._append_file
+            failures = [OSError(errno.ENOSPC, 'No space left on device')]
+
+            def failing_append(handle, data):
+                if failures:
+                    # 模拟写出半行后失败
+                    handle.write(data[:7])
+                    raise failures.pop()
+                append_file(handle, data)
+
+            with patch('checkpoint_manager._append_file', failing_append):
+                await self.manager.update_progress('a.jpg', 'completed')
+                await self.manager.update_progress('b.jpg', 'failed')
+                for i in range(3):
+                    await self.manager.update_progress(f'c{i}.jpg', 'completed')
+                await self.manager._wait_pending_save()
+                self.assertFalse(failures)
+
+                with self.assertRaises(OSError):
+                    await self.manager.update_progress('d.jpg', 'completed')
+                await self.manager.close()
+
+            new_manager = CheckpointManager(self.checkpoint_file)
+            loaded_completed, loaded_failed = await new_manager.load_checkpoint()
+
+            self.assertTrue({'a.jpg', 'c0.jpg', 'c2.jpg', 'd.jpg'} <= loaded_completed)
+            self.assertEqual(loaded_failed, {'b.jpg'})
+            self.assertEqual(len(loaded_completed), 2005)
+
+        asyncio.run(run_test())
+
+    def test_flusher_survives_write_failure(self):
+        """测试后台刷写任务写入失败后继续运行，错误交给下一次update_progress"""
+        async def run_test():
+            append_file = checkpoint_manager._append_file
+            failures = [OSError(errno.ENOSPC, 'No space left on device')]
+
+            def failing_append(handle, data):
+                if failures:
+                    raise failures.pop()
+                append_file(handle, data)
+
+            self.manager.start_flusher()
+            with patch('checkpoint_manager._append_file', failing_append):
+                for i in range(5):
+                    await self.manager.update_progress(f'file{i}.jpg', 'completed')
+                while failures:
+                    await asyncio.sleep(0.001)
+                await asyncio.sleep(0.01)
+                self.assertFalse(self.manager._flusher_task.done())
+
+                with self.assertRaises(OSError):
+                    await self.manager.update_progress('late.jpg', 'failed')
+                # 刷写任务仍在处理队列，flush写出包括失败批次在内的全部记录
+                await self.manager.flush()
+                await self.manager.update_progress('last.jpg', 'completed')
+                await self.manager.close()
+
+            new_manager = CheckpointManager(self.checkpoint_file)
+            loaded_completed, loaded_failed = await new_manager.load_checkpoint()
+
+            self.assertEqual(loaded_completed, {f'file{i}.jpg' for i in range(5)} | {'last.jpg'})
+            self.assertEqual(loaded_failed, {'late.jpg'})
+
+        asyncio.run(run_test())
+
+    def test_stale_siblings_not_resurrected(self):
+        """测试没有快照时不回放残留的增量日志和临时文件"""
+        with open(self.checkpoint_file + '.delta', 'w', encoding='utf-8') as f:
+            f.write('{"op":"c","p":"stale.jpg"}\n')
+        with open(self.checkpoint_file + '.tmp', 'w', encoding='utf-8') as f:
+            f.write('partial')
+
+        completed, failed = asyncio.run(self.manager.load_checkpoint())
+
+        self.assertEqual(len(completed), 0)
+        self.assertFalse(os.path.exists(self.checkpoint_file + '.delta'))
+        self.assertFalse(os.path.exists(self.checkpoint_file + '.tmp'))
+
     def test_should_skip_file(self):
         """测试文件跳过逻辑"""
         # 添加已完成文件
@@ -186,6 +416,15 @@ class TestCheckpointManager(unittest.TestCase):
         self.assertFalse(self.manager.should_skip_file('completed_file.jpg', force_rerun=True))
         self.assertFalse(self.manager.should_skip_file('new_file.jpg', force_rerun=False))
     
+    def test_filter_pending_files(self):
+        """测试批量筛选与逐个跳过判断一致"""
+        self.manager.completed_files.add('done.jpg')
+        self.manager.failed_files.add('failed.jpg')
+        paths = ['new.jpg', 'done.jpg', 'failed.jpg']
+
+        self.assertEqual(self.manager.filter_pending_files(paths), ['new.jpg', 'failed.jpg'])
+        self.assertEqual(self.manager.filter_pending_files(paths, force_rerun=True), paths)
+
     def test_progress_stats(self):
         """测试进度统计"""
         self.manager.completed_files = {'file1.jpg', 'file2.jpg'}
@@ -202,6 +441,128 @@ class TestCheckpointManager(unittest.TestCase):
         self.assertEqual(stats['progress_percentage'], 30.0)
 
 
+class TestBatchTaskPool(unittest.TestCase):
+    """测试任务池并发槽位"""
+    
+    def test_set_limit_resizes_concurrency(self):
+        """测试并发上限生效，且可在运行时调整"""
+        async def run_test():
+            pool = BatchTaskPool(max_concurrent=2)
+            running = 0
+            peak = 0
+            
+            async def job():
+                nonlocal running, peak
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+            
+            async def submit(count):
+                for i in range(count):
+                    await pool.submit_task(job(), {"path": str(i)})
+                return [task async for _, task in pool.iter_completed()]
+            
+            self.assertEqual(len(await submit(6)), 6)
+            self.assertEqual(peak, 2)
+            
+            # 提交过程中调大上限，等待中的提交者被唤醒
+            peak = 0
+            submitter = asyncio.create_task(submit(12))
+            await asyncio.sleep(0.005)
+            await pool.set_limit(4)
+            self.assertEqual(len(await submitter), 12)
+            self.assertEqual(peak, 4)
+            
+            # 调小上限
+            peak = 0
+            await pool.set_limit(1)
+            self.assertEqual(len(await submit(3)), 3)
+            self.assertEqual(peak, 1)
+            self.assertEqual(pool.get_stats()["available_slots"], 1)
+            # 完成通道已被iter_completed全部取空，不随任务数增长
+            self.assertTrue(pool._done_queue.empty())
+        
+        asyncio.run(run_test())
+
+
+class TestAdaptiveLimiter(unittest.TestCase):
+    """测试自适应并发限制器的扩大与收缩"""
+    
+    def test_grows_when_requests_wait(self):
+        """测试无错误且有请求等待时按倍数扩大，且不超过最大值"""
+        async def run_test():
+            limiter = AdaptiveLimiter(initial=2, maximum=4, interval=0)
+            await limiter.acquire()
+            await limiter.acquire()
+            waiter = asyncio.create_task(limiter.acquire())
+            await asyncio.sleep(0)
+            self.assertEqual(limiter.waiting, 1)
+            
+            # 2 * 1.5 = 3
+            await limiter.release()
+            self.assertEqual(limiter.limit, 3)
+            await waiter
+            
+            # 3 * 1.5 = 4.5，受最大值限制；4个新请求中1个直接占用空闲槽位
+            waiters = [asyncio.create_task(limiter.acquire()) for _ in range(4)]
+            await asyncio.sleep(0)
+            await limiter.release()
+            self.assertEqual(limiter.limit, 4)
+            await asyncio.sleep(0)
+            self.assertEqual(limiter.active, 4)
+            self.assertEqual(limiter.waiting, 1)
+            for task in waiters:
+                task.cancel()
+            await asyncio.gather(*waiters, return_exceptions=True)
+        
+        asyncio.run(run_test())
+    
+    def test_no_growth_without_waiters(self):
+        """测试没有请求等待时即使无错误也不扩大"""
+        async def run_test():
+            limiter = AdaptiveLimiter(initial=2, interval=0)
+            for _ in range(5):
+                await limiter.acquire()
+                await limiter.release()
+            self.assertEqual(limiter.limit, 2)
+        
+        asyncio.run(run_test())
+    
+    def test_shrinks_on_errors(self):
+        """测试错误率超过阈值时减半，且不低于最小值"""
+        async def run_test():
+            limiter = AdaptiveLimiter(initial=16, minimum=3, interval=0)
+            expected = [8, 4, 3, 3]
+            for limit in expected:
+                await limiter.acquire()
+                await limiter.release(throttled=True)
+                self.assertEqual(limiter.limit, limit)
+        
+        asyncio.run(run_test())
+    
+    def test_adjusts_once_per_window(self):
+        """测试窗口内只累计统计，窗口结束时按整体错误率调整一次"""
+        async def run_test():
+            limiter = AdaptiveLimiter(initial=16, interval=60)
+            for i in range(20):
+                await limiter.acquire()
+                await limiter.release(throttled=i < 2)
+            # 未发出请求的释放不计入统计
+            await limiter.acquire()
+            await limiter.release(throttled=True, record=False)
+            self.assertEqual(limiter.limit, 16)
+            
+            # 窗口结束：错误率 2/21 > 5%，减半一次
+            limiter._window_start -= 60
+            await limiter.acquire()
+            await limiter.release()
+            self.assertEqual(limiter.limit, 8)
+            self.assertEqual(limiter._window_requests, 0)
+        
+        asyncio.run(run_test())
+
+
 class TestInteriorDesignAnalyzer(unittest.TestCase):
     """测试室内设计分析器功能"""
     
@@ -406,6 +767,8 @@ def run_tests():
         TestInteriorDesignXMLParser,
         TestScoreConversion,
         TestCheckpointManager,
+        TestBatchTaskPool,
+        TestAdaptiveLimiter,
         TestInteriorDesignAnalyzer,
         TestIntegrationWorkflow
     ]
@@ -16,8 +16,10 @@ from pathlib import Path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from vlm_common import (
-    validate_config, find_images, image_to_base64, 
-    extract_xml_result, CostCalculator, USER_PROMPT
+    validate_config, find_images, find_existing_files, image_to_base64, 
+    extract_xml_result, extract_xml_results, CostCalculator, USER_PROMPT,
+    group_duplicate_images, compute_image_digests, build_base64_body, BASE64_READ_BLOCK_SIZE,
+    cache_resized_image, compute_image_digest
 )
 
 class TestValidateConfig(unittest.TestCase):
@@ -149,6 +151,106 @@ class TestFindImages(unittest.TestCase):
         nonexistent = '/path/that/does/not/exist'
         images = find_images(nonexistent)
         self.assertEqual(len(images), 0)
+    
+    def test_find_existing_files(self):
+        """测试收集已有JSON文件，路径格式与find_images一致"""
+        Path(self.temp_dir, 'image1.json').touch()
+        Path(self.temp_dir, 'subdir', 'image6.json').touch()
+        
+        existing = find_existing_files(self.temp_dir, '.json')
+        
+        images = find_images(self.temp_dir)
+        expected = {os.path.splitext(p)[0] + '.json' for p in images if 'image1' in p or 'image6' in p}
+        self.assertEqual(existing, expected)
+
+class TestGroupDuplicateImages(unittest.TestCase):
+    """测试重复图片分组功能"""
+    
+    def setUp(self):
+        """创建内容部分重复的测试图片"""
+        self.temp_dir = tempfile.mkdtemp()
+        contents = {'a.jpg': b'same', 'b.jpg': b'other', 'c.jpg': b'same'}
+        self.paths = []
+        for filename, data in contents.items():
+            path = os.path.join(self.temp_dir, filename)
+            with open(path, 'wb') as f:
+                f.write(data)
+            self.paths.append(path)
+    
+    def tearDown(self):
+        """清理临时目录"""
+        import shutil
+        shutil.rmtree(self.temp_dir)
+    
+    def test_group_duplicate_images(self):
+        """测试相同内容的图片归入同一组"""
+        a, b, c = self.paths
+        groups = group_duplicate_images(self.paths)
+        
+        self.assertEqual(list(groups), [a, b])
+        self.assertEqual(groups[a], [c])
+        self.assertEqual(groups[b], [])
+    
+    def test_group_duplicate_images_missing_file(self):
+        """测试无法读取的文件单独成组"""
+        missing = os.path.join(self.temp_dir, 'missing.jpg')
+        groups = group_duplicate_images([missing])
+        self.assertEqual(groups, {missing: []})
+    
+    def test_group_duplicate_images_precomputed_digests(self):
+        """测试使用预先计算的摘要分组，结果与逐个计算一致"""
+        digests = compute_image_digests(self.paths)
+        self.assertEqual(digests[0], digests[2])
+        self.assertEqual(group_duplicate_images(self.paths, digests), group_duplicate_images(self.paths))
+
+class TestCacheResizedImage(unittest.TestCase):
+    """测试预压缩图片缓存功能"""
+    
+    def setUp(self):
+        """创建临时目录"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.temp_dir, 'cache')
+    
+    def tearDown(self):
+        """清理临时目录"""
+        import shutil
+        shutil.rmtree(self.temp_dir)
+    
+    def _create_image(self, filename, size):
+        from PIL import Image
+        path = os.path.join(self.temp_dir, filename)
+        Image.new('RGB', size, 'red').save(path)
+        return path
+    
+    def test_cache_resized_image(self):
+        """测试超大图片被压缩并缓存，再次调用直接命中缓存"""
+        from PIL import Image
+        path = self._create_image('big.jpg', (300, 120))
+        
+        cached_path = cache_resized_image(path, self.cache_dir, max_size=200)
+        
+        self.assertIsNotNone(cached_path)
+        with Image.open(cached_path) as img:
+            self.assertEqual(img.size, (200, 80))
+        with patch('vlm_common.resize_image_if_needed') as mock_resize:
+            self.assertEqual(cache_resized_image(path, self.cache_dir, max_size=200), cached_path)
+            mock_resize.assert_not_called()
+    
+    def test_cache_resized_image_uses_given_digest(self):
+        """测试传入已计算的摘要时不再读取文件计算摘要"""
+        path = self._create_image('big.jpg', (300, 120))
+        digest = compute_image_digest(path)
+        
+        with patch('vlm_common.compute_image_digest') as mock_digest:
+            cached_path = cache_resized_image(path, self.cache_dir, max_size=200, digest=digest)
+            mock_digest.assert_not_called()
+        
+        self.assertEqual(cached_path, cache_resized_image(path, self.cache_dir, max_size=200))
+    
+    def test_cache_resized_image_within_limit(self):
+        """测试尺寸合适的图片不生成缓存"""
+        path = self._create_image('small.jpg', (150, 120))
+        self.assertIsNone(cache_resized_image(path, self.cache_dir, max_size=200))
 
 class TestImageToBase64(unittest.TestCase):
     """测试Base64转换功能"""
@@ -186,6 +288,27 @@ class TestImageToBase64(unittest.TestCase):
         with self.assertRaises(FileNotFoundError):
             await image_to_base64(nonexistent)
 
+class TestBuildBase64Body(unittest.TestCase):
+    """测试流式Base64请求体构建"""
+    
+    def test_build_base64_body_matches_b64encode(self):
+        """测试分块编码结果与整体编码一致"""
+        for size in (0, 1, BASE64_READ_BLOCK_SIZE, BASE64_READ_BLOCK_SIZE * 2 + 2):
+            data = os.urandom(size)
+            body = build_base64_body(b'{"url":"', data, b'"}')
+            self.assertEqual(bytes(body), b'{"url":"' + base64.b64encode(data) + b'"}')
+    
+    def test_build_base64_body_from_file(self):
+        """测试直接从文件读取编码"""
+        data = os.urandom(BASE64_READ_BLOCK_SIZE + 7)
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(data)
+        try:
+            body = build_base64_body(b'[', f.name, b']')
+            self.assertEqual(bytes(body), b'[' + base64.b64encode(data) + b']')
+        finally:
+            os.remove(f.name)
+
 class TestExtractXmlResult(unittest.TestCase):
     """测试XML结果提取功能"""
     
@@ -292,6 +415,24 @@ class TestExtractXmlResult(unittest.TestCase):
         self.assertEqual(result['watermark_present'], 'unknown')
         self.assertEqual(result['watermark_location'], 'unknown')
         self.assertEqual(result['feedback'], '无反馈')
+    
+    def test_extract_xml_results_indexed(self):
+        """测试多图响应按index提取，缺失的结果返回错误"""
+        xml_content = """
+        <result index="2">
+        <score>6.0</score>
+        </result>
+        <result index="1">
+        <score>9.0</score>
+        </result>
+        """
+        
+        results = extract_xml_results(xml_content, 3)
+        
+        self.assertEqual(len(results), 3)
+        self.assertEqual(float(results[0]['score']), 9.0)
+        self.assertEqual(float(results[1]['score']), 6.0)
+        self.assertEqual(results[2]['error'], 'XML_NOT_FOUND')
 
 class TestCostCalculator(unittest.TestCase):
     """测试成本计算器功能"""
@@ -328,6 +469,43 @@ class TestCostCalculator(unittest.TestCase):
             places=6
         )
     
+    def test_add_usage_bulk_matches_add_usage(self):
+        """测试批量累加与逐条累加结果一致"""
+        usages = [
+            {'prompt_tokens': 100, 'completion_tokens': 20},
+            {'prompt_tokens': 50, 'completion_tokens': 10,
+             'completion_tokens_details': {'reasoning_tokens': 5}},
+            {},
+        ]
+        single = CostCalculator()
+        for usage in usages:
+            single.add_usage(usage)
+        
+        self.calculator.add_usage_bulk(usages)
+        
+        self.assertEqual(self.calculator.total_prompt_tokens, single.total_prompt_tokens)
+        self.assertEqual(self.calculator.total_completion_tokens, single.total_completion_tokens)
+        self.assertEqual(self.calculator.total_reasoning_tokens, single.total_reasoning_tokens)
+        self.assertEqual(self.calculator.successful_requests, single.successful_requests)
+    
+    def test_shared_request_counted_once(self):
+        """测试多图请求均摊的用量只计为一次请求，token照常累加"""
+        usages = [
+            {'prompt_tokens': 34, 'completion_tokens': 10},
+            {'prompt_tokens': 33, 'completion_tokens': 10, 'shared_request': True},
+            {'prompt_tokens': 33, 'completion_tokens': 10, 'shared_request': True},
+        ]
+        single = CostCalculator()
+        for usage in usages:
+            single.add_usage(usage)
+        self.calculator.add_usage_bulk(usages)
+        
+        for calculator in (single, self.calculator):
+            self.assertEqual(calculator.total_requests, 1)
+            self.assertEqual(calculator.successful_requests, 1)
+            self.assertEqual(calculator.total_prompt_tokens, 100)
+            self.assertEqual(calculator.total_completion_tokens, 30)
+    
     def test_calculate_cost_zero_tokens(self):
         """测试零token成本计算"""
         result = self.calculator.calculate_cost(0, 0)
@@ -382,7 +560,10 @@ def run_tests():
     test_classes = [
         TestValidateConfig,
         TestFindImages,
+        TestGroupDuplicateImages,
+        TestCacheResizedImage,
         TestImageToBase64,
+        TestBuildBase64Body,
         TestExtractXmlResult,
         TestCostCalculator,
         TestUserPrompt
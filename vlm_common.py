@@ -1,8 +1,8 @@
 
 import os
-import json
 import re
 import base64
+import hashlib
 import time
 import filetype
 import xmltodict
@@ -12,14 +12,30 @@ from dotenv import load_dotenv
 from colorama import init, Fore, Style
 from PIL import Image
 import io
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Tuple
 import glob
+from concurrent.futures import ThreadPoolExecutor
+# JSON工具已移至无额外依赖的json_codec，此处导入以保持原有的导入路径
+from json_codec import dumps_json, loads_json
 try:
     import imagesize
     IMAGESIZE_AVAILABLE = True
 except ImportError:
     IMAGESIZE_AVAILABLE = False
     print("Warning: imagesize library not available. Using fallback method for image validation.")
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
+try:
+    import pybase64
+    PYBASE64_AVAILABLE = True
+except ImportError:
+    PYBASE64_AVAILABLE = False
+
+# Base64编码函数，pybase64可用时使用其SIMD实现
+_b64encode = pybase64.b64encode if PYBASE64_AVAILABLE else base64.b64encode
 
 # 初始化colorama用于彩色输出
 init(autoreset=True)
@@ -69,6 +85,20 @@ USER_PROMPT = """你是一个专业的图片质量评估专家，具备以下能
 重要：XML部分必须是纯净格式，不要用markdown代码块包装，不要有额外的格式化符号。
 """
 
+# 多图批量请求的附加说明，{count}为本次请求的图片数量
+MULTI_IMAGE_PROMPT_SUFFIX = """
+6. **多图批量评估**：
+   - 本次请求共包含 {count} 张图片，按出现顺序编号为 1 到 {count}。
+   - 每张图片必须独立评估，评分互不影响。
+   - 为每张图片分别输出一个结果块，并用 index 属性标注图片序号，例如：
+<result index="1">...</result>
+<result index="2">...</result>
+"""
+
+def build_multi_image_prompt(count: int) -> str:
+    """生成一次请求评估多张图片时使用的提示词"""
+    return USER_PROMPT + MULTI_IMAGE_PROMPT_SUFFIX.format(count=count)
+
 # 室内设计分析提示词模板
 INTERIOR_DESIGN_PROMPT = """你是一个专业的视觉语言模型(VLM)，专门分析室内设计图像。请严格按以下步骤处理用户提供的图片：
 
@@ -221,14 +251,240 @@ def find_images(root_dir, extensions=('.jpg', '.jpeg', '.png', '.bmp', '.webp'))
     # 返回排序后的列表（保持与原函数完全相同的行为）
     return sorted(list(image_files))
 
+def _scan_files(directory: str, extension: str) -> List[str]:
+    """用os.scandir递归收集目录下指定扩展名的文件路径（不跟随符号链接目录）"""
+    found = []
+    pending_dirs = [directory]
+    while pending_dirs:
+        current = pending_dirs.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending_dirs.append(entry.path)
+                    elif entry.name.endswith(extension):
+                        found.append(entry.path)
+        except OSError:
+            # 无权限或目录在扫描期间被删除，跳过该目录
+            continue
+    return found
+
+def find_existing_files(root_dir: str, extension: str = '.json', max_workers: int = 16) -> set:
+    """
+    单次遍历收集根目录下所有指定扩展名的文件路径
+
+    用于批量跳过检查：集合成员测试替代逐个图片的os.path.exists，
+    顶层子目录分给线程池并行扫描，在网络文件系统上效果明显。
+    路径格式与 find_images 一致（os.path.join拼接）。
+
+    Args:
+        root_dir: 根目录路径
+        extension: 文件扩展名
+        max_workers: 并行扫描的最大线程数
+
+    Returns:
+        set: 文件路径集合
+    """
+    existing = set()
+    subdirs = []
+    try:
+        with os.scandir(root_dir) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.name.endswith(extension):
+                    existing.add(entry.path)
+    except OSError:
+        return existing
+
+    if subdirs:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(subdirs))) as pool:
+            for files in pool.map(_scan_files, subdirs, [extension] * len(subdirs)):
+                existing.update(files)
+    return existing
+
+def compute_image_digest(image_path: str, chunk_size: int = 1024 * 1024) -> Optional[str]:
+    """
+    计算图片文件内容摘要，用于识别内容完全相同的重复图片
+
+    优先使用 xxhash 的 xxh3_128（非加密哈希，速度接近内存带宽），
+    不可用时回退到标准库的 blake2b。
+
+    Args:
+        image_path: 图片文件路径
+        chunk_size: 分块读取大小（字节）
+
+    Returns:
+        Optional[str]: 十六进制摘要，读取失败时返回None
+    """
+    hasher = xxhash.xxh3_128() if XXHASH_AVAILABLE else hashlib.blake2b(digest_size=16)
+    # 复用同一缓冲区读取，不为每个分块分配新的bytes对象
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    try:
+        with open(image_path, 'rb', buffering=0) as f:
+            while True:
+                size = f.readinto(buffer)
+                if not size:
+                    break
+                hasher.update(view[:size])
+    except OSError:
+        return None
+    return hasher.hexdigest()
+
+def compute_image_digests(image_paths: List[str]) -> List[Optional[str]]:
+    """
+    依次计算一组图片的内容摘要，可作为单个任务提交到线程池或进程池
+
+    Args:
+        image_paths: 图片文件路径列表
+
+    Returns:
+        List[Optional[str]]: 与image_paths一一对应的摘要
+    """
+    return [compute_image_digest(img_path) for img_path in image_paths]
+
+def group_duplicate_images(image_paths: List[str], digests: Optional[List[Optional[str]]] = None) -> Dict[str, List[str]]:
+    """
+    按文件内容对图片分组，每组只需调用一次VLM API
+
+    Args:
+        image_paths: 图片文件路径列表
+        digests: 与image_paths一一对应的预先计算的摘要；为None时在此逐个计算
+
+    Returns:
+        Dict[str, List[str]]: 代表图片路径 -> 内容相同的其余图片路径列表，
+            保持输入顺序；无法计算摘要的图片单独成组
+    """
+    groups: Dict[str, List[str]] = {}
+    representatives: Dict[str, str] = {}
+    if digests is None:
+        digests = map(compute_image_digest, image_paths)
+
+    for img_path, digest in zip(image_paths, digests):
+        if digest is None:
+            groups[img_path] = []
+            continue
+
+        representative = representatives.get(digest)
+        if representative is None:
+            representatives[digest] = img_path
+            groups[img_path] = []
+        else:
+            groups[representative].append(img_path)
+
+    return groups
+
+# 3的倍数：逐块编码时中间块不会产生填充字符，拼接结果与整体编码一致
+BASE64_READ_BLOCK_SIZE = 57 * 1024
+
+def iter_base64_chunks(source, block_size: int = BASE64_READ_BLOCK_SIZE):
+    """
+    分块生成Base64编码数据，避免整张图片的多份完整拷贝同时驻留内存
+
+    Args:
+        source: 图片文件路径，或已在内存中的图片二进制数据
+        block_size: 每次编码的原始字节数，必须是3的倍数
+
+    Yields:
+        bytes: Base64编码后的数据块
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for start in range(0, len(view), block_size):
+            yield _b64encode(view[start:start + block_size])
+        return
+
+    with open(source, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            yield _b64encode(block)
+
+def build_base64_body(prefix: bytes, source, suffix: bytes) -> bytearray:
+    """
+    将图片Base64编码直接写入预分配的请求体缓冲区
+
+    请求体由 prefix + Base64(图片) + suffix 组成，按编码后长度一次性分配，
+    编码块原地写入，不经过中间的str和json.dumps。
+
+    Args:
+        prefix: Base64数据之前的请求体字节
+        source: 图片文件路径，或图片二进制数据
+        suffix: Base64数据之后的请求体字节
+
+    Returns:
+        bytearray: 完整的请求体
+    """
+    return build_multi_base64_body([prefix, suffix], [source])
+
+def build_multi_base64_body(segments: List[bytes], sources: list) -> bytearray:
+    """
+    将多张图片的Base64编码依次写入预分配的请求体缓冲区
+
+    请求体由 segments[0] + Base64(sources[0]) + segments[1] + ... + segments[-1] 组成。
+
+    Args:
+        segments: 图片数据之间的请求体字节，数量比sources多1
+        sources: 图片文件路径或图片二进制数据列表
+
+    Returns:
+        bytearray: 完整的请求体
+    """
+    encoded_size = 0
+    for source in sources:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            raw_size = len(source)
+        else:
+            raw_size = os.path.getsize(source)
+        encoded_size += (raw_size + 2) // 3 * 4
+
+    body = bytearray(sum(len(segment) for segment in segments) + encoded_size)
+    pos = 0
+    for index, segment in enumerate(segments):
+        body[pos:pos + len(segment)] = segment
+        pos += len(segment)
+        if index == len(sources):
+            break
+        for chunk in iter_base64_chunks(sources[index]):
+            # 等长切片赋值为原地拷贝；文件在读取期间变大时自动扩展
+            body[pos:pos + len(chunk)] = chunk
+            pos += len(chunk)
+
+    # 文件在读取期间变小时截掉多余空间
+    del body[pos:]
+    return body
+
+def encode_base64(data) -> str:
+    """将二进制数据编码为Base64字符串"""
+    if PYBASE64_AVAILABLE:
+        return pybase64.b64encode_as_string(data)
+    return base64.b64encode(data).decode('ascii')
+
 async def image_to_base64(image_path):
     """异步将图片转换为Base64编码"""
     async with aiofiles.open(image_path, "rb") as img_file:
         content = await img_file.read()
-        return base64.b64encode(content).decode('utf-8')
+        return encode_base64(content)
+
+# 常见扩展名到图片类型的映射，命中时无需读取文件头
+_EXTENSION_IMAGE_TYPES = {
+    '.jpg': 'jpeg',
+    '.jpeg': 'jpeg',
+    '.png': 'png',
+    '.webp': 'webp',
+    '.bmp': 'bmp',
+    '.gif': 'gif',
+}
 
 def get_image_type(image_path: str) -> str:
-    """检测图片类型"""
+    """检测图片类型，优先根据扩展名判断，无法判断时读取文件头"""
+    if isinstance(image_path, str):
+        img_type = _EXTENSION_IMAGE_TYPES.get(os.path.splitext(image_path)[1].lower())
+        if img_type:
+            return img_type
+
     img_type = 'jpeg'  # 默认
     try:
         kind = filetype.guess(image_path)
@@ -317,7 +573,7 @@ def quick_validate_image(image_path: str, max_size: int = 2000, min_size: int =
             "needs_resize": False
         }
 
-def resize_image_if_needed(image_path: str, max_size: int = 2000) -> Optional[bytes]:
+def resize_image_if_needed(image_path: str, max_size: int = 2000) -> Optional[Tuple[bytes, str]]:
     """
     优化版本：先快速检查尺寸，再决定是否加载图片
 
@@ -329,7 +585,7 @@ def resize_image_if_needed(image_path: str, max_size: int = 2000) -> Optional[by
         max_size: 允许的最大尺寸（宽或高）。
 
     Returns:
-        如果进行了压缩，则返回压缩后的图片二进制数据 (bytes)；否则返回 None。
+        如果进行了压缩，则返回 (压缩后的图片二进制数据, 图片类型)；否则返回 None。
     """
     # 第一步：快速检查尺寸，避免加载完整图片
     validation = quick_validate_image(image_path, max_size)
@@ -374,7 +630,7 @@ def resize_image_if_needed(image_path: str, max_size: int = 2000) -> Optional[by
             img_format = img.format if img.format in ['JPEG', 'PNG', 'WEBP'] else 'JPEG'
             resized_img.save(byte_arr, format=img_format)
 
-            return byte_arr.getvalue()
+            return byte_arr.getvalue(), img_format.lower()
 
     except FileNotFoundError:
         # 文件不存在，无法处理
@@ -384,6 +640,51 @@ def resize_image_if_needed(image_path: str, max_size: int = 2000) -> Optional[by
         print(f"{Fore.RED}处理图片时发生错误: {e}{Style.RESET_ALL}")
         return None
 
+# 预压缩图片的默认缓存目录
+RESIZE_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'vqg')
+
+def cache_resized_image(image_path: str, cache_dir: str = RESIZE_CACHE_DIR, max_size: int = 2000,
+                        digest: Optional[str] = None) -> Optional[str]:
+    """
+    预先压缩超出尺寸限制的图片，并按内容摘要缓存到磁盘
+
+    相同内容的图片在多次运行之间只压缩一次，上传时直接读取缓存文件，
+    避免先发送原图、收到400后再压缩重试。
+
+    Args:
+        image_path: 图片文件路径
+        cache_dir: 缓存目录
+        max_size: 允许的最大尺寸（宽或高）
+        digest: 已计算的内容摘要（如去重时得到的），为None时在此读取文件计算
+
+    Returns:
+        Optional[str]: 压缩后图片的缓存路径；无需压缩或压缩失败时返回None
+    """
+    if digest is None:
+        digest = compute_image_digest(image_path)
+        if digest is None:
+            return None
+
+    cached_path = os.path.join(cache_dir, f"{digest}_{max_size}")
+    if os.path.exists(cached_path):
+        return cached_path
+
+    resized = resize_image_if_needed(image_path, max_size)
+    if not resized:
+        return None
+    resized_data, _ = resized
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # 先写临时文件再原子替换，避免并发进程读到不完整的缓存
+        temp_path = f"{cached_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(resized_data)
+        os.replace(temp_path, cached_path)
+    except OSError:
+        return None
+    return cached_path
+
 def resize_to_1024px(image_path: str) -> Optional[bytes]:
     """
     将图片调整到1024px（用于4XX错误处理）
@@ -530,20 +831,31 @@ def extract_interior_design_result(text: str) -> Dict:
             "traceback": traceback.format_exc()
         }
 
+# XML结果提取使用的正则，在模块加载时预编译，避免每个任务重复查找编译缓存
+_XML_RESULT_PATTERNS = [
+    re.compile(r'<result[^>]*>(.*?)</result>', re.DOTALL | re.IGNORECASE),  # 标准result标签
+    re.compile(r'```xml\s*<result[^>]*>(.*?)</result>\s*```', re.DOTALL | re.IGNORECASE),  # markdown包装的XML
+    re.compile(r'```\s*<result[^>]*>(.*?)</result>\s*```', re.DOTALL | re.IGNORECASE),  # 无xml标识的代码块
+    re.compile(r'<result[^>]*>(.*?)(?=\n\n|\Z)', re.DOTALL | re.IGNORECASE),  # 不完整的result标签
+]
+_XML_FIELD_PATTERNS = {
+    field: re.compile(f'<{field}[^>]*>(.*?)</{field}>', re.DOTALL | re.IGNORECASE)
+    for field in ['is_ai_generated', 'watermark_present', 'watermark_location', 'score', 'feedback']
+}
+_XML_FENCE_OPEN_RE = re.compile(r'```xml\s*')
+_XML_FENCE_CLOSE_RE = re.compile(r'\s*```')
+_SCORE_NUMBER_RE = re.compile(r'(\d+\.?\d*)')
+_INDEXED_RESULT_RE = re.compile(r'<result\s+index\s*=\s*["\']?(\d+)["\']?[^>]*>(.*?)</result>', re.DOTALL | re.IGNORECASE)
+_RESULT_BLOCK_RE = _XML_RESULT_PATTERNS[0]
+
+
 def extract_xml_result(text: str) -> Dict:
     """从模型输出中提取XML内容（增强鲁棒性）"""
     try:
         # 策略1: 提取<result>标签块（最常见）
-        xml_patterns = [
-            r'<result[^>]*>(.*?)</result>',  # 标准result标签
-            r'```xml\s*<result[^>]*>(.*?)</result>\s*```',  # markdown包装的XML
-            r'```\s*<result[^>]*>(.*?)</result>\s*```',  # 无xml标识的代码块
-            r'<result[^>]*>(.*?)(?=\n\n|\Z)',  # 不完整的result标签
-        ]
-        
         xml_content = None
-        for pattern in xml_patterns:
-            match = re.search(pattern, text, re.DOTALL | re.IGNORECASE)
+        for pattern in _XML_RESULT_PATTERNS:
+            match = pattern.search(text)
             if match:
                 xml_content = f"<result>{match.group(1)}</result>"
                 break
@@ -551,16 +863,8 @@ def extract_xml_result(text: str) -> Dict:
         # 策略2: 如果找不到result标签，尝试提取独立的XML字段
         if not xml_content:
             xml_fields = {}
-            field_patterns = {
-                'is_ai_generated': r'<is_ai_generated[^>]*>(.*?)</is_ai_generated>',
-                'watermark_present': r'<watermark_present[^>]*>(.*?)</watermark_present>',
-                'watermark_location': r'<watermark_location[^>]*>(.*?)</watermark_location>',
-                'score': r'<score[^>]*>(.*?)</score>',
-                'feedback': r'<feedback[^>]*>(.*?)</feedback>'
-            }
-            
-            for field, pattern in field_patterns.items():
-                match = re.search(pattern, text, re.DOTALL | re.IGNORECASE)
+            for field, pattern in _XML_FIELD_PATTERNS.items():
+                match = pattern.search(text)
                 if match:
                     xml_fields[field] = match.group(1).strip()
             
@@ -579,8 +883,8 @@ def extract_xml_result(text: str) -> Dict:
             }
         
         # 清理XML内容
-        xml_content = re.sub(r'```xml\s*', '', xml_content)
-        xml_content = re.sub(r'\s*```', '', xml_content)
+        xml_content = _XML_FENCE_OPEN_RE.sub('', xml_content)
+        xml_content = _XML_FENCE_CLOSE_RE.sub('', xml_content)
         xml_content = xml_content.strip()
         
         # 解析XML
@@ -589,9 +893,8 @@ def extract_xml_result(text: str) -> Dict:
         except Exception as parse_error:
             # 如果xmltodict失败，尝试手动解析
             manual_result = {}
-            for field in ['is_ai_generated', 'watermark_present', 'watermark_location', 'score', 'feedback']:
-                pattern = f'<{field}[^>]*>(.*?)</{field}>'
-                match = re.search(pattern, xml_content, re.DOTALL | re.IGNORECASE)
+            for field, pattern in _XML_FIELD_PATTERNS.items():
+                match = pattern.search(xml_content)
                 if match:
                     manual_result[field] = match.group(1).strip()
             
@@ -610,7 +913,7 @@ def extract_xml_result(text: str) -> Dict:
                 try:
                     if isinstance(value, str):
                         # 提取数字
-                        num_match = re.search(r'(\d+\.?\d*)', value)
+                        num_match = _SCORE_NUMBER_RE.search(value)
                         processed[key] = round(float(num_match.group(1)), 1) if num_match else 0.0
                     else:
                         processed[key] = round(float(value), 1)
@@ -643,6 +946,39 @@ def extract_xml_result(text: str) -> Dict:
             "traceback": traceback.format_exc()
         }
 
+def extract_xml_results(text: str, count: int) -> List[Dict]:
+    """
+    从多图批量请求的模型输出中按序号提取每张图片的结果
+
+    Args:
+        text: 模型的原始输出文本
+        count: 本次请求的图片数量
+
+    Returns:
+        List[Dict]: 按图片顺序排列的结果，缺失的序号返回错误字典
+    """
+    blocks = {}
+    for match in _INDEXED_RESULT_RE.finditer(text):
+        blocks.setdefault(int(match.group(1)), match.group(2))
+
+    if not blocks:
+        # 模型未标注序号时，结果块数量一致则按出现顺序对应
+        unindexed = _RESULT_BLOCK_RE.findall(text)
+        if len(unindexed) == count:
+            blocks = {index + 1: body for index, body in enumerate(unindexed)}
+
+    results = []
+    for index in range(1, count + 1):
+        if index in blocks:
+            results.append(extract_xml_result(f"<result>{blocks[index]}</result>"))
+        else:
+            results.append({
+                "error": "XML_NOT_FOUND",
+                "message": f"未找到第{index}张图片的<result>块",
+                "raw_output": text[:500] + "..." if len(text) > 500 else text
+            })
+    return results
+
 class CostCalculator:
     """API成本计算器"""
     
@@ -663,8 +999,10 @@ class CostCalculator:
         if not api_usage:
             return
             
-        self.total_requests += 1
-        self.successful_requests += 1
+        # 多图请求中除第一张外的图片只分摊token，不重复计为请求
+        if not api_usage.get('shared_request'):
+            self.total_requests += 1
+            self.successful_requests += 1
         
         # 基础token统计
         self.total_prompt_tokens += api_usage.get('prompt_tokens', 0)
@@ -675,6 +1013,23 @@ class CostCalculator:
         reasoning_tokens = completion_details.get('reasoning_tokens', 0)
         self.total_reasoning_tokens += reasoning_tokens
     
+    def add_usage_bulk(self, api_usages):
+        """批量添加API使用统计，各项token先求和再一次性累加"""
+        api_usages = [api_usage for api_usage in api_usages if api_usage]
+        if not api_usages:
+            return
+        
+        requests = sum(1 for api_usage in api_usages if not api_usage.get('shared_request'))
+        self.total_requests += requests
+        self.successful_requests += requests
+        
+        self.total_prompt_tokens += sum(api_usage.get('prompt_tokens', 0) for api_usage in api_usages)
+        self.total_completion_tokens += sum(api_usage.get('completion_tokens', 0) for api_usage in api_usages)
+        self.total_reasoning_tokens += sum(
+            api_usage.get('completion_tokens_details', {}).get('reasoning_tokens', 0)
+            for api_usage in api_usages
+        )
+    
     def calculate_cost(self):
         """计算总费用（人民币）"""
         # 输入成本
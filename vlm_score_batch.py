@@ -7,7 +7,7 @@ VLM图片质量评分 - 批量推理版本
 import os
 import argparse
 import asyncio
-from batch_processing import process_images_batch
+from batch_processing import process_images_batch, close_http_session
 from vlm_common import Fore, Style
 
 
@@ -18,6 +18,8 @@ async def main():
     parser.add_argument('--force-rerun', action='store_true', help='强制重新处理已存在的结果文件')
     parser.add_argument('--debug', action='store_true', help='启用调试模式')
     parser.add_argument('--concurrent-limit', type=int, help='并发限制数量 (默认: 50000)')
+    parser.add_argument('--images-per-request', type=int, help='每次API请求包含的图片数量 (默认: 1)')
+    parser.add_argument('--results-file', type=str, help='将所有结果追加写入该JSONL文件，代替每张图片一个JSON文件')
     args = parser.parse_args()
     
     try:
@@ -29,13 +31,18 @@ async def main():
 
         concurrent_limit = args.concurrent_limit or int(os.getenv('VLM_BATCH_CONCURRENT_LIMIT', '50000'))
         print(f"Concurrent limit: {concurrent_limit}")
+
+        images_per_request = args.images_per_request or int(os.getenv('VLM_IMAGES_PER_REQUEST', '1'))
+        print(f"Images per request: {images_per_request}")
         print()
         
         return await process_images_batch(
             root_dir=args.root_dir,
             force_rerun=args.force_rerun,
             debug=args.debug,
-            concurrent_limit=concurrent_limit
+            concurrent_limit=concurrent_limit,
+            images_per_request=images_per_request,
+            results_file=args.results_file
         )
         
     except KeyboardInterrupt:
@@ -47,6 +54,8 @@ async def main():
             import traceback
             print(traceback.format_exc())
         return 1
+    finally:
+        await close_http_session()
 
 
 if __name__ == "__main__":
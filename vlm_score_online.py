@@ -13,12 +13,10 @@ import aiofiles
 from tqdm.asyncio import tqdm
 import traceback
 import time
-import base64
-import io
 
 # 导入共享工具模块
 from vlm_common import (
-    validate_config, find_images, image_to_base64, get_image_type,
+    validate_config, find_images, image_to_base64, encode_base64, get_image_type,
     extract_xml_result, CostCalculator, USER_PROMPT,
     Fore, Style, resize_image_if_needed
 )
@@ -92,11 +90,11 @@ class ImageQualityAnalyzer:
                 
                 # 如果遇到400错误，尝试压缩图片后重试
                 if response.status == 400:
-                    compressed_data = resize_image_if_needed(image_path)
-                    if compressed_data:
-                        base64_image = base64.b64encode(compressed_data).decode('utf-8')
-                        # 图片类型可能因压缩而改变，这里简单处理
-                        img_type = get_image_type(io.BytesIO(compressed_data))
+                    compressed = resize_image_if_needed(image_path)
+                    if compressed:
+                        # 压缩后的图片类型由压缩函数直接给出，无需再次解析
+                        compressed_data, img_type = compressed
+                        base64_image = encode_base64(compressed_data)
                         payload = self._build_payload(base64_image, img_type)
                         
                         print(f"{Fore.CYAN}正在使用压缩后的图片重试...{Style.RESET_ALL}")